@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from .threat_api import ThreatIntelAPI
+from .circuit_breaker import REQUEST_TIMEOUT
+from .ioc_store import LocalIOCStore
+from .otx_api import OTXAPI
+from utils.startup import Lazy
+
+STRATEGIES = ('any', 'quorum', 'weighted')
+
+# Provider factories that can be enabled through THREAT_INTEL_PROVIDERS
+PROVIDER_FACTORIES = {
+    'otx': OTXAPI,
+}
+
+
+def is_block_verdict(result):
+    """Return True if a provider result asks for blocking."""
+    return bool(result) and result.get('verdict') != 'Whitelisted'
+
+
+class ThreatIntelAggregator(ThreatIntelAPI):
+    """Query several ThreatIntelAPI providers concurrently and merge their verdicts.
+
+    Strategies:
+      - 'any': block as soon as one provider reports a block verdict
+      - 'quorum': block once at least ``quorum`` providers (at most all of them) report one
+      - 'weighted': block once the weights of the blocking providers reach ``threshold``
+
+    All providers share one ``deadline`` (seconds); providers that have not answered by
+    then are ignored. The result is returned as soon as it is decided, without waiting
+    for the remaining providers. A ``local`` IOC store is consulted in-process before
+    the fan-out; a match there blocks without contacting any provider.
+    """
+
+    def __init__(self, providers, strategy='any', deadline=REQUEST_TIMEOUT, quorum=2, weights=None,
+                 threshold=1.0, local=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown threat intel strategy: {strategy}")
+        self.providers = dict(providers)
+        self.strategy = strategy
+        self.deadline = deadline
+        self.quorum = quorum
+        self.weights = weights or {}
+        self.threshold = threshold
+        self.local = local
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+
+    def register(self, name, provider, weight=None):
+        """Add a provider to the fan-out."""
+        self.providers[name] = provider
+        if weight is not None:
+            self.weights[name] = weight
+
+    def check_domain(self, domain):
+        return self._fan_out('check_domain', domain)
+
+    def check_hash(self, file_hash):
+        return self._fan_out('check_hash', file_hash)
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                # Executor threads do not survive a fork, start a new pool in this process
+                self._executor = ThreadPoolExecutor(max_workers=max(4, 4 * len(self.providers)),
+                                                    thread_name_prefix="threat-intel")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _blocked(self, blocking):
+        """Return True if the providers in ``blocking`` are enough to block under the strategy."""
+        if self.strategy == 'any':
+            return bool(blocking)
+        if self.strategy == 'quorum':
+            return len(blocking) >= min(self.quorum, len(self.providers))
+        return sum(self.weights.get(name, 1.0) for name in blocking) >= self.threshold
+
+    def _fan_out(self, method, indicator):
+        if self.local is not None:
+            result = getattr(self.local, method)(indicator)
+            if is_block_verdict(result):
+                return self._merge({'local': result})
+        if not self.providers:
+            return None
+        if len(self.providers) == 1:
+            # Nothing to merge, skip the thread hop
+            name, provider = next(iter(self.providers.items()))
+            result = getattr(provider, method)(indicator)
+            return self._merge({name: result}) if self._blocked([name] if is_block_verdict(result) else []) else None
+
+        executor = self._get_executor()
+        pending = {executor.submit(getattr(provider, method), indicator): name
+                   for name, provider in self.providers.items()}
+        results = {}
+        end = time.monotonic() + self.deadline
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                logging.warning(f"Threat intel deadline exceeded, no answer from: {', '.join(pending.values())}")
+                break
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    logging.error(f"Threat intel provider '{name}' failed: {e}")
+                    results[name] = None
+            blocking = [name for name, result in results.items() if is_block_verdict(result)]
+            if self._blocked(blocking):
+                return self._merge(results)
+        return None
+
+    @staticmethod
+    def _merge(results):
+        """Combine the blocking provider results into one verdict."""
+        blocking = {name: result for name, result in results.items() if is_block_verdict(result)}
+        merged = dict(next(iter(blocking.values())))
+        merged['sources'] = sorted(blocking)
+        return merged
+
+
+def _build_default_aggregator():
+    names = [n.strip() for n in os.getenv('THREAT_INTEL_PROVIDERS', 'otx').split(',') if n.strip()]
+    weights = {}
+    for item in os.getenv('THREAT_INTEL_WEIGHTS', '').split(','):
+        if '=' in item:
+            name, weight = item.split('=', 1)
+            weights[name.strip()] = float(weight)
+    return ThreatIntelAggregator(
+        {name: PROVIDER_FACTORIES[name]() for name in names},
+        strategy=os.getenv('THREAT_INTEL_STRATEGY', 'any'),
+        deadline=float(os.getenv('THREAT_INTEL_DEADLINE', str(REQUEST_TIMEOUT))),
+        quorum=int(os.getenv('THREAT_INTEL_QUORUM', '2')),
+        weights=weights,
+        threshold=float(os.getenv('THREAT_INTEL_THRESHOLD', '1.0')),
+        local=LocalIOCStore(),
+    )
+
+
+_default = Lazy('threat_intel', _build_default_aggregator)
+
+
+def default_aggregator():
+    """Return the shared aggregator configured from the environment, created on first use.
+
+    THREAT_INTEL_PROVIDERS is a comma separated list of PROVIDER_FACTORIES names,
+    THREAT_INTEL_STRATEGY one of STRATEGIES, THREAT_INTEL_WEIGHTS a list of name=weight.
+    """
+    return _default.get()
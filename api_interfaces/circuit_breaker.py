@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+import time
+
+FAILURE_THRESHOLD = 5  # Consecutive failures that open a breaker
+RESET_TIMEOUT = 10  # Seconds a breaker stays open after the first trip
+MAX_RESET_TIMEOUT = 300  # Upper bound of the exponential backoff
+REQUEST_TIMEOUT = float(os.getenv("THREAT_INTEL_TIMEOUT", "5"))  # Seconds per upstream request
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider is skipped because its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker with exponential backoff.
+
+    After FAILURE_THRESHOLD consecutive failures the breaker opens and requests are
+    rejected without contacting the provider. Once the reset timeout has passed, a
+    single trial request is let through (half-open): success closes the breaker,
+    failure opens it again with a doubled timeout.
+    """
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT,
+                 max_reset_timeout=MAX_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0  # Consecutive times the breaker opened, drives the backoff
+        self.open_until = 0.0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a request may be sent, moving an expired open breaker to half-open."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() >= self.open_until:
+                self.state = HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """Raise CircuitOpenError if a request may not be sent."""
+        if not self.allow_request():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.trips = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                timeout = min(self.reset_timeout * 2 ** self.trips, self.max_reset_timeout)
+                self.trips += 1
+                self.state = OPEN
+                self.open_until = time.time() + timeout
+                logging.warning(f"Circuit breaker '{self.name}' opened for {timeout}s")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'trips': self.trips,
+                'open_until': self.open_until if self.state != CLOSED else None,
+                'rejected': self.rejected,
+            }
+
+
+breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Return the shared circuit breaker of a provider, creating it on first use."""
+    with _registry_lock:
+        if name not in breakers:
+            breakers[name] = CircuitBreaker(name)
+        return breakers[name]
+
+
+def breaker_stats():
+    """Return the state of every circuit breaker, for metrics."""
+    with _registry_lock:
+        return {name: breaker.stats() for name, breaker in breakers.items()}
+
+
+def is_upstream_failure(status_code):
+    """Return True for responses that indicate an unhealthy or rate limiting provider."""
+    return status_code == 429 or status_code >= 500
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from .threat_api import ThreatIntelAPI
+
+IOC_DB_PATH = os.getenv('IOC_DB_PATH', 'ioc.db')
+MAX_PULSES = 10  # Pulse names returned per match, like the OTX verdict records
+IMPORT_BATCH_SIZE = 5000
+
+# OTX indicator types mapped to the local IOC types
+OTX_TYPES = {
+    'domain': 'domain',
+    'hostname': 'domain',
+    'FileHash-MD5': 'hash',
+    'FileHash-SHA1': 'hash',
+    'FileHash-SHA256': 'hash',
+}
+HASH_RE = re.compile(r'^(?:[0-9a-f]{32}|[0-9a-f]{40}|[0-9a-f]{64})$')
+# STIX patterns such as [domain-name:value = 'evil.example'] or [file:hashes.'SHA-256' = '...']
+STIX_TERM_RE = re.compile(r"(domain-name:value|file:hashes\.[^\s=]+)\s*=\s*'([^']+)'")
+
+
+def normalize(ioc_type, value):
+    """Normalize an indicator value, or return None if it is not usable."""
+    value = value.strip().lower()
+    if ioc_type == 'domain':
+        value = value.rstrip('.')
+        return value if value and ' ' not in value and '/' not in value else None
+    return value if HASH_RE.match(value) else None
+
+
+def parse_plain(text, source):
+    """Yield (type, value, pulse) for a plain list of domains and hashes, one per line."""
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        ioc_type = 'hash' if HASH_RE.match(line.lower()) else 'domain'
+        yield ioc_type, line, source
+
+
+def parse_otx(data, source):
+    """Yield (type, value, pulse) for an OTX pulse export: one pulse, a list, or a results page."""
+    pulses = data.get('results', [data]) if isinstance(data, dict) else data
+    for pulse in pulses:
+        name = pulse.get('name') or source
+        for indicator in pulse.get('indicators', []):
+            ioc_type = OTX_TYPES.get(indicator.get('type'))
+            if ioc_type and indicator.get('indicator'):
+                yield ioc_type, indicator['indicator'], name
+
+
+def parse_stix(data, source):
+    """Yield (type, value, pulse) for the indicators of a STIX 2 bundle."""
+    for obj in data.get('objects', []):
+        if obj.get('type') != 'indicator':
+            continue
+        for field, value in STIX_TERM_RE.findall(obj.get('pattern', '')):
+            yield ('domain' if field == 'domain-name:value' else 'hash'), value, obj.get('name') or source
+
+
+def parse_feed(text, source):
+    """Detect the format of an exported feed and yield its (type, value, pulse) entries."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return parse_plain(text, source)
+    if isinstance(data, dict) and data.get('type') == 'bundle':
+        return parse_stix(data, source)
+    return parse_otx(data, source)
+
+
+class LocalIOCStore(ThreatIntelAPI):
+    """Indexed SQLite store of indicators imported from exported threat feeds.
+
+    Lookups need no network; a domain also matches IOCs listed for any of its parent domains.
+    """
+
+    def __init__(self, db_path=IOC_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS iocs (
+                    type TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    pulse TEXT NOT NULL,
+                    added INTEGER NOT NULL,
+                    PRIMARY KEY (type, value, pulse)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS ioc_imports (
+                    sha256 TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    added INTEGER NOT NULL,
+                    imported_at INTEGER NOT NULL
+                );
+            ''')
+
+    def _conn(self):
+        # One read connection per thread (and per process, connections do not survive a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def import_file(self, path, force=False):
+        """Import a feed file, returning the number of new IOC entries.
+
+        Files that were imported before (same content) are skipped unless ``force`` is set;
+        entries that already exist are ignored, so re-imports only add what is new.
+        """
+        with open(path, 'rb') as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+        with sqlite3.connect(self.db_path) as conn:
+            if not force and conn.execute("SELECT 1 FROM ioc_imports WHERE sha256 = ?", (digest,)).fetchone():
+                logging.info(f"IOC feed {path} was already imported, skipping")
+                return 0
+            source = os.path.basename(path)
+            added = self._insert(conn, parse_feed(raw.decode('utf-8', 'replace'), source))
+            conn.execute("INSERT OR REPLACE INTO ioc_imports (sha256, path, added, imported_at) VALUES (?, ?, ?, ?)",
+                         (digest, path, added, int(time.time())))
+        logging.info(f"Imported {added} new IOCs from {path}")
+        return added
+
+    def _insert(self, conn, entries):
+        now = int(time.time())
+        before = conn.total_changes
+        batch = []
+        for ioc_type, value, pulse in entries:
+            value = normalize(ioc_type, value)
+            if value:
+                batch.append((ioc_type, value, pulse, now))
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                conn.executemany("INSERT OR IGNORE INTO iocs (type, value, pulse, added) VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        conn.executemany("INSERT OR IGNORE INTO iocs (type, value, pulse, added) VALUES (?, ?, ?, ?)", batch)
+        return conn.total_changes - before
+
+    def _match(self, ioc_type, values):
+        placeholders = ','.join('?' * len(values))
+        try:
+            rows = self._conn().execute(
+                f"SELECT pulse FROM iocs WHERE type = ? AND value IN ({placeholders})",
+                (ioc_type, *values)).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"IOC store lookup failed: {e}")
+            return None
+        if not rows:
+            return None
+        pulses = sorted({pulse for (pulse,) in rows})
+        return {
+            'verdict': 'Malicious',
+            'pulse_count': len(pulses),
+            'pulses': pulses[:MAX_PULSES],
+        }
+
+    def check_domain(self, domain):
+        labels = (normalize('domain', domain) or '').split('.')
+        # The domain itself and its parents, without the bare TLD
+        candidates = ['.'.join(labels[i:]) for i in range(max(len(labels) - 1, 1))]
+        return self._match('domain', candidates) if candidates[0] else None
+
+    def check_hash(self, file_hash):
+        value = normalize('hash', file_hash)
+        return self._match('hash', [value]) if value else None
+
+    def stats(self):
+        with sqlite3.connect(self.db_path) as conn:
+            counts = dict(conn.execute("SELECT type, COUNT(DISTINCT value) FROM iocs GROUP BY type").fetchall())
+            imports = conn.execute("SELECT COUNT(*) FROM ioc_imports").fetchone()[0]
+        return {'domains': counts.get('domain', 0), 'hashes': counts.get('hash', 0), 'imports': imports}
@@ -3,6 +3,8 @@ import logging
 import cache
 import os
 from .threat_api import ThreatIntelAPI
+from .circuit_breaker import CircuitOpenError, REQUEST_TIMEOUT, get_breaker, is_upstream_failure
+from .verdict_record import pack_verdict, unpack_verdict
 import json
 
 class OTXAPI(ThreatIntelAPI):
@@ -10,88 +12,128 @@ class OTXAPI(ThreatIntelAPI):
         self.api_key = os.getenv('OTX_API_KEY')
         self.url_domain = 'https://otx.alienvault.com/api/v1/indicators/domain/{}/general'
         self.url_hash = 'https://otx.alienvault.com/api/v1/indicators/file/{}/analysis'
+        # Logging the full IOC details of every fresh lookup is opt-in
+        self.log_details = os.getenv('OTX_LOG_DETAILS', '').lower() in ('1', 'true', 'yes')
+        self.breaker = get_breaker('otx')
 
-    def check_domain(self, domain):
-        myurl = self.url_domain.format(domain)
-        response = cache.get_cache(myurl)
-        if not response:
-            headers = {'X-OTX-API-KEY': self.api_key}
-            res = requests.get(myurl, headers=headers)
-            if res.status_code != 200:
-                logging.error(f"OTX API failed: {res.status_code}")
-                return None
-            response = res.json()
-            cache.set_cache(myurl, response)
-            logging.debug("OTX domain response cached")
-        logging.info(f"response data json transform")
-        data = response
+    def _fetch(self, url):
+        """Fetch a raw OTX response, or None if the request failed.
 
-        # Check if pulse_info count is 0
-        pulse_info = data.get('pulse_info', {})
-        pulse_count = pulse_info.get('count', 0)
-        logging.info(f"Do pulse count")
+        Failures are negatively cached for a short time, and the request is skipped
+        entirely while the OTX circuit breaker is open.
+        """
+        if cache.is_negative(url):
+            return None
+        try:
+            self.breaker.check()
+        except CircuitOpenError as e:
+            logging.warning(f"Skipping OTX lookup: {e}")
+            return None
+        headers = {'X-OTX-API-KEY': self.api_key}
+        try:
+            res = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            logging.error(f"OTX API request failed: {e}")
+            self.breaker.record_failure()
+            cache.set_negative(url)
+            return None
+        if is_upstream_failure(res.status_code):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if res.status_code != 200:
+            logging.error(f"OTX API failed: {res.status_code}")
+            cache.set_negative(url)
+            return None
+        try:
+            return res.json()
+        except ValueError:
+            logging.error(f"OTX API returned invalid JSON for {url}")
+            cache.set_negative(url)
+            return None
 
-        if pulse_count == 0:
-            logging.info(f"Domain {domain} has pulse count 0, not blocking.")
-            return None  # No pulses, so don't block
+    def _loader(self, url, distill):
+        """Return a function fetching url and distilling it into a verdict record."""
+        def load():
+            data = self._fetch(url)
+            return distill(data) if data is not None else None
+        return load
 
-        # Extract the validation list that contains information about whitelist
-        validations = data.get('validation', [])
+    def _lookup(self, url, distill):
+        """Return the distilled verdict for url, from the cache or from a fresh OTX request.
 
-        # Check if any of the validation sources are "whitelist"
-        for validation in validations:
-            if validation.get('source') == 'whitelist':
-                logging.info(f"Domain {domain} is whitelisted. Not blocking.")
-                return None  # Domain is whitelisted, so we don't block it
+        Stale cache entries are served while they are refreshed in the background.
+        """
+        load = self._loader(url, distill)
+        record = cache.get_or_load(url, load)
+        if record is None:
+            return None
+        verdict = unpack_verdict(record)
+        if verdict is None:
+            # Not a current verdict record (e.g. the raw payload of an older version)
+            record = load()
+            if record is None:
+                return None
+            cache.set_cache(url, record)
+            verdict = unpack_verdict(record)
+        return verdict
 
-    # If it's not whitelisted, check for other IOC information (verdict)
+    def _distill_domain(self, data):
+        """Reduce an OTX domain response to a verdict record."""
+        pulse_info = data.get('pulse_info', {})
+        whitelisted = any(v.get('source') == 'whitelist' for v in data.get('validation', []))
         facts = data.get('facts', {})
-        verdict = facts.get('verdict', 'Unknown')
+        if self.log_details:
+            for label, field in (('IP Addresses', 'current_ip_addresses'), ('Current ASNs', 'current_asns'),
+                                 ('Current Nameservers', 'current_nameservers'),
+                                 ('SSL Certificates', 'ssl_certificates')):
+                logging.info(f"OTX {label} for {data.get('indicator')}: {json.dumps(facts.get(field, []), indent=4)}")
+        return pack_verdict(facts.get('verdict', 'Unknown'), pulse_info.get('count', 0), whitelisted,
+                            [pulse.get('name', '') for pulse in pulse_info.get('pulses', [])])
 
-    # Extract other relevant details from 'facts'
-        ip_addresses = facts.get('current_ip_addresses', [])
-        current_asns = facts.get('current_asns', [])
-        current_nameservers = facts.get('current_nameservers', [])
-        ssl_certificates = facts.get('ssl_certificates', [])
+    def _distill_hash(self, data):
+        """Reduce an OTX file response to a verdict record."""
+        pulse_info = data.get('pulse_info') or {}
+        if self.log_details:
+            logging.info(f"OTX pulses for {data.get('indicator')}: {json.dumps(pulse_info.get('pulses', []), indent=4)}")
+        return pack_verdict('Malicious', pulse_info.get('count', 0), False,
+                            [pulse.get('name', '') for pulse in pulse_info.get('pulses', [])])
+
+    def check_domain(self, domain):
+        verdict = self._lookup(self.url_domain.format(domain), self._distill_domain)
+        if verdict is None:
+            return None
+
+        if verdict['pulse_count'] == 0:
+            logging.info(f"Domain {domain} has pulse count 0, not blocking.")
+            return None  # No pulses, so don't block
 
-    # Logging the extracted information in a readable format
-        logging.info(f"OTX Verdict for {domain}: {verdict}")
-        logging.info(f"OTX IP Addresses for {domain}: {json.dumps(ip_addresses, indent=4)}")
-        logging.info(f"OTX Current ASNs for {domain}: {json.dumps(current_asns, indent=4)}")
-        logging.info(f"OTX Current Nameservers for {domain}: {json.dumps(current_nameservers, indent=4)}")
-        logging.info(f"OTX SSL Certificates for {domain}: {json.dumps(ssl_certificates, indent=4)}")
+        if verdict['whitelisted']:
+            logging.info(f"Domain {domain} is whitelisted. Not blocking.")
+            return None  # Domain is whitelisted, so we don't block it
 
-    # Return the IOC info (but only if it's not whitelisted)
+        logging.info(f"OTX Verdict for {domain}: {verdict['verdict']} ({verdict['pulse_count']} pulses)")
+        # Return the IOC info (but only if it's not whitelisted)
         return {
-            'verdict': verdict,
-            'ip_addresses': ip_addresses,
-            'current_asns': current_asns,
-            'current_nameservers': current_nameservers,
-            'ssl_certificates': ssl_certificates
+            'verdict': verdict['verdict'],
+            'pulse_count': verdict['pulse_count'],
+            'pulses': verdict['details'],
         }
 
-    def check_hash(self, file_hash):
-        myurl = self.url_hash.format(file_hash)
-        response = cache.get_cache(myurl)
-        if not response:
-            headers = {'X-OTX-API-KEY': self.api_key}
-            res = requests.get(myurl, headers=headers)
-            if res.status_code != 200:
-                return None
-            response = res.json()
-            cache.set_cache(myurl, response)
-        try:
-            data = response
-            # Ensure 'pulse_info' exists in the response
-            pulse_info = data.get("pulse_info", {})
-            if not pulse_info or pulse_info.get("count", 0) == 0:
-                logging.info(f"Hash {file_hash} is not found in OTX (no pulses).")
-                return None  # No threats found
-            return {
-                "verdict": "Malicious",
-                "pulses": pulse_info.get("pulses", [])
-            }
+    def warm_domain(self, domain, ahead=0):
+        """Pre-load the cached verdict of a domain, see cache.warm()."""
+        url = self.url_domain.format(domain)
+        return cache.warm(url, self._loader(url, self._distill_domain), ahead)
 
-        except json.JSONDecodeError:
-            logging.error(f"OTX API returned invalid JSON for hash {file_hash}")
+    def check_hash(self, file_hash):
+        verdict = self._lookup(self.url_hash.format(file_hash), self._distill_hash)
+        if verdict is None:
             return None
+        if verdict['pulse_count'] == 0:
+            logging.info(f"Hash {file_hash} is not found in OTX (no pulses).")
+            return None  # No threats found
+        return {
+            "verdict": verdict['verdict'],
+            "pulse_count": verdict['pulse_count'],
+            "pulses": verdict['details'],
+        }
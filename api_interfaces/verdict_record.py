@@ -0,0 +1,62 @@
+import struct
+
+# Compact binary record of a threat-intel verdict, as stored in the cache:
+#   magic (2s) | version (B) | flags (B) | pulse count (I) | verdict (B length + utf-8)
+#   | detail count (B) | details (H length + utf-8 each)
+MAGIC = b'TV'
+VERSION = 1
+FLAG_WHITELISTED = 0x01
+MAX_DETAILS = 10  # Pulse names kept as minimal details
+MAX_TEXT_LENGTH = 255
+MAX_PULSE_COUNT = 0xFFFFFFFF  # Largest count the header field holds
+
+_HEADER = struct.Struct('>2sBBI')
+
+
+def _text(value, limit=MAX_TEXT_LENGTH):
+    return str(value).encode('utf-8')[:limit]
+
+
+def pack_verdict(verdict, pulse_count=0, whitelisted=False, details=()):
+    """Serialize a distilled verdict into a compact, versioned binary record.
+
+    The pulse count is clamped to the range of its field (0 to MAX_PULSE_COUNT).
+    """
+    pulse_count = max(0, min(int(pulse_count or 0), MAX_PULSE_COUNT))
+    flags = FLAG_WHITELISTED if whitelisted else 0
+    parts = [_HEADER.pack(MAGIC, VERSION, flags, pulse_count)]
+    encoded = _text(verdict)
+    parts.append(struct.pack('>B', len(encoded)) + encoded)
+    details = list(details)[:MAX_DETAILS]
+    parts.append(struct.pack('>B', len(details)))
+    for detail in details:
+        encoded = _text(detail, 0xFFFF)
+        parts.append(struct.pack('>H', len(encoded)) + encoded)
+    return b''.join(parts)
+
+
+def unpack_verdict(record):
+    """Deserialize a verdict record. Returns None for anything that is not a current record."""
+    if not isinstance(record, bytes) or len(record) < _HEADER.size + 2:
+        return None
+    try:
+        magic, version, flags, pulse_count = _HEADER.unpack_from(record)
+        if magic != MAGIC or version != VERSION:
+            return None
+        offset = _HEADER.size
+        length = record[offset]
+        verdict = record[offset + 1:offset + 1 + length].decode('utf-8', 'replace')
+        offset += 1 + length
+        details = []
+        for _ in range(record[offset]):
+            (length,) = struct.unpack_from('>H', record, offset + 1)
+            details.append(record[offset + 3:offset + 3 + length].decode('utf-8', 'replace'))
+            offset += 2 + length
+        return {
+            'verdict': verdict,
+            'pulse_count': pulse_count,
+            'whitelisted': bool(flags & FLAG_WHITELISTED),
+            'details': details,
+        }
+    except (struct.error, IndexError):
+        return None
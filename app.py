@@ -1,28 +1,41 @@
+import time
+_import_started = time.perf_counter()
 import logging
 import sqlite3
-from flask import Flask, request, jsonify, g
-import tldextract
+from flask import Flask, request, jsonify, g, Response
 import re
 from urllib.parse import urlparse
 import json  # Ensure you import json at the top of your script
+import base64
+import binascii
+import gzip
+import io
 import os
-import time
-from log_db import LogDB
+from log_db import LogDB, LOG_COLUMNS, ROLLUP_DIMENSIONS
 from flask_cors import CORS  # Import CORS
 import jwt
 from jwt.exceptions import PyJWTError
 from os import environ as env
 from dotenv import load_dotenv, find_dotenv
 from authlib.integrations.flask_oauth2 import ResourceProtector
+from authlib.oauth2 import OAuth2Error
 from validator import Auth0JWTBearerTokenValidator
 from functools import wraps
-import base64
 import cache  # Import your cache module
+from cache_warmer import start_warmer
+from api_interfaces.circuit_breaker import breaker_stats
+from api_interfaces import verdict_record
 from filter_checks.block_check import get_block_status
 from filter_checks.hash_check import check_file_hash_in_db
 from filter_checks.mime_check import check_mime_type_in_db
-from filter_checks.db_utils import query_database
+from filter_checks.db_utils import POLICY_CHANGE_MAX_ROWS, bump_policy_generation, get_policy_generation, query_database
+from filter_checks.policy_changes import LONG_POLL_MAX, changes_since, wait_for_change
+from filter_checks.policy_import import IMPORT_TABLES, PARSERS, format_defaults, import_policy
+from filter_checks.policy_snapshot import (POLICY_SNAPSHOT_PATH, POLICY_SOURCE_URL, current_policy, current_snapshot,
+                                           policy_follower, refresh_policy)
 from filter_checks.redirects import get_redirect_proxy, is_tls_excluded
+from utils.stream_utils import ENCODERS, buffered, csv_lines, gzip_chunks, iter_json, ndjson_lines, negotiate_encoding
+from utils import startup
 # Load environment variables from the .env file
 load_dotenv()
 require_auth = ResourceProtector()
@@ -37,35 +50,53 @@ CORS(app, origins=["http://localhost:3000"])
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 DB_PATH = "url_filter.db"  # Path to SQLite database
-log_db = LogDB()  # Create an instance of the LogDB class for logging
+# Create an instance of the LogDB class for logging, partitioned by day
+log_db = LogDB(
+    retention_days=int(os.getenv("LOG_RETENTION_DAYS", "30")),
+    dedupe_window=float(os.getenv("LOG_DEDUPE_WINDOW", "0")),  # Fold repeated allow verdicts within N seconds
+    allow_sample_rate=float(os.getenv("LOG_ALLOW_SAMPLE_RATE", "1.0")),  # Fraction of new allow rows kept
+)
+
+
+def load_jwks():
+    """Load the signing keys without starting the refresher; fails if no keys are available."""
+    if validator.jwks_provider.load(start=False) is None:
+        raise RuntimeError("No JWKS keys available")
+
 
-def require_roles(roles):
-    """ A decorator to check if the user has the required roles in the token """
+# Pre-load verdicts of the most requested hostnames at startup and every CACHE_WARM_INTERVAL seconds
+startup.register_background(lambda: start_warmer(log_db))
+# Heavy resources are created lazily; warm them up in the background, /ready reports when done
+startup.register('jwks', load_jwks)
+startup.register_background(validator.jwks_provider.start)
+startup.register('policy_snapshot', current_policy)
+if POLICY_SOURCE_URL:
+    # Follower node: apply the policy server's change feed as it comes
+    startup.register_background(lambda: policy_follower().start())
+# Show the binary verdict records of threat-intel lookups readably in the /cache admin view
+cache.register_binary_decoder(verdict_record.MAGIC, verdict_record.unpack_verdict)
+startup.record('app_import', time.perf_counter() - _import_started)
+startup.start_warm_up()
+
+ROLES_CLAIM = "https://yourdomain.com/claims/roles"
+
+def require_token(scopes, roles):
+    """ A decorator verifying the bearer token once and checking its scopes and roles.
+
+    The validator caches verified claims per token until they expire, so repeated
+    requests with the same token are not verified again.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            token = request.headers.get("Authorization", "").split("Bearer ")[-1]
-            if not token:
-                return jsonify({"status": "error", "message": "Token missing"}), 401
-            # Split the token by the dots
-            token_parts = token.split('.')
-            # Check if the token is well-formed and has three parts
-            if len(token_parts) >= 3:
-                payload = token_parts[1]  # The second part (index 1) is the payload
-                # Decode the Base64 payload
-                decoded_payload = base64.urlsafe_b64decode(payload + "==")  # Adding '==' to pad the Base64 string if necessary
-                decoded_payload = decoded_payload.decode('utf-8')  # Decode bytes to string
-                # Parse the decoded payload into a dictionary
-                payload_data = json.loads(decoded_payload)
-                # Get the roles from the payload (make sure the key exists)
-                user_roles = payload_data.get("https://yourdomain.com/claims/roles", [])
-                g.sub = payload_data.get("sub", [])
-                print(f"User {g.sub} Roles: {user_roles}")
-                # Check if the required role(s) exist in the token's roles
-                if not set(roles).issubset(set(user_roles)):
-                    return jsonify({"status": "error", "message": "Insufficient permissions"}), 403
-            else:
-                return jsonify({"status": "error", "message": "Invalid token format"}), 400
+            try:
+                token = require_auth.acquire_token(scopes)
+            except OAuth2Error as error:
+                require_auth.raise_error_response(error)
+            g.sub = token.get("sub")
+            # Check if the required role(s) exist in the token's roles
+            if not set(roles).issubset(set(token.get(ROLES_CLAIM, []))):
+                return jsonify({"status": "error", "message": "Insufficient permissions"}), 403
             return func(*args, **kwargs)
         return wrapper
     return decorator
@@ -76,8 +107,7 @@ def normalize_url(url):
     return f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
 
 @app.route('/checkHash', methods=['POST'])
-@require_auth(["user"])
-@require_roles(["user"])
+@require_token(["user"], ["user"])
 def check_file_and_url():
     """Check both file hash and URL for block status (local database + OTX)."""
 
@@ -99,8 +129,7 @@ def check_file_and_url():
     return response
 
 @app.route('/checkUrl', methods=['POST'])
-@require_auth(["user"])
-@require_roles(["user"])
+@require_token(["user"], ["user"])
 def check_url():
     data = request.get_json()
     logging.info(f"Received data: {data}")
@@ -138,8 +167,7 @@ def process_url_check(url):
     return jsonify({'status': 'allowed', 'message': 'Access granted'}), 200
 
 @app.route('/checkMimeType', methods=['POST'])
-@require_auth(["user"])
-@require_roles(["user"])
+@require_token(["user"], ["user"])
 def check_mime_type():
     data = request.get_json()
     if "mime_type" not in data or "url" not in data:
@@ -152,57 +180,221 @@ def check_mime_type():
     response = jsonify({'status': 'allowed', 'message': 'MIME type allowed'}), 200
     return response
 
+PAGE_SIZE = 100  # Default number of entries per page of the paginated admin endpoints
+MAX_PAGE_SIZE = 1000
+LOG_TIMESTAMP_RE = re.compile(r'^\d{4}-\d{2}-\d{2}( \d{2}:\d{2}(:\d{2})?)?$')
+END_OF_DAY = ' 23:59:59'
+
+def stream_jsonify(payload, status=200):
+    """
+    Like jsonify for large list responses: the JSON is encoded incrementally and streamed,
+    compressed with the best encoding the client accepts (br if available, else gzip).
+    """
+    chunks = buffered(iter_json(payload))
+    headers = {'Vary': 'Accept-Encoding'}
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding:
+        chunks = ENCODERS[encoding](chunks)
+        headers['Content-Encoding'] = encoding
+    return Response(chunks, status=status, mimetype='application/json', headers=headers)
+
+def end_of_period(until):
+    """Extend a date-only or minute-precision ``until`` to the last second of that day or minute,
+    so comparing 'YYYY-MM-DD HH:MM:SS' timestamps with it includes the whole period."""
+    return until + END_OF_DAY[len(until) - 10:]
+
+def parse_log_filters(args):
+    """Parse and validate the log filter query parameters. Raises ValueError on bad input."""
+    filters = {}
+    for key in ('user', 'category', 'level'):
+        if args.get(key):
+            filters[key] = args[key]
+    if args.get('status_code'):
+        filters['status_code'] = int(args['status_code'])
+    # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS', accept ISO 'T' separators too
+    for key in ('since', 'until'):
+        if args.get(key):
+            value = args[key].replace('T', ' ')
+            if not LOG_TIMESTAMP_RE.match(value):
+                raise ValueError(f"Invalid timestamp: {value}")
+            filters[key] = end_of_period(value) if key == 'until' else value
+    return filters
+
 @app.route('/logs', methods=['GET'])
-@require_auth(["admin"])
-@require_roles(["admin"])
+@require_token(["admin"], ["admin"])
 def get_logs():
+    """Return one page of logs, optionally filtered by user, category, status_code, level and time range."""
+    try:
+        limit = min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        if cursor:
+            LogDB.parse_cursor(cursor)
+        filters = parse_log_filters(request.args)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid limit, cursor or filter value'}), 400
+    if limit < 1:
+        return jsonify({'status': 'error', 'message': 'Limit must be positive'}), 400
     try:
-        # Get all logs from the database using LogDB class
-        logs = log_db.get_all_logs()  # Make sure to implement this method in your log_db.py
-        if not logs:
-            return jsonify({'status': 'error', 'message': 'No logs found'}), 404
+        logs = log_db.get_logs(limit=limit, cursor=cursor, **filters)
+        if logs['status'] != 'success':
+            return jsonify({'status': 'error', 'message': 'Failed to fetch logs'}), 500
         # Return the logs in a JSON format
-        return jsonify({'status': 'success', 'logs': logs}), 200
+        return stream_jsonify({'status': 'success', 'logs': logs})
     except Exception as e:
         logging.error(f"Error fetching logs: {str(e)}")
         return jsonify({'status': 'error', 'message': 'Failed to fetch logs'}), 500
 
+@app.route('/logs/export', methods=['GET'])
+@require_token(["admin"], ["admin"])
+def export_logs():
+    """Stream all logs matching the filters as NDJSON or CSV, optionally gzip compressed."""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'status': 'error', 'message': f'Invalid export format: {export_format}'}), 400
+    try:
+        filters = parse_log_filters(request.args)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid filter value'}), 400
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    if export_format == 'csv':
+        lines = csv_lines(log_db.iter_logs(decode=False, **filters), LOG_COLUMNS)
+        mimetype = 'text/csv'
+    else:
+        lines = ndjson_lines(log_db.iter_logs(**filters))
+        mimetype = 'application/x-ndjson'
+    chunks = buffered(lines)
+    filename = f"logs.{export_format}"
+    if compress:
+        chunks = gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/stats', methods=['GET'])
+@require_token(["admin"], ["admin"])
+def get_stats():
+    """Return traffic counts and latency aggregates per minute or hour bucket from the log rollups."""
+    granularity = request.args.get('granularity', 'hour')
+    group_by = [d for d in request.args.get('group_by', ','.join(ROLLUP_DIMENSIONS)).split(',') if d]
+    since, until = request.args.get('since'), request.args.get('until')
+    for value in (since, until):
+        if value and not LOG_TIMESTAMP_RE.match(value.replace('T', ' ')):
+            return jsonify({'status': 'error', 'message': f'Invalid timestamp: {value}'}), 400
+    try:
+        stats = log_db.get_stats(granularity=granularity,
+                                 since=since.replace('T', ' ') if since else None,
+                                 until=end_of_period(until.replace('T', ' ')) if until else None,
+                                 group_by=group_by)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if stats['status'] != 'success':
+        return jsonify({'status': 'error', 'message': 'Failed to fetch stats'}), 500
+    return stream_jsonify(stats)
+
 @app.route('/cache', methods=['GET'])
-@require_auth(["admin"])
-@require_roles(["admin"])
+@require_token(["admin"], ["admin"])
 def get_cache():
+    """Return one page of cache entries, optionally restricted to keys containing `search`."""
+    try:
+        limit = min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid limit'}), 400
+    if limit < 1:
+        return jsonify({'status': 'error', 'message': 'Limit must be positive'}), 400
     try:
-        # Assumes your cache module has a get_all_cache() function
-        cached_items = cache.get_all_cache()
-        if not cached_items:
-            return jsonify({'status': 'error', 'message': 'No cache found'}), 404
-        return jsonify({'status': 'success', 'cache': cached_items}), 200
+        cached_items = cache.get_cache_page(limit=limit, cursor=request.args.get('cursor'),
+                                            search=request.args.get('search'))
+        if cached_items['status'] != 'success':
+            return jsonify({'status': 'error', 'message': 'Failed to fetch cache'}), 500
+        return stream_jsonify({'status': 'success', 'cache': cached_items})
     except Exception as e:
         logging.error(f"Error fetching cache: {str(e)}")
         return jsonify({'status': 'error', 'message': 'Failed to fetch cache'}), 500
 
+@app.route('/metrics', methods=['GET'])
+@require_token(["admin"], ["admin"])
+def get_metrics():
+    """Return runtime counters: cache tier hits/misses and threat-intel circuit breaker states."""
+    return jsonify({'status': 'success', 'cache': cache.get_cache_stats(),
+                    'circuit_breakers': breaker_stats()}), 200
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 200 once the startup warm-up is done, with the time each component took."""
+    report = startup.report()
+    if not report['ready']:
+        return jsonify({'status': 'starting', 'startup': report['timings'], 'failed': report['failed']}), 503
+    return jsonify({'status': 'ready', 'startup': report['timings']}), 200
+
+
+def encode_policy_cursor(sort_value, rowid):
+    return base64.urlsafe_b64encode(json.dumps([sort_value, rowid]).encode()).decode()
 
-def fetch_data_from_table(table_name, columns):
-    """General function to fetch data from any table."""
+
+def decode_policy_cursor(cursor):
+    """Decode a policy page cursor into (sort value, rowid). Raises ValueError if malformed."""
+    try:
+        sort_value, rowid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, binascii.Error, UnicodeError):
+        raise ValueError(f"Invalid policy cursor: {cursor}")
+    if not isinstance(rowid, int):
+        raise ValueError(f"Invalid policy cursor: {cursor}")
+    return sort_value, rowid
+
+
+def fetch_data_from_table(table_name, columns, key_column, limit=PAGE_SIZE, cursor=None, search=None,
+                          match='contains', search_column=None, sort=None, descending=False):
+    """General function to fetch one page of rows from any table.
+
+    Pagination is keyset based on the sort column and the rowid: pass the ``next_cursor`` of the
+    previous page as ``cursor`` to continue. ``search`` matches ``search_column`` (default: the key
+    column) either as a prefix (case-sensitive, served by the column index) or as a
+    case-insensitive substring.
+    """
+    sort = sort or key_column
+    search_column = search_column or key_column
+    # The key columns are indexed and NOT NULL; other columns may hold NULLs, which sort as ''
+    sort_expr = sort if sort == key_column else f"ifnull({sort}, '')"
+    conditions, params = [], []
+    if search and match == 'prefix':
+        conditions.append(f"{search_column} >= ? AND {search_column} < ?")
+        params += [search, search + '\U0010ffff']
+    elif search:
+        conditions.append(f"instr(lower({search_column}), lower(?)) > 0")
+        params.append(search)
+    if cursor:
+        conditions.append(f"({sort_expr}, rowid) {'<' if descending else '>'} (?, ?)")
+        params += list(decode_policy_cursor(cursor))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    direction = 'DESC' if descending else 'ASC'
     try:
         # Connect to the database
         with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            query = f"SELECT {', '.join(columns)} FROM {table_name}"
-            cursor.execute(query)
-            data = cursor.fetchall()
-        if not data:
+            cursor_obj = conn.cursor()
+            # Fetch one extra row to know whether another page exists
+            query = (f"SELECT {', '.join(columns)}, {sort_expr}, rowid FROM {table_name} {where} "
+                     f"ORDER BY {sort_expr} {direction}, rowid {direction} LIMIT ?")
+            cursor_obj.execute(query, (*params, limit + 1))
+            rows = cursor_obj.fetchall()
+        if not rows and not cursor and not search:
             return {'status': 'error', 'message': f'No data found in {table_name}'}, 404
-        return {'status': 'success', 'data': data}, 200
+        next_cursor = encode_policy_cursor(*rows[limit - 1][-2:]) if len(rows) > limit else None
+        return {'status': 'success', 'data': [row[:-2] for row in rows[:limit]], 'next_cursor': next_cursor}, 200
     except sqlite3.Error as e:
         logging.error(f"Database error: {e}")
         return {'status': 'error', 'message': 'Failed to fetch data from the database'}, 500
 
 @app.route('/get_policy', methods=['GET'])
-@require_auth(["admin"])
-@require_roles(["user"])
+@require_token(["admin"], ["user"])
 def get_policy():
-    """Fetch the current blocklist data based on the table specified in the query parameters."""
+    """
+    Fetch one page of a policy table, specified in the query parameters.
+    Supports limit/cursor (keyset pagination), search with match=prefix|contains and
+    search_in=<column>, and sort=<column> with order=asc|desc. The ETag is the policy
+    generation: unchanged tables answer 304 Not Modified to If-None-Match.
+    """
     # Get the table name from the query parameters
     table_name = request.args.get('table', None)
     if not table_name:
@@ -216,19 +408,91 @@ def get_policy():
         'tls_excluded_hosts': ['hostname'],
         'category_policy': ['category_id','name','action'],
     }
+    # The unique (indexed) column of each table, used for default sorting and searching
+    key_columns = {
+        'blocked_urls': 'value',
+        'blocked_files': 'file_hash',
+        'blocked_mimetypes': 'value',
+        'redirect_urls': 'value',
+        'tls_excluded_hosts': 'hostname',
+        'category_policy': 'category_id',
+    }
 
     # Validate the requested table name
     if table_name not in table_columns:
         return jsonify({'status': 'error', 'message': f'Invalid table name: {table_name}'}), 400
+    columns = table_columns[table_name]
+    sort = request.args.get('sort') or None
+    search_column = request.args.get('search_in') or None
+    match = request.args.get('match', 'contains')
+    order = request.args.get('order', 'asc')
+    try:
+        limit = min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_policy_cursor(cursor)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'Invalid limit or cursor'}), 400
+    if limit < 1 or match not in ('prefix', 'contains') or order not in ('asc', 'desc') \
+            or sort not in (None, *columns) or search_column not in (None, *columns):
+        return jsonify({'status': 'error', 'message': 'Invalid limit, match, order, sort or search_in value'}), 400
+
+    # Every policy write bumps the generation, so it identifies the content of all tables
+    etag = f"policy-{get_policy_generation()}"
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
 
     # Fetch the data from the specified table
-    columns = table_columns[table_name]
-    response, status_code = fetch_data_from_table(table_name, columns)
-    return jsonify(response), status_code
+    response, status_code = fetch_data_from_table(
+        table_name, columns, key_columns[table_name], limit=limit, cursor=cursor,
+        search=request.args.get('search') or None, match=match, search_column=search_column,
+        sort=sort, descending=order == 'desc')
+    result = stream_jsonify(response, status_code)
+    if status_code == 200:
+        result.set_etag(etag)
+        result.headers['Cache-Control'] = 'private, no-cache'
+    return result
+
+@app.route('/policy/snapshot', methods=['GET'])
+@require_token(["admin"], ["user"])
+def export_policy_snapshot():
+    """
+    Download the compiled binary policy snapshot, for proxy nodes that memory-map it locally.
+    A node passes the generation it has as `since` (or the ETag as If-None-Match) and gets
+    304 Not Modified while the policy is unchanged.
+    """
+    snapshot = current_snapshot()
+    etag = f'"policy-{snapshot.generation}"'
+    headers = {'ETag': etag, 'X-Policy-Generation': str(snapshot.generation)}
+    if request.headers.get('If-None-Match') == etag or request.args.get('since') == str(snapshot.generation):
+        return Response(status=304, headers=headers)
+    headers['Content-Length'] = str(snapshot.size)
+    headers['Content-Disposition'] = f'attachment; filename={os.path.basename(POLICY_SNAPSHOT_PATH)}'
+    return Response(snapshot.chunks(), mimetype='application/octet-stream', headers=headers)
+
+@app.route('/policy/changes', methods=['GET'])
+@require_token(["admin"], ["user"])
+def get_policy_changes():
+    """
+    Return the policy changes after generation `since`, for nodes applying them incrementally.
+    With `wait` (seconds) the request blocks until there is a change (long-poll).
+    `resync: true` means the changes are not available anymore: reload /policy/snapshot.
+    """
+    try:
+        since = int(request.args.get('since', 0))
+        wait = min(float(request.args.get('wait', 0)), LONG_POLL_MAX)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'since must be an integer and wait a number'}), 400
+    if wait > 0:
+        wait_for_change(since, wait)
+    generation, reached, changes = changes_since(since)
+    if changes is None:
+        return jsonify({'status': 'success', 'resync': True, 'generation': generation}), 200
+    return stream_jsonify({'status': 'success', 'resync': False, 'generation': generation,
+                           'next': reached, 'changes': changes})
 
 @app.route('/set_policy', methods=['POST'])
-@require_auth(["admin"])
-@require_roles(["admin"])
+@require_token(["admin"], ["admin"])
 def set_policy():
     """
     Adds a policy entry to a specified table in the database.
@@ -282,15 +546,16 @@ def set_policy():
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
             cursor.execute(query, tuple(ordered_values))
+            bump_policy_generation(conn, [(table_name, 'insert', dict(zip(columns, ordered_values)))])
             conn.commit()
+        refresh_policy()
         return jsonify({'status': 'success', 'message': 'Policy entry added successfully'}), 201
     except sqlite3.Error as e:
         logging.error(f"Database error: {e}, query: {query}, values: {ordered_values}")
         return jsonify({'status': 'error', 'message': 'Failed to add policy entry'}), 500
 
 @app.route('/delete_policy', methods=['DELETE'])
-@require_auth(["admin"])
-@require_roles(["admin"])
+@require_token(["admin"], ["admin"])
 def delete_policy():
     """
     Deletes a policy entry from a specified table in the database.
@@ -328,8 +593,15 @@ def delete_policy():
         # Execute the SQL query with parameterized values to prevent SQL injection
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
+            # Record the deleted rows in the policy change log (too many are logged as a reset)
+            cursor.execute(f"SELECT * FROM {table_name} WHERE {condition}")
+            names = [column[0] for column in cursor.description]
+            rows = cursor.fetchmany(POLICY_CHANGE_MAX_ROWS + 1)
+            changes = [(table_name, 'delete', dict(zip(names, row))) for row in rows]
             cursor.execute(query)  # Execute the query
+            bump_policy_generation(conn, changes if len(rows) <= POLICY_CHANGE_MAX_ROWS else None)
             conn.commit()
+        refresh_policy()
 
         return jsonify({'status': 'success', 'message': 'Policy entry deleted successfully'}), 200
 
@@ -338,6 +610,40 @@ def delete_policy():
         return jsonify({'status': 'error', 'message': 'Failed to delete policy entry'}), 500
 
 
+@app.route('/import_policy', methods=['POST'])
+@require_token(["admin"], ["admin"])
+def import_policy_entries():
+    """
+    Bulk-imports policy entries streamed in the request body.
+    Query parameters: table, format (ndjson, csv or hosts), and optional type/proxy defaults
+    for entries without them (hosts file entries default to the hostname type).
+    The body may be gzip-compressed (Content-Encoding: gzip).
+    """
+    table_name = request.args.get('table')
+    input_format = request.args.get('format', 'ndjson')
+    if table_name not in IMPORT_TABLES:
+        return jsonify({'status': 'error', 'message': f'Invalid table name: {table_name}'}), 400
+    if input_format not in PARSERS:
+        return jsonify({'status': 'error', 'message': f'Invalid format: {input_format}'}), 400
+
+    body = request.stream
+    if request.headers.get('Content-Encoding') == 'gzip':
+        body = gzip.GzipFile(fileobj=body)
+    lines = io.TextIOWrapper(body, encoding='utf-8', errors='replace', newline='')
+    defaults = format_defaults(input_format, {'type': request.args.get('type'), 'proxy': request.args.get('proxy'),
+                                              'value': '' if table_name == 'blocked_files' else None})
+    try:
+        stats = import_policy(PARSERS[input_format](lines), table_name, defaults,
+                              progress=lambda read, rejected: logging.info(
+                                  f"Policy import into {table_name}: {read} rows read, {rejected} rejected"))
+    except (sqlite3.Error, OSError, EOFError) as e:
+        logging.error(f"Policy import into {table_name} failed: {e}")
+        return jsonify({'status': 'error', 'message': 'Failed to import policy entries'}), 500
+    if stats['inserted']:
+        refresh_policy()
+    return jsonify({'status': 'success', **stats}), 200
+
+
 @app.before_request
 def start_time():
     request.start_time = time.time()
@@ -350,8 +656,15 @@ def log_response(response):
     response_time = time.time() - getattr(request, 'start_time', time.time())
     # Ensure that request and response are serialized correctly
     request_data = json.dumps(request.get_json() if request.is_json else {}, ensure_ascii=False)
-    if response.is_json:
-        response_data = json.dumps(response.get_json(), ensure_ascii=False)
+    verdict = None
+    if response.is_streamed:
+        # Reading the body would consume the stream before it reaches the client
+        response_data = "streamed"
+    elif response.is_json:
+        response_json = response.get_json()
+        response_data = json.dumps(response_json, ensure_ascii=False)
+        if isinstance(response_json, dict):
+            verdict = response_json.get('status')
     else:
         response_data = response.get_data(as_text=True)
     # Log the request and response data
@@ -369,7 +682,8 @@ def log_response(response):
         method=request.method,
         status_code=response.status_code,
         response_time=response_time,
-        category=request.path  # Category can be dynamic based on the request URL
+        category=request.path,  # Category can be dynamic based on the request URL
+        verdict=verdict
     )
     return response
 
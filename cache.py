@@ -2,21 +2,119 @@ import sqlite3
 import time
 import logging
 import json
+import os
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.single_flight import SingleFlight
+from utils.startup import Lazy
 
 
 # Constants
 DB_PATH = "cache.db"
-CACHE_TTL = 3600  # 1 hour
+CACHE_TTL = 3600  # 1 hour, soft TTL: older entries are stale and refreshed in the background
+CACHE_HARD_TTL = int(os.getenv("CACHE_HARD_TTL", str(6 * 3600)))  # Stale entries are served up to this age
+REFRESH_WORKERS = 4  # Threads refreshing stale entries
+NEGATIVE_CACHE_TTL = 60  # Seconds a failed upstream lookup is remembered
+MEMORY_CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MEMORY_MAX_ENTRIES", "10000"))
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "100000"))  # Rows kept in cache.db
+SWEEP_INTERVAL = 300  # Seconds between background sweeps of cache.db
+SWEEP_BATCH_SIZE = 1000  # Rows deleted per transaction, keeps write locks short
 
 # Thread lock for safe access in multi-threaded environments
 lock = threading.Lock()
 
+
+class MemoryCache:
+    """Bounded in-process LRU cache with TTL, kept in front of the SQLite cache.
+
+    Entries are bounded both by count and by the size of their serialized form.
+    Values are shared with callers and must not be mutated.
+    """
+
+    def __init__(self, max_entries=MEMORY_CACHE_MAX_ENTRIES, max_bytes=MEMORY_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, timestamp, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, ttl=CACHE_TTL):
+        """Return the value for key, or None if it is missing or older than ttl."""
+        entry = self.get_entry(key, ttl)
+        return entry[0] if entry else None
+
+    def get_entry(self, key, ttl=CACHE_HARD_TTL):
+        """Return (value, timestamp) for key, or None if it is missing or older than ttl."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, timestamp, size = entry
+            if time.time() - timestamp > ttl:
+                del self._entries[key]
+                self._bytes -= size
+                return None
+            self._entries.move_to_end(key)
+            return value, timestamp
+
+    def set(self, key, value, timestamp, size):
+        """Store value, evicting least recently used entries beyond the bounds."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, timestamp, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'evictions': self.evictions}
+
+
+memory_cache = MemoryCache()
+# Keys whose last upstream lookup failed, kept in process only and for a short time
+negative_cache = MemoryCache(max_entries=MEMORY_CACHE_MAX_ENTRIES)
+
+# Decoders for binary cache values, keyed by their 2-byte magic prefix (used for display only)
+binary_decoders = {}
+
+
+def register_binary_decoder(magic, decoder):
+    """Register a function that turns binary values starting with magic into JSON-friendly data."""
+    binary_decoders[magic] = decoder
+
+
+# Coalesces concurrent loads of the same missing key into one upstream call
+loads = SingleFlight()
+
+# Hit/miss counters per cache tier
+stats = {
+    'memory': {'hits': 0, 'misses': 0},
+    'sqlite': {'hits': 0, 'misses': 0},
+}
+
+
+def _count(tier, outcome):
+    with lock:
+        stats[tier][outcome] += 1
+
+
 def create_cache_db():
     """Create the cache table if it doesn't exist."""
     try:
         with sqlite3.connect(DB_PATH) as conn:
             cursor = conn.cursor()
+            # Only effective on a new database: lets swept pages be returned to the OS
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS cache (
                     key TEXT PRIMARY KEY,
@@ -24,30 +122,44 @@ def create_cache_db():
                     timestamp REAL
                 )
             """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cache_timestamp ON cache (timestamp)")
             conn.commit()
     except Exception:
         logging.exception("Error creating cache table")
 
-# Ensure cache table is created on module import
-create_cache_db()
+# The cache table is created on first use (or by the startup warm-up), not on import
+_cache_db = Lazy('cache_db', create_cache_db)
 
 def set_cache(key, data):
-    """Store data in the cache with a timestamp."""
+    """Store data in the cache with a timestamp (write-through to both tiers).
+
+    Bytes are stored as-is in a BLOB, anything else is serialized as JSON.
+    """
+    start_sweeper()
     try:
         timestamp = int(time.time())
+        serialized = data if isinstance(data, bytes) else json.dumps(data)
 
+        _cache_db.get()
         with lock, sqlite3.connect(DB_PATH) as conn:
             conn.execute("""
                 INSERT OR REPLACE INTO cache (key, response, timestamp)
                 VALUES (?, ?, ?)
-            """, (key, json.dumps(data), timestamp))
+            """, (key, serialized, timestamp))
             conn.commit()
+        memory_cache.set(key, data, timestamp, len(serialized))
     except Exception:
         logging.exception(f"Error saving key '{key}' to cache")
 
-def get_cache(key):
-    """Retrieve data from the cache."""
+def _get_entry(key, max_age):
+    """Return (value, timestamp) for key from the first tier holding it, or None."""
+    entry = memory_cache.get_entry(key, max_age)
+    if entry is not None:
+        _count('memory', 'hits')
+        return entry
+    _count('memory', 'misses')
     try:
+        _cache_db.get()
         conn = sqlite3.connect(DB_PATH)
         c = conn.cursor()
         c.execute("SELECT response, timestamp FROM cache WHERE key = ?", (key,))
@@ -59,56 +171,246 @@ def get_cache(key):
             timestamp = row[1]
 
             # Check if the cached data has expired based on TTL
-            if time.time() - timestamp > CACHE_TTL:
+            if time.time() - timestamp > max_age:
                 logging.info(f"Cache for key '{key}' has expired.")
+                _count('sqlite', 'misses')
                 return None  # Data has expired
 
-            # Check if the data is already a dictionary (not a string)
-            if isinstance(data, dict):
-                return data  # If it's already a dict, return it directly
-            else:
-                return json.loads(data)  # Otherwise, deserialize the JSON string
+            _count('sqlite', 'hits')
+            # Binary values are returned as stored, JSON strings are deserialized
+            value = data if isinstance(data, bytes) else json.loads(data)
+            memory_cache.set(key, value, timestamp, len(data))
+            return value, timestamp
+        _count('sqlite', 'misses')
         return None  # No cache entry found
     except Exception as e:
         logging.error(f"Error retrieving from cache: {e}")
         return None
 
+def get_cache(key):
+    """Retrieve fresh data from the cache, checking the in-process tier before SQLite."""
+    entry = _get_entry(key, CACHE_TTL)
+    return entry[0] if entry else None
+
+
+_refresh_executor = None
+_refresh_pid = None
+_refreshing = set()
+
+
+def _schedule_refresh(key, loader):
+    """Reload a stale key in the background, at most once at a time per key."""
+    global _refresh_executor, _refresh_pid
+    with lock:
+        if _refresh_pid != os.getpid():
+            # Executor threads do not survive a fork, start a new pool in this process
+            _refresh_executor = ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix="cache-refresh")
+            _refresh_pid = os.getpid()
+            _refreshing.clear()
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def refresh():
+        try:
+            value = loader()
+            if value is not None:
+                set_cache(key, value)
+        except Exception as e:
+            logging.warning(f"Background refresh of cache key '{key}' failed: {e}")
+        finally:
+            with lock:
+                _refreshing.discard(key)
 
+    _refresh_executor.submit(refresh)
 
 
-def get_all_cache():
-    """Retrieve all cache entries."""
+def get_or_load(key, loader):
+    """Return the cached value for key, using stale-while-revalidate.
+
+    Fresh entries (younger than CACHE_TTL) are returned directly. Stale entries (up to
+    CACHE_HARD_TTL) are returned immediately while loader() refreshes them in the
+    background. Otherwise loader() is called synchronously and a non-None result is cached;
+    concurrent callers missing the same key wait for that single load and share its result.
+    """
+    entry = _get_entry(key, CACHE_HARD_TTL)
+    if entry is not None:
+        value, timestamp = entry
+        if time.time() - timestamp > CACHE_TTL:
+            _schedule_refresh(key, loader)
+        return value
+
+    def load_and_store():
+        value = loader()
+        if value is not None:
+            set_cache(key, value)
+        return value
+
+    return loads.do(key, load_and_store)
+
+
+def _cached_timestamp(key):
+    """Return the timestamp of key in the first tier holding it, without touching the hit counters."""
+    entry = memory_cache.get_entry(key, CACHE_HARD_TTL)
+    if entry is not None:
+        return entry[1]
     try:
+        _cache_db.get()
         with sqlite3.connect(DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT key, response, timestamp FROM cache")
-            rows = cursor.fetchall()
-            logging.info(f"Retrieved {len(rows)} cache entries from the database")
-
-            # Convert rows into a more readable format (a list of dictionaries)
-            cache_entries = []
-            for row in rows:
-                key, data, timestamp = row
-                cache_entry = {
-                    'key': key,
-                    'response': data,
-                    'timestamp': timestamp
-                }
-
-                # Deserialize 'response' if it's in JSON format
-                if cache_entry['response']:
-                    try:
-                        cache_entry['response'] = json.loads(cache_entry['response'])
-                    except json.JSONDecodeError as e:
-                        logging.warning(f"Failed to decode 'response' field as JSON: {e}")
-                        # If we can't decode it, leave the response as is
-
-                cache_entries.append(cache_entry)
-
-            return {'cache': cache_entries, 'status': 'success'}
+            row = conn.execute("SELECT timestamp FROM cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logging.error(f"Error reading cache timestamp: {e}")
+        return None
+
+
+def warm(key, loader, ahead=0):
+    """Pre-load key unless its entry stays fresh for at least another ``ahead`` seconds.
+
+    Returns True if loader() was called; a non-None result is cached.
+    """
+    timestamp = _cached_timestamp(key)
+    if timestamp is not None and time.time() - timestamp < CACHE_TTL - ahead:
+        return False
+
+    def load_and_store():
+        value = loader()
+        if value is not None:
+            set_cache(key, value)
+        return value
+
+    loads.do(key, load_and_store)
+    return True
+
+
+def set_negative(key):
+    """Remember that looking up key upstream just failed."""
+    negative_cache.set(key, True, time.time(), 1)
+
+
+def is_negative(key):
+    """Return True if an upstream lookup of key failed within NEGATIVE_CACHE_TTL."""
+    return negative_cache.get(key, NEGATIVE_CACHE_TTL) is not None
+
+
+def get_cache_stats():
+    """Return hit/miss counters per tier and the size of the in-process tier."""
+    with lock:
+        counters = {tier: dict(values) for tier, values in stats.items()}
+    counters['memory'].update(memory_cache.stats())
+    counters['loads'] = loads.stats()
+    counters['negative'] = negative_cache.stats()
+    return counters
+
+
+def _delete_in_batches(conn, select_rowids, params=()):
+    """Delete the rows selected by a rowid subquery in batches. Returns the number deleted."""
+    deleted = 0
+    while True:
+        with lock:
+            cursor = conn.execute(f"DELETE FROM cache WHERE rowid IN ({select_rowids} LIMIT ?)",
+                                  (*params, SWEEP_BATCH_SIZE))
+            conn.commit()
+        deleted += cursor.rowcount
+        if cursor.rowcount < SWEEP_BATCH_SIZE:
+            return deleted
+
+
+def sweep_cache():
+    """Delete entries past the hard TTL, then evict the oldest entries beyond CACHE_MAX_ENTRIES."""
+    try:
+        _cache_db.get()
+        with sqlite3.connect(DB_PATH) as conn:
+            expired = _delete_in_batches(conn, "SELECT rowid FROM cache WHERE timestamp < ?",
+                                         (time.time() - CACHE_HARD_TTL,))
+            evicted = 0
+            excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - CACHE_MAX_ENTRIES
+            while excess > 0:
+                batch = min(excess, SWEEP_BATCH_SIZE)
+                with lock:
+                    cursor = conn.execute("DELETE FROM cache WHERE rowid IN "
+                                          "(SELECT rowid FROM cache ORDER BY timestamp LIMIT ?)", (batch,))
+                    conn.commit()
+                evicted += cursor.rowcount
+                excess -= batch
+            conn.execute("PRAGMA incremental_vacuum")
+        if expired or evicted:
+            logging.info(f"Cache sweep removed {expired} expired and {evicted} evicted entries")
+        return expired, evicted
+    except sqlite3.Error as e:
+        logging.error(f"SQLite error sweeping cache: {e}")
+        return 0, 0
+
+
+_sweeper_pid = None
+
+
+def start_sweeper():
+    """Start the background sweeper thread once per process (also after a fork)."""
+    global _sweeper_pid
+    if not SWEEP_INTERVAL or _sweeper_pid == os.getpid():
+        return
+    with lock:
+        if _sweeper_pid == os.getpid():
+            return
+        _sweeper_pid = os.getpid()
+
+    def loop():
+        while True:
+            time.sleep(SWEEP_INTERVAL)
+            sweep_cache()
+
+    threading.Thread(target=loop, name="cache-sweeper", daemon=True).start()
+
+
+def get_cache_page(limit=100, cursor=None, search=None):
+    """Retrieve one page of cache entries ordered by key.
+
+    Pass the ``next_cursor`` of the previous page as ``cursor`` to continue;
+    ``search`` restricts the page to keys containing the given text.
+    """
+    conditions = []
+    params = []
+    if cursor:
+        conditions.append("key > ?")
+        params.append(cursor)
+    if search:
+        conditions.append("instr(key, ?) > 0")
+        params.append(search)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    try:
+        _cache_db.get()
+        with sqlite3.connect(DB_PATH) as conn:
+            cursor_obj = conn.cursor()
+            # Fetch one extra row to know whether another page exists
+            cursor_obj.execute(f"SELECT key, response, timestamp FROM cache {where} ORDER BY key LIMIT ?",
+                               (*params, limit + 1))
+            rows = cursor_obj.fetchall()
+
+        # Convert rows into a more readable format (a list of dictionaries)
+        cache_entries = []
+        for key, data, timestamp in rows[:limit]:
+            cache_entry = {
+                'key': key,
+                'response': data,
+                'timestamp': timestamp
+            }
+
+            if isinstance(data, bytes):
+                decoder = binary_decoders.get(data[:2])
+                cache_entry['response'] = decoder(data) if decoder else data.hex()
+            # Deserialize 'response' if it's in JSON format
+            elif cache_entry['response']:
+                try:
+                    cache_entry['response'] = json.loads(cache_entry['response'])
+                except json.JSONDecodeError as e:
+                    logging.warning(f"Failed to decode 'response' field as JSON: {e}")
+                    # If we can't decode it, leave the response as is
+
+            cache_entries.append(cache_entry)
+
+        next_cursor = cache_entries[-1]['key'] if len(rows) > limit else None
+        return {'cache': cache_entries, 'next_cursor': next_cursor, 'status': 'success'}
     except sqlite3.Error as e:
         logging.error(f"SQLite error retrieving cache entries: {e}")
-        return {'cache': [], 'status': 'error'}
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
-        return {'cache': [], 'status': 'error'}
+        return {'cache': [], 'next_cursor': None, 'status': 'error'}
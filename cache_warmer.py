@@ -0,0 +1,134 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from log_db import LOG_COLUMNS, LogDB
+
+WARM_TOP_HOSTNAMES = int(os.getenv("CACHE_WARM_TOP", "500"))  # Hostnames warmed per run
+WARM_LOOKBACK = 24 * 3600  # Seconds of logs scanned for frequent hostnames
+WARM_CONCURRENCY = int(os.getenv("CACHE_WARM_CONCURRENCY", "4"))  # Parallel upstream lookups
+WARM_RATE = float(os.getenv("CACHE_WARM_RATE", "10"))  # Hostnames started per second, 0 for unlimited
+WARM_INTERVAL = int(os.getenv("CACHE_WARM_INTERVAL", "0"))  # Seconds between scheduled runs, 0 disables
+WARM_ON_START = os.getenv("CACHE_WARM_ON_START", "true").lower() in ('1', 'true', 'yes')  # One run at startup
+WARM_FILE = os.getenv("CACHE_WARM_FILE")  # Hostname list warmed instead of the logged hostnames
+WARM_AHEAD = 600  # Entries expiring within this many seconds are refreshed early
+WARM_CATEGORIES = ('/checkUrl', '/checkHash')  # Log categories whose requests carry a url or host
+
+
+def top_hostnames(log_db, limit=WARM_TOP_HOSTNAMES, lookback=WARM_LOOKBACK):
+    """Return the most frequently checked hostnames of the last ``lookback`` seconds."""
+    since = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() - lookback))
+    request_index = LOG_COLUMNS.index('request')
+    hits_index = LOG_COLUMNS.index('hit_count')
+    counts = Counter()
+    for category in WARM_CATEGORIES:
+        for row in log_db.iter_logs(category=category, since=since, decode=False):
+            try:
+                data = json.loads(row[request_index])
+                hostname = data.get('host') or urlparse(data.get('url')).netloc
+            except (TypeError, ValueError, AttributeError):
+                continue
+            if isinstance(hostname, str) and hostname:
+                counts[hostname] += row[hits_index] or 1
+    return [hostname for hostname, _ in counts.most_common(limit)]
+
+
+def read_hostnames(path):
+    """Read hostnames from a file, one per line; '#' starts a comment."""
+    with open(path) as f:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+
+
+def default_warmers():
+    """Return the functions pre-loading a hostname: every threat-intel provider that supports it, and categories."""
+    from api_interfaces.aggregator import default_aggregator
+    from filter_checks.category_check import warm_categories
+    providers = default_aggregator().providers.values()
+    return [provider.warm_domain for provider in providers if hasattr(provider, 'warm_domain')] + [warm_categories]
+
+
+def warm_hostnames(hostnames, warmers=None, concurrency=WARM_CONCURRENCY, rate=WARM_RATE, ahead=WARM_AHEAD):
+    """Pre-load the cache entries of hostnames with bounded concurrency and rate.
+
+    Entries that stay fresh for longer than ``ahead`` seconds are left alone. Returns the
+    number of lookups that were sent upstream.
+    """
+    warmers = default_warmers() if warmers is None else warmers
+    loaded = 0
+    loaded_lock = threading.Lock()
+
+    def warm_one(hostname):
+        nonlocal loaded
+        for warmer in warmers:
+            try:
+                if warmer(hostname, ahead):
+                    with loaded_lock:
+                        loaded += 1
+            except Exception as e:
+                logging.warning(f"Warming {hostname} failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cache-warmer") as executor:
+        for i, hostname in enumerate(hostnames):
+            if rate and i:
+                time.sleep(1 / rate)
+            executor.submit(warm_one, hostname)
+    logging.info(f"Cache warming of {len(hostnames)} hostnames sent {loaded} lookups upstream")
+    return loaded
+
+
+_warmer_pid = None
+_warmer_lock = threading.Lock()
+
+
+def start_warmer(log_db, interval=WARM_INTERVAL, on_start=WARM_ON_START):
+    """Warm the hottest hostnames (or those of CACHE_WARM_FILE) in a background thread, once per process.
+
+    With ``on_start`` they are warmed right away, and with an ``interval`` every ``interval`` seconds.
+    """
+    global _warmer_pid
+    if not interval and not on_start:
+        return
+    with _warmer_lock:
+        if _warmer_pid == os.getpid():
+            return
+        _warmer_pid = os.getpid()
+
+    def loop():
+        if not on_start:
+            time.sleep(interval)
+        while True:
+            try:
+                warm_hostnames(read_hostnames(WARM_FILE) if WARM_FILE else top_hostnames(log_db))
+            except Exception:
+                logging.exception("Cache warming failed")
+            if not interval:
+                return
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="cache-warmer", daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-load threat-intel and category cache entries.")
+    parser.add_argument('--file', help="Hostname list to warm instead of the most frequent logged hostnames")
+    parser.add_argument('--top', type=int, default=WARM_TOP_HOSTNAMES, help="Number of logged hostnames to warm")
+    parser.add_argument('--concurrency', type=int, default=WARM_CONCURRENCY)
+    parser.add_argument('--rate', type=float, default=WARM_RATE, help="Hostnames per second, 0 for unlimited")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.file:
+        hostnames = read_hostnames(args.file)
+    else:
+        hostnames = top_hostnames(LogDB(), args.top)
+    loaded = warm_hostnames(hostnames, concurrency=args.concurrency, rate=args.rate)
+    print(f"Warmed {len(hostnames)} hostnames, {loaded} lookups sent upstream.")
+
+
+if __name__ == "__main__":
+    main()
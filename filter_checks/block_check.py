@@ -1,41 +1,42 @@
 import logging
 from urllib.parse import urlparse
-import tldextract
 
 from filter_checks.category_check import check_category_action
-from api_interfaces.otx_api import OTXAPI
-from utils.url_utils import get_domain
-from .db_utils import query_database  # Hilfsfunktion, siehe unten
+from api_interfaces.aggregator import default_aggregator
+from utils.url_utils import registrable_domain
+from .policy_snapshot import current_policy
 
-# Instanz der OTX API
-api_provider = OTXAPI()
 
 def get_block_status(url):
     """
     Checks if a URL should be blocked based on local database rules, OTX verdicts, and category rules.
     """
-    hostname = urlparse(url).netloc
-    domain = get_domain(url)
-
-    # Check against local DB blocklists
-    checks = [
-        ("SELECT value FROM blocked_urls WHERE type = 'url_prefix' AND ? LIKE value || '%'", (url,), 'Blocked by URL prefix'),
-        ("SELECT value FROM blocked_urls WHERE type = 'hostname' AND value = ?", (hostname,), 'Blocked by exact hostname'),
-        ("SELECT value FROM blocked_urls WHERE type = 'domain' AND value = ?", (domain,), 'Blocked by domain (includes subdomains)'),
-    ]
-
-    for query, params, message in checks:
-        if query_database(query, params):
-            return {'status': 'blocked', 'message': message}
+    parsed = urlparse(url)
+    hostname = parsed.netloc
+    # Threat intel and categories know bare names: no port, credentials or upper case
+    bare_hostname = parsed.hostname
+    domain = registrable_domain(bare_hostname)
+
+    # Check against the local blocklists (compiled policy snapshot)
+    policy = current_policy()
+    if policy.longest_prefix('blocked_url_prefix', url.lower()) is not None:
+        return {'status': 'blocked', 'message': 'Blocked by URL prefix'}
+    if policy.contains('blocked_hostname', hostname):
+        return {'status': 'blocked', 'message': 'Blocked by exact hostname'}
+    if policy.contains('blocked_domain', domain):
+        return {'status': 'blocked', 'message': 'Blocked by domain (includes subdomains)'}
+
+    if not bare_hostname:
+        return None  # Nothing to look up
 
     # Check OTX verdict
-    ioc_status = api_provider.check_domain(hostname)
-    logging.info(f"Domain {hostname} OTX status: {ioc_status}")
+    ioc_status = default_aggregator().check_domain(bare_hostname)
+    logging.info(f"Domain {bare_hostname} OTX status: {ioc_status}")
     if ioc_status and ioc_status.get('verdict') != 'Whitelisted':
         return {'status': 'blocked', 'message': 'Domain is an IOC (Indicator of Compromise)'}
 
     # Check via category
-    category_status = check_category_action(hostname)
+    category_status = check_category_action(bare_hostname)
     if category_status:
         return category_status
 
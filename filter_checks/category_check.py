@@ -1,56 +1,115 @@
+import logging
+import os
 import requests
-from bs4 import BeautifulSoup
 import cache
+from api_interfaces.circuit_breaker import REQUEST_TIMEOUT, CircuitOpenError, get_breaker, is_upstream_failure
+from filter_checks.category_store import DomainCategoryStore
 from filter_checks.db_utils import  load_category_policy
+from utils.startup import Lazy
 
-# ✅ Load the current category policy from the database
-CATEGORY_MAP = load_category_policy()
 
+class CategoryPolicy:
+    """The category policy, with the blocked categories precomputed by ID (local store) and by name (OpenDNS pages)."""
 
-def check_category_action(domain, user_id="default"):
+    def __init__(self, category_map):
+        self.categories = category_map
+        self.blocked_ids = {cat_id for cat_id, info in category_map.items() if info["action"] == "blocked"}
+        self.blocked_names = {category_map[cat_id]["name"] for cat_id in self.blocked_ids}
+
+
+# ✅ The category policy and the local category database are loaded on first use
+category_policy = Lazy('category_policy', lambda: CategoryPolicy(load_category_policy()))
+category_store = Lazy('category_store', DomainCategoryStore)
+
+# Scrape the OpenDNS page of domains missing from the local category database
+SCRAPE_FALLBACK = os.getenv('CATEGORY_SCRAPE_FALLBACK', 'true').lower() in ('1', 'true', 'yes')
+
+breaker = get_breaker('opendns')
+
+
+def fetch_categories(domain):
+    """Fetch and parse the OpenDNS category page of a domain into category names.
+
+    Raises on failure; failures are negatively cached and counted by the OpenDNS circuit breaker.
+    """
     url = f"https://domain.opendns.com/{domain}"
     headers = {"User-Agent": "Mozilla/5.0"}
-
-    # ✅ Check if the category names are cached
-    cached_categories = cache.get_cache(url)
-    if cached_categories:
-        categories = cached_categories
+    if cache.is_negative(url):
+        raise RuntimeError(f"OpenDNS lookup for {domain} failed recently")
+    breaker.check()
+    try:
+        response = requests.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException:
+        breaker.record_failure()
+        cache.set_negative(url)
+        raise
+    if is_upstream_failure(response.status_code):
+        breaker.record_failure()
     else:
-        # ✅ Fetch and parse OpenDNS category page
-        try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-        except Exception as e:
-            return {"error": str(e)}
+        breaker.record_success()
+    try:
+        response.raise_for_status()
+    except requests.HTTPError:
+        cache.set_negative(url)
+        raise
+
+    from bs4 import BeautifulSoup  # Only needed by the fallback, kept out of the startup path
+    soup = BeautifulSoup(response.text, 'html.parser')
+    categories = []
+    category_map = category_policy.get().categories
+
+    for b_tag in soup.find_all("b"):
+        if b_tag.get("id", "").startswith("catname-"):
+            cat_id = b_tag.get("id").split("-")[-1]
+            parent_td = b_tag.find_parent("td")
+            next_td = parent_td.find_next_sibling("td") if parent_td else None
+
+            if next_td and "Approved" in next_td.text:
+                cat_info = category_map.get(cat_id)
+                if cat_info:
+                    # ✅ Save only category name to cache
+                    categories.append(cat_info["name"])
+    return categories
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        categories = []
 
-        for b_tag in soup.find_all("b"):
-            if b_tag.get("id", "").startswith("catname-"):
-                cat_id = b_tag.get("id").split("-")[-1]
-                parent_td = b_tag.find_parent("td")
-                next_td = parent_td.find_next_sibling("td") if parent_td else None
+def warm_categories(domain, ahead=0):
+    """Pre-load the cached categories of a domain, see cache.warm()."""
+    if not SCRAPE_FALLBACK or category_store.get().lookup(domain) is not None:
+        return False
+    return cache.warm(f"https://domain.opendns.com/{domain}", lambda: fetch_categories(domain), ahead)
 
-                if next_td and "Approved" in next_td.text:
-                    cat_info = CATEGORY_MAP.get(cat_id)
-                    if cat_info:
-                        category_name = cat_info["name"]
-                        action = cat_info["action"]
 
+def blocked_response(category):
+    return {
+        'status': 'blocked',
+        'message': f"Domain belongs to blocked category: {category}"
+    }
 
-                        # ✅ Save only category name to cache
-                        categories.append(category_name)
 
-        cache.set_cache(url, categories)
+def check_category_action(domain, user_id="default"):
+    # ✅ Categories of the local database, no network needed
+    policy = category_policy.get()
+    category_ids = category_store.get().lookup(domain)
+    if category_ids is not None:
+        blocked = sorted(category_ids & policy.blocked_ids)
+        return blocked_response(policy.categories[blocked[0]]["name"]) if blocked else None
+    if not SCRAPE_FALLBACK:
+        return None
+
+    url = f"https://domain.opendns.com/{domain}"
+    # ✅ Category names come from the cache; stale entries are served while refreshed in the background
+    # An OpenDNS outage must not decide the verdict: skip the category check, like the OTX lookup
+    try:
+        categories = cache.get_or_load(url, lambda: fetch_categories(domain))
+    except CircuitOpenError as e:
+        logging.warning(f"Skipping OpenDNS category lookup: {e}")
+        return None
+    except Exception as e:
+        logging.warning(f"OpenDNS category lookup for {domain} failed, skipping: {e}")
+        return None
 
-    # ✅ Evaluate latest action from DB mapping every time (even if category was cached)
     for category in categories:
-        for cat_id, info in CATEGORY_MAP.items():
-            if info["name"] == category and info["action"] == "blocked":
-                return {
-                    'status': 'blocked',
-                    'message': f"Domain belongs to blocked category: {category}"
-                }
+        if category in policy.blocked_names:
+            return blocked_response(category)
 
     return None  # Not blocked
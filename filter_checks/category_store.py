@@ -0,0 +1,118 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+CATEGORY_DB_PATH = os.getenv('CATEGORY_DB_PATH', 'categories.db')
+RELOAD_CHECK_INTERVAL = 5  # Seconds between checks whether the database changed on disk
+IMPORT_BATCH_SIZE = 5000
+
+
+def resolve_category(category, category_map):
+    """Map a category ID or name (case-insensitive) to its ID, or None if it is unknown."""
+    category = category.strip()
+    if category in category_map:
+        return category
+    lowered = category.lower()
+    for cat_id, info in category_map.items():
+        if info["name"].lower() == lowered:
+            return cat_id
+    return None
+
+
+def parse_category_list(text, category=None):
+    """Yield (domain, category) pairs from a category list.
+
+    Lines are either ``domain,category`` or, when ``category`` is given, a bare domain.
+    '#' starts a comment.
+    """
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        domain, _, listed = line.partition(',')
+        if listed.strip() or category:
+            yield domain.strip().lower().rstrip('.'), listed.strip() or category
+
+
+class DomainCategoryStore:
+    """Local domain -> category ID database, bulk-loaded from category list files.
+
+    Lookups are served from an in-process dictionary that is reloaded when the
+    database file changes; a domain inherits the categories of its parent domains.
+    """
+
+    def __init__(self, db_path=CATEGORY_DB_PATH):
+        self.db_path = db_path
+        self._domains = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS domain_categories (
+                    domain TEXT NOT NULL,
+                    category_id TEXT NOT NULL,
+                    PRIMARY KEY (domain, category_id)
+                ) WITHOUT ROWID
+            ''')
+
+    def import_file(self, path, category_map, category=None):
+        """Import a category list file, returning the number of new domain/category pairs."""
+        with open(path, encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        unknown = set()
+        batch = []
+        with sqlite3.connect(self.db_path) as conn:
+            before = conn.total_changes
+            for domain, listed in parse_category_list(text, category):
+                cat_id = resolve_category(listed, category_map)
+                if cat_id is None:
+                    unknown.add(listed)
+                    continue
+                batch.append((domain, cat_id))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    conn.executemany("INSERT OR IGNORE INTO domain_categories VALUES (?, ?)", batch)
+                    batch = []
+            conn.executemany("INSERT OR IGNORE INTO domain_categories VALUES (?, ?)", batch)
+            added = conn.total_changes - before
+        if unknown:
+            logging.warning(f"Skipped unknown categories in {path}: {', '.join(sorted(unknown))}")
+        logging.info(f"Imported {added} domain categories from {path}")
+        self._checked = 0.0  # Pick up the import on the next lookup
+        return added
+
+    def _index(self):
+        """Return the domain dictionary, reloading it if the database changed."""
+        now = time.monotonic()
+        if now - self._checked < RELOAD_CHECK_INTERVAL:
+            return self._domains
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.stat(self.db_path).st_mtime_ns
+            except OSError:
+                return self._domains
+            if mtime != self._mtime:
+                domains = {}
+                with sqlite3.connect(self.db_path) as conn:
+                    for domain, cat_id in conn.execute("SELECT domain, category_id FROM domain_categories"):
+                        domains[domain] = domains.get(domain, ()) + (cat_id,)
+                self._domains, self._mtime = domains, mtime
+            return self._domains
+
+    def lookup(self, hostname):
+        """Return the category IDs of hostname and its parent domains, or None if none is listed."""
+        domains = self._index()
+        if not domains:
+            return None
+        labels = hostname.lower().rstrip('.').split('.')
+        found = set()
+        for i in range(len(labels)):
+            found.update(domains.get('.'.join(labels[i:]), ()))
+        return found or None
+
+    def stats(self):
+        domains = self._index()
+        return {'domains': len(domains), 'entries': sum(len(ids) for ids in domains.values())}
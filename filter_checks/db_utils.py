@@ -1,7 +1,10 @@
+import json
 import sqlite3
 import logging
 
 DB_PATH = "url_filter.db"  # Achtung: Wenn du mehrere Pfade brauchst, ggf. dynamisch machen
+POLICY_CHANGE_LOG_GENERATIONS = 10000  # Generations kept in the policy change log for followers
+POLICY_CHANGE_MAX_ROWS = 1000  # Larger changes are logged as a reset, followers reload the full policy
 
 def query_database(query, params=()):
     """
@@ -29,3 +32,52 @@ def load_category_policy():
     except sqlite3.Error as e:
         logging.error(f"Error loading category policy: {e}")
         return {}
+
+
+def bump_policy_generation(conn, changes=None):
+    """
+    Increments the policy generation inside the caller's transaction and returns the new value.
+    Every write to the policy tables must bump it, so compiled policy snapshots notice the change.
+    ``changes`` lists the written rows as (table, 'insert' or 'delete', row dict) for the change log;
+    without them (or with too many) a 'reset' is logged and followers reload the full policy.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS policy_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS policy_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            generation INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL,  -- 'insert', 'delete' or 'reset'
+            data TEXT  -- JSON of the row
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_policy_changes_generation ON policy_changes (generation)")
+    conn.execute("""
+        INSERT INTO policy_meta (key, value) VALUES ('generation', 1)
+        ON CONFLICT(key) DO UPDATE SET value = value + 1
+    """)
+    generation = conn.execute("SELECT value FROM policy_meta WHERE key = 'generation'").fetchone()[0]
+
+    if changes is None or len(changes) > POLICY_CHANGE_MAX_ROWS:
+        changes = [('*', 'reset', None)]
+    conn.executemany(
+        "INSERT INTO policy_changes (generation, table_name, op, data) VALUES (?, ?, ?, ?)",
+        [(generation, table, op, None if row is None else json.dumps(row)) for table, op, row in changes]
+    )
+    conn.execute("DELETE FROM policy_changes WHERE generation <= ?",
+                 (generation - POLICY_CHANGE_LOG_GENERATIONS,))
+    return generation
+
+
+def get_policy_generation(conn=None):
+    """
+    Returns the current policy generation (0 if the policy was never changed).
+    """
+    try:
+        if conn is None:
+            with sqlite3.connect(DB_PATH) as own_conn:
+                return get_policy_generation(own_conn)
+        row = conn.execute("SELECT value FROM policy_meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+    except sqlite3.Error:
+        return 0  # policy_meta does not exist yet
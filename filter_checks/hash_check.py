@@ -1,9 +1,7 @@
 import logging
-from api_interfaces.otx_api import OTXAPI
-from .db_utils import query_database
+from api_interfaces.aggregator import default_aggregator
+from .policy_snapshot import current_policy
 
-# OTX Instanz
-api_provider = OTXAPI()
 
 def check_file_hash_in_db(file_hash):
     """
@@ -11,12 +9,11 @@ def check_file_hash_in_db(file_hash):
     als IOC über OTX gemeldet wurde.
     """
     # Erst lokal prüfen
-    result = query_database("SELECT value FROM blocked_files WHERE file_hash = ?", (file_hash,))
-    if result:
+    if current_policy().contains('blocked_files', str(file_hash).lower()):
         return {'status': 'blocked', 'message': 'Blocked file hash (database)'}
 
     # Danach OTX prüfen
-    otx_result = api_provider.check_hash(file_hash)
+    otx_result = default_aggregator().check_hash(file_hash)
     if otx_result:
         return {
             'status': 'blocked',
@@ -0,0 +1,68 @@
+import json
+import sqlite3
+import threading
+import time
+from filter_checks import db_utils
+from filter_checks.db_utils import get_policy_generation
+
+POLICY_CHANGES_PAGE_SIZE = 500  # Generations returned per change feed page
+LONG_POLL_MAX = 30  # Seconds a change feed request may wait for a change
+POLL_INTERVAL = 0.25  # Seconds between checks for changes written by other processes
+
+_changed = threading.Condition()
+
+
+def changes_since(since, limit=POLICY_CHANGES_PAGE_SIZE, conn=None):
+    """Return the logged policy changes after generation ``since``.
+
+    Returns (current generation, generation the changes reach, changes), where changes is None
+    if they are no longer (or were never) logged and the follower must reload the full policy.
+    Changes come in whole generations, oldest first, at most ``limit`` generations at a time.
+    """
+    if conn is None:
+        with sqlite3.connect(db_utils.DB_PATH) as own_conn:
+            return changes_since(since, limit, own_conn)
+    generation = get_policy_generation(conn)
+    if since == generation:
+        return generation, since, []
+    if since > generation:
+        return generation, generation, None  # The policy database was recreated
+    try:
+        oldest = conn.execute("SELECT min(generation) FROM policy_changes").fetchone()[0]
+        until = min(generation, since + limit)
+        rows = conn.execute(
+            "SELECT generation, table_name, op, data FROM policy_changes "
+            "WHERE generation > ? AND generation <= ? ORDER BY seq",
+            (since, until)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return generation, generation, None  # No change log yet
+    if oldest is None or oldest > since + 1 or any(op == 'reset' for _, _, op, _ in rows):
+        return generation, generation, None
+    changes = [
+        {'generation': row_generation, 'table': table, 'op': op, 'data': json.loads(data)}
+        for row_generation, table, op, data in rows
+    ]
+    return generation, until, changes
+
+
+def notify_change():
+    """Wake up change feed requests waiting in this process."""
+    with _changed:
+        _changed.notify_all()
+
+
+def wait_for_change(since, timeout):
+    """Block until the policy generation differs from ``since`` or ``timeout`` seconds passed.
+
+    Writes by this process wake waiters immediately (see notify_change); writes by other processes
+    are noticed within POLL_INTERVAL. Returns the current generation.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        generation = get_policy_generation()
+        remaining = deadline - time.monotonic()
+        if generation != since or remaining <= 0:
+            return generation
+        with _changed:
+            _changed.wait(min(POLL_INTERVAL, remaining))
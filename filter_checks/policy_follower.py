@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+import time
+import requests
+from filter_checks.policy_changes import LONG_POLL_MAX
+from filter_checks.policy_snapshot import (POLICY_OVERLAY_MAX_ENTRIES, POLICY_SNAPSHOT_PATH, PolicySnapshot, PolicyView,
+                                           pull_snapshot)
+
+RETRY_DELAY = 5  # Seconds before retrying after the policy server could not be reached
+
+
+class PolicyFollower:
+    """Keeps a node's policy in sync with a policy server.
+
+    The full snapshot is downloaded once (and again whenever the server asks for a resync, or
+    once POLICY_OVERLAY_MAX_ENTRIES changes piled up); after that, changes are long-polled from
+    /policy/changes and applied in memory, so they arrive within seconds without reloading the
+    policy. ``base_url`` is the policy server's URL, or its /policy/snapshot URL.
+    """
+
+    def __init__(self, base_url, token, path=POLICY_SNAPSHOT_PATH, wait=LONG_POLL_MAX):
+        self.base_url = base_url.rstrip('/').removesuffix('/policy/snapshot')
+        self.token = token
+        self.path = path
+        self.wait = wait
+        self.view = None
+        self._thread = None
+        self._pid = None
+
+    def _reload(self):
+        try:
+            pull_snapshot(f"{self.base_url}/policy/snapshot", self.token, self.path)
+        except (requests.RequestException, OSError, ValueError) as e:
+            # Start from the local copy if the server is unreachable, the changes catch up later
+            if self.view is not None or not os.path.exists(self.path):
+                raise
+            logging.error(f"Pulling the policy snapshot failed, using the local copy: {e}")
+        self.view = PolicyView(PolicySnapshot(self.path, verify=True))
+        logging.info(f"Loaded policy snapshot generation {self.view.generation}")
+
+    def load(self):
+        """Return the current policy view, loading the snapshot first if needed."""
+        if self.view is None:
+            self._reload()
+        return self.view
+
+    def sync(self):
+        """Load the snapshot if needed, then wait for and apply the next changes."""
+        self.load()
+        response = requests.get(
+            f"{self.base_url}/policy/changes",
+            params={'since': self.view.generation, 'wait': self.wait},
+            headers={'Authorization': f'Bearer {self.token}'},
+            timeout=self.wait + 10,
+        )
+        response.raise_for_status()
+        data = response.json()
+        if data['resync']:
+            logging.info(f"Policy changes after generation {self.view.generation} are gone, reloading the snapshot")
+            self._reload()
+        elif data['changes'] or data['next'] != self.view.generation:
+            self.view.apply(data['changes'], data['next'])
+            if self.view.pending > POLICY_OVERLAY_MAX_ENTRIES:
+                self._reload()
+
+    def run(self):
+        while True:
+            try:
+                self.sync()
+            except (requests.RequestException, OSError, ValueError, KeyError) as e:
+                logging.error(f"Following the policy server failed: {e}")
+                time.sleep(RETRY_DELAY)
+
+    def start(self):
+        """Start following in a background thread (once per process)."""
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.run, name="policy-follower", daemon=True)
+            self._thread.start()
+        return self
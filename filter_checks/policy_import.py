@@ -0,0 +1,166 @@
+import csv
+import ipaddress
+import json
+import logging
+import os
+import sqlite3
+import time
+from filter_checks import db_utils
+from filter_checks.db_utils import bump_policy_generation
+
+IMPORT_BATCH_SIZE = int(os.getenv('POLICY_IMPORT_BATCH_SIZE', '50000'))  # Rows per executemany and progress report
+URL_TYPES = ('domain', 'hostname', 'url_prefix')
+# Names of the standard hosts file header lines, never imported as entries
+LOCAL_HOSTNAMES = {'localhost', 'localhost.localdomain', 'local', 'broadcasthost', 'ip6-localhost',
+                   'ip6-loopback', 'ip6-localnet', 'ip6-mcastprefix', 'ip6-allnodes', 'ip6-allrouters'}
+# Column defaults implied by an input format, for entries the caller gives no default for
+FORMAT_DEFAULTS = {'hosts': {'type': 'hostname'}}
+
+# Importable tables: column -> accepted input keys (the /set_policy JSON key first), and the unique column
+IMPORT_TABLES = {
+    'blocked_urls': ({'type': ('type',), 'value': ('url', 'value')}, 'value'),
+    'redirect_urls': ({'type': ('type',), 'value': ('source_url', 'value'), 'proxy': ('proxy',)}, 'value'),
+    'blocked_files': ({'file_hash': ('file_hash',), 'value': ('file_name', 'value')}, 'file_hash'),
+    'blocked_mimetypes': ({'value': ('mime_type', 'value')}, 'value'),
+}
+
+
+def parse_ndjson(lines):
+    """Yield one dict per JSON line; blank lines are skipped and invalid lines yield None."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield record if isinstance(record, dict) else None
+
+
+def parse_csv(lines):
+    """Yield one dict per CSV row, keyed by the header row."""
+    yield from csv.DictReader(lines)
+
+
+def _is_ip(value):
+    try:
+        ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_hosts(lines):
+    """Yield one dict per name of a hosts file or plain list ('0.0.0.0 a.com b.com' or 'a.com').
+
+    The address of hosts file lines is dropped, as are localhost names and IP literals.
+    """
+    for line in lines:
+        fields = line.split('#', 1)[0].split()
+        if fields and _is_ip(fields[0]):
+            fields = fields[1:]
+        for name in fields:
+            name = name.lower()
+            if name not in LOCAL_HOSTNAMES and not _is_ip(name):
+                yield {'value': name}
+
+
+PARSERS = {'ndjson': parse_ndjson, 'csv': parse_csv, 'hosts': parse_hosts}
+
+
+def format_defaults(input_format, defaults):
+    """Return ``defaults`` with the column defaults implied by the input format filled in."""
+    merged = dict(defaults or {})
+    for column, value in FORMAT_DEFAULTS.get(input_format, {}).items():
+        if merged.get(column) is None:
+            merged[column] = value
+    return merged
+
+
+def guess_format(path):
+    name = path.lower().removesuffix('.gz')
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return 'csv' if name.endswith('.csv') else 'hosts'
+
+
+def to_row(record, table, defaults=None):
+    """Return the column values of a parsed record in table order, or None if it is invalid."""
+    if not record:
+        return None
+    columns, _ = IMPORT_TABLES[table]
+    row = {}
+    for column, keys in columns.items():
+        value = next((record[key] for key in keys if record.get(key) not in (None, '')), None)
+        if value is None:
+            value = (defaults or {}).get(column)
+        if value is None:
+            return None
+        row[column] = str(value).strip()
+    if row.get('type', 'domain') not in URL_TYPES:
+        return None
+    return tuple(row.values())
+
+
+def import_policy(records, table, defaults=None, db_path=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Bulk-import parsed records into a policy table in a single transaction.
+
+    Rows are streamed with executemany into an unindexed temporary staging table, then copied
+    into the policy table in one INSERT ... SELECT ordered by its unique column, so its index is
+    built in key order instead of row by row. Rows whose key already exists (in the table or
+    earlier in the input) are skipped. The policy generation is bumped once, at the end.
+    ``progress(read, rejected)`` is called after every batch. Returns the import statistics.
+    """
+    if table not in IMPORT_TABLES:
+        raise ValueError(f"Invalid table name: {table}")
+    columns, key = IMPORT_TABLES[table]
+    names = ', '.join(columns)
+    started = time.time()
+    read = rejected = 0
+    conn = sqlite3.connect(db_path or db_utils.DB_PATH)
+    try:
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("DROP TABLE IF EXISTS temp.policy_import")
+        conn.execute(f"CREATE TEMP TABLE policy_import ({names})")
+        batch = []
+        for record in records:
+            read += 1
+            row = to_row(record, table, defaults)
+            if row is None:
+                rejected += 1
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.executemany(f"INSERT INTO policy_import VALUES ({', '.join('?' * len(columns))})", batch)
+                batch = []
+                if progress:
+                    progress(read, rejected)
+        conn.executemany(f"INSERT INTO policy_import VALUES ({', '.join('?' * len(columns))})", batch)
+
+        before = conn.total_changes
+        conn.execute(f"INSERT OR IGNORE INTO {table} ({names}) "
+                     f"SELECT {names} FROM policy_import ORDER BY {key}, rowid")
+        inserted = conn.total_changes - before
+        generation = bump_policy_generation(conn) if inserted else db_utils.get_policy_generation(conn)
+        conn.commit()
+        conn.execute("DROP TABLE temp.policy_import")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if progress:
+        progress(read, rejected)
+
+    stats = {
+        'table': table,
+        'read': read,
+        'rejected': rejected,
+        'inserted': inserted,
+        'duplicates': read - rejected - inserted,
+        'generation': generation,
+        'seconds': round(time.time() - started, 3),
+    }
+    logging.info(f"Policy import into {table}: {stats}")
+    return stats
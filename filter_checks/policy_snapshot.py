@@ -0,0 +1,405 @@
+import logging
+import mmap
+import os
+import requests
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from filter_checks import db_utils
+from filter_checks.db_utils import get_policy_generation
+from filter_checks.policy_changes import changes_since, notify_change
+
+POLICY_SNAPSHOT_PATH = os.getenv('POLICY_SNAPSHOT_PATH', 'policy.snapshot')
+POLICY_CHECK_INTERVAL = float(os.getenv('POLICY_CHECK_INTERVAL', '1'))  # Seconds between checks for a newer policy
+POLICY_OVERLAY_MAX_ENTRIES = int(os.getenv('POLICY_OVERLAY_MAX_ENTRIES', '10000'))  # Changes kept in memory before recompiling
+# Set on proxy nodes that follow a policy server (its URL or /policy/snapshot URL): the policy is then
+# loaded from the server's snapshot and kept current from its change feed, never compiled locally
+POLICY_SOURCE_URL = os.getenv('POLICY_SOURCE_URL')
+
+# Snapshot layout (all integers big-endian):
+#   header: magic (4s) | version (H) | generation (Q) | table count (H) | body length (Q) | body CRC-32 (I)
+#   body: directory, then the tables
+#   directory: per table its name (B length + ascii), flags (B) and offset (Q)
+#   table: count (I) | key offsets (count + 1 x I) | [payload offsets (count + 1 x I)] | keys | [payloads]
+# Keys are sorted bytewise so lookups binary-search the mapped file without loading it; the sorted
+# prefix tables double as a prefix index (see longest_prefix). Set tables carry no payload section.
+MAGIC = b'OSGP'
+VERSION = 2
+_HEADER = struct.Struct('>4sHQHQI')
+HAS_PAYLOADS = 1  # Table flag
+
+# Snapshot tables: name -> (query returning key rows, plus the payload for mapping tables; flags)
+SNAPSHOT_TABLES = {
+    'blocked_url_prefix': ("SELECT lower(value) FROM blocked_urls WHERE type = 'url_prefix'", 0),
+    'blocked_hostname': ("SELECT value FROM blocked_urls WHERE type = 'hostname'", 0),
+    'blocked_domain': ("SELECT value FROM blocked_urls WHERE type = 'domain'", 0),
+    'redirect_url_prefix': ("SELECT lower(value), proxy FROM redirect_urls WHERE type = 'url_prefix'", HAS_PAYLOADS),
+    'redirect_hostname': ("SELECT value, proxy FROM redirect_urls WHERE type = 'hostname'", HAS_PAYLOADS),
+    'redirect_domain': ("SELECT value, proxy FROM redirect_urls WHERE type = 'domain'", HAS_PAYLOADS),
+    'tls_excluded_hosts': ("SELECT hostname FROM tls_excluded_hosts", 0),
+    'blocked_files': ("SELECT lower(file_hash) FROM blocked_files", 0),  # Hex digests, matched case-insensitively
+    'blocked_mimetypes': ("SELECT value FROM blocked_mimetypes", 0),
+}
+
+
+def _pack_table(rows, flags=0):
+    entries = {}
+    for key, *payload in rows:
+        if key is not None:
+            # First row wins for duplicate keys, like the first match of the SQL lookups
+            entries.setdefault(str(key).encode('utf-8'), str(payload[0] if payload else '').encode('utf-8'))
+    keys = sorted(entries)
+    key_offsets, payload_offsets = [0], [0]
+    for key in keys:
+        key_offsets.append(key_offsets[-1] + len(key))
+        payload_offsets.append(payload_offsets[-1] + len(entries[key]))
+    count = len(keys)
+    if not flags & HAS_PAYLOADS:
+        return b''.join([struct.pack(f'>I{count + 1}I', count, *key_offsets), *keys])
+    return b''.join([
+        struct.pack(f'>I{count + 1}I{count + 1}I', count, *key_offsets, *payload_offsets),
+        *keys,
+        *(entries[key] for key in keys),
+    ])
+
+
+def compile_snapshot(db_path=None, path=POLICY_SNAPSHOT_PATH):
+    """Compile the policy tables into a snapshot file and atomically replace ``path``.
+
+    Returns the policy generation the snapshot was built from.
+    """
+    with sqlite3.connect(db_path or db_utils.DB_PATH) as conn:
+        conn.execute("BEGIN")  # One read transaction, so the tables and generation are consistent
+        generation = get_policy_generation(conn)
+        tables = {}
+        for name, (query, flags) in SNAPSHOT_TABLES.items():
+            try:
+                tables[name] = (flags, _pack_table(conn.execute(query), flags))
+            except sqlite3.OperationalError as e:
+                logging.warning(f"Policy table for {name} not available: {e}")
+                tables[name] = (flags, _pack_table([], flags))
+        conn.rollback()
+
+    directory_size = sum(1 + len(name) + 1 + 8 for name in tables)
+    offset = _HEADER.size + directory_size
+    parts = []
+    for name, (flags, data) in tables.items():
+        parts.append(struct.pack('>B', len(name)) + name.encode('ascii') + struct.pack('>BQ', flags, offset))
+        offset += len(data)
+    parts.extend(data for _, data in tables.values())
+    body = b''.join(parts)
+    header = _HEADER.pack(MAGIC, VERSION, generation, len(tables), len(body), zlib.crc32(body))
+
+    # Write and rename: readers keep their mapping of the old file, new readers map the new one
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(tmp_path, path)
+    return generation
+
+
+def read_generation(path=POLICY_SNAPSHOT_PATH):
+    """Return the policy generation of a snapshot file from its header, or None if it is not a snapshot."""
+    try:
+        with open(path, 'rb') as f:
+            magic, version, generation, *_ = _HEADER.unpack(f.read(_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return generation if magic == MAGIC and version == VERSION else None
+
+
+class PolicySnapshot:
+    """Read-only, memory-mapped view of a compiled policy snapshot.
+
+    The mapping is shared by all processes that map the same file (e.g. forked workers).
+    With ``verify`` the body checksum is checked, e.g. for snapshots downloaded from another node.
+    """
+
+    def __init__(self, path=POLICY_SNAPSHOT_PATH, verify=False):
+        self.path = path
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.file_id = (stat.st_ino, stat.st_mtime_ns)
+            if stat.st_size < _HEADER.size:
+                raise ValueError(f"{path} is not a policy snapshot")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.generation, table_count, body_length, checksum = _HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} policy snapshot")
+        if len(self._map) != _HEADER.size + body_length:
+            raise ValueError(f"{path} is truncated")
+        if verify and zlib.crc32(memoryview(self._map)[_HEADER.size:]) != checksum:
+            raise ValueError(f"{path} failed its checksum")
+        self.size = len(self._map)
+        self._tables = {}
+        position = _HEADER.size
+        for _ in range(table_count):
+            length = self._map[position]
+            name = self._map[position + 1:position + 1 + length].decode('ascii')
+            flags, offset = struct.unpack_from('>BQ', self._map, position + 1 + length)
+            (count,) = struct.unpack_from('>I', self._map, offset)
+            sections = 2 if flags & HAS_PAYLOADS else 1
+            keys_start = offset + 4 + 4 * sections * (count + 1)
+            payload_start = keys_start + struct.unpack_from('>I', self._map, offset + 4 + 4 * count)[0]
+            self._tables[name] = (offset, count, keys_start, payload_start if sections == 2 else None)
+            position += 1 + length + 1 + 8
+
+    def _key(self, table, i):
+        offset, count, keys_start, _ = table
+        start, end = struct.unpack_from('>2I', self._map, offset + 4 + 4 * i)
+        return self._map[keys_start + start:keys_start + end]
+
+    def _payload(self, table, i):
+        offset, count, _, payload_start = table
+        if payload_start is None:
+            return ''
+        start, end = struct.unpack_from('>2I', self._map, offset + 8 + 4 * count + 4 * i)
+        return self._map[payload_start + start:payload_start + end].decode('utf-8')
+
+    def _floor(self, table, key):
+        """Return the index of the largest key <= key, or -1."""
+        low, high = 0, table[1]
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(table, middle) <= key:
+                low = middle + 1
+            else:
+                high = middle
+        return low - 1
+
+    def get(self, name, key):
+        """Return the payload of key in a table ('' for plain sets), or None if it is missing."""
+        if not key:
+            return None
+        table = self._tables[name]
+        encoded = key.encode('utf-8')
+        i = self._floor(table, encoded)
+        return self._payload(table, i) if i >= 0 and self._key(table, i) == encoded else None
+
+    def contains(self, name, key):
+        return self.get(name, key) is not None
+
+    def chunks(self, size=1 << 20):
+        """Yield the snapshot file contents, e.g. to send it to another node."""
+        for start in range(0, self.size, size):
+            yield self._map[start:start + size]
+
+    def longest_prefix(self, name, text):
+        """Return the payload of the longest key that is a prefix of text, or None."""
+        entry = self.longest_prefix_entry(name, text)
+        return entry[1] if entry else None
+
+    def longest_prefix_entry(self, name, text):
+        """Return (key, payload) of the longest key that is a prefix of text, or None."""
+        table = self._tables[name]
+        encoded = text.encode('utf-8')
+        while True:
+            i = self._floor(table, encoded)
+            if i < 0:
+                return None
+            candidate = self._key(table, i)
+            if encoded.startswith(candidate):
+                return candidate.decode('utf-8'), self._payload(table, i)
+            # Every prefix of text that is a key is also a prefix of the common part
+            common = 0
+            while common < min(len(candidate), len(encoded)) and candidate[common] == encoded[common]:
+                common += 1
+            encoded = encoded[:common]
+
+
+def snapshot_entry(table, row):
+    """Return the snapshot table, key and payload of a policy table row, or None if it is not compiled."""
+    if table in ('blocked_urls', 'redirect_urls'):
+        entry_type = row.get('type')
+        if entry_type not in ('domain', 'hostname', 'url_prefix'):
+            return None
+        key = row['value'].lower() if entry_type == 'url_prefix' else row['value']
+        return f"{table.split('_')[0]}_{entry_type}", key, row.get('proxy', '')
+    key_column = {'tls_excluded_hosts': 'hostname', 'blocked_files': 'file_hash', 'blocked_mimetypes': 'value'}
+    if table not in key_column or row.get(key_column[table]) is None:
+        return None
+    key = row[key_column[table]]
+    return table, key.lower() if table == 'blocked_files' else key, ''
+
+
+class PolicyView:
+    """A policy snapshot plus the changes logged after it, applied in memory.
+
+    Lookups check the in-memory changes first, so the snapshot only has to be recompiled once
+    they pile up (POLICY_OVERLAY_MAX_ENTRIES) instead of after every write.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.generation = snapshot.generation
+        self.pending = 0  # Changes applied on top of the snapshot
+        self._added = {}  # table -> {key: payload}
+        self._removed = {}  # table -> keys deleted from the snapshot
+
+    def apply(self, changes, generation):
+        """Apply change feed entries (see policy_changes.changes_since) reaching ``generation``."""
+        for change in changes:
+            entry = snapshot_entry(change['table'], change['data'] or {})
+            if entry is None:
+                continue
+            name, key, payload = entry
+            if change['op'] == 'insert':
+                self._removed.get(name, set()).discard(key)
+                self._added.setdefault(name, {})[key] = payload
+            elif change['op'] == 'delete':
+                self._added.get(name, {}).pop(key, None)
+                self._removed.setdefault(name, set()).add(key)
+            self.pending += 1
+        self.generation = generation
+
+    def get(self, name, key):
+        if not key:
+            return None
+        added = self._added.get(name)
+        if added and key in added:
+            return added[key]
+        if key in self._removed.get(name, ()):
+            return None
+        return self.snapshot.get(name, key)
+
+    def contains(self, name, key):
+        return self.get(name, key) is not None
+
+    def longest_prefix(self, name, text):
+        best = None
+        added = self._added.get(name)
+        if added:
+            for length in range(len(text), 0, -1):
+                if text[:length] in added:
+                    best = text[:length], added[text[:length]]
+                    break
+        removed = self._removed.get(name, ())
+        while True:
+            entry = self.snapshot.longest_prefix_entry(name, text)
+            if entry is None or entry[0] not in removed:
+                break
+            text = entry[0][:-1]  # Deleted since the snapshot: look for a shorter prefix
+        if entry is not None and (best is None or len(entry[0]) > len(best[0])):
+            best = entry
+        return best[1] if best else None
+
+
+_current = None
+_checked = 0.0
+_follower = None
+_lock = threading.Lock()
+
+
+def current_policy():
+    """Return the current policy view, catching up with policy changes.
+
+    Checks happen at most every POLICY_CHECK_INTERVAL seconds: a snapshot file replaced by
+    another process is remapped, and changes logged since the snapshot are applied in memory.
+    The snapshot is recompiled when the change log cannot bridge the gap or too many changes
+    piled up. With POLICY_SOURCE_URL set, the view of the policy follower is returned instead.
+    """
+    global _current, _checked
+    view = _current
+    if view is not None and time.monotonic() - _checked < POLICY_CHECK_INTERVAL:
+        return view
+    with _lock:
+        if _current is not None and time.monotonic() - _checked < POLICY_CHECK_INTERVAL:
+            return _current
+        _current = _update(_current)
+        _checked = time.monotonic()
+        return _current
+
+
+def _update(view):
+    if POLICY_SOURCE_URL:
+        return policy_follower().load()
+    try:
+        stat = os.stat(POLICY_SNAPSHOT_PATH)
+        if view is None or (stat.st_ino, stat.st_mtime_ns) != view.snapshot.file_id:
+            view = PolicyView(PolicySnapshot(POLICY_SNAPSHOT_PATH))
+    except (OSError, ValueError):
+        view = None
+    if view is not None and not _catch_up(view):
+        view = None
+    if view is None:
+        compile_snapshot()
+        view = PolicyView(PolicySnapshot(POLICY_SNAPSHOT_PATH))
+    return view
+
+
+def policy_follower():
+    """Return the follower keeping this node's policy in sync with POLICY_SOURCE_URL.
+
+    Its background thread is not started here: the app starts it in every serving process.
+    """
+    global _follower
+    if _follower is None:
+        from filter_checks.policy_follower import PolicyFollower  # It builds on this module
+        _follower = PolicyFollower(POLICY_SOURCE_URL, os.getenv('POLICY_SOURCE_TOKEN', ''), POLICY_SNAPSHOT_PATH)
+    return _follower
+
+
+def _catch_up(view):
+    """Apply the logged changes after the view's generation; False if the snapshot must be recompiled."""
+    while True:
+        generation, reached, changes = changes_since(view.generation)
+        if changes is None:
+            return False
+        view.apply(changes, reached)
+        if view.pending > POLICY_OVERLAY_MAX_ENTRIES:
+            return False
+        if reached == generation:
+            return True
+
+
+def refresh_policy():
+    """Apply a policy change made by this process now, and wake up change feed waiters."""
+    global _current, _checked
+    with _lock:
+        _current = _update(_current)
+        _checked = time.monotonic()
+    notify_change()
+    return _current
+
+
+def current_snapshot():
+    """Return a snapshot compiled at the current generation, e.g. to export it to other nodes."""
+    global _current, _checked
+    view = current_policy()
+    if view.pending == 0:
+        return view.snapshot
+    with _lock:
+        if _current.pending:
+            compile_snapshot()
+            _current = PolicyView(PolicySnapshot(POLICY_SNAPSHOT_PATH))
+            _checked = time.monotonic()
+        return _current.snapshot
+
+
+def pull_snapshot(url, token, path=POLICY_SNAPSHOT_PATH, timeout=60):
+    """Download the policy snapshot from a policy server unless ``path`` already has its generation.
+
+    The download is verified before it atomically replaces ``path``. Returns the generation now
+    at ``path``, and whether it changed.
+    """
+    generation = read_generation(path)
+    params = {} if generation is None else {'since': generation}
+    with requests.get(url, params=params, headers={'Authorization': f'Bearer {token}'},
+                      stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return generation, False
+        response.raise_for_status()
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(1 << 20):
+                    f.write(chunk)
+            generation = PolicySnapshot(tmp_path, verify=True).generation
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return generation, True
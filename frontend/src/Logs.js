@@ -3,6 +3,8 @@ import axios from "axios";
 import { useAuth0 } from "@auth0/auth0-react";
 import { jwtDecode } from "jwt-decode";
 
+const PAGE_SIZE = 100; // Number of logs requested per page
+
 function Logs() {
   const { getAccessTokenSilently, isAuthenticated } = useAuth0(); // Get Auth0 token
   const [logs, setLogs] = useState([]);
@@ -10,49 +12,51 @@ function Logs() {
   const [filters, setFilters] = useState({});
   const [error, setError] = useState(null);
   const [loading, setLoading] = useState(false); // Loading state
+  const [nextCursor, setNextCursor] = useState(null); // Keyset cursor of the next page
+
+  // Function to fetch one page of logs from the API
+  const fetchLogs = async (cursor = null) => {
+    setLoading(true); // Set loading to true when fetching data
+    try {
+      // Get the token from Auth0
+      const token = await getAccessTokenSilently();
+      if (!token) {
+        setError("No token available");
+        return;
+      }
 
-  useEffect(() => {
-    if (isAuthenticated) {
-      // Function to fetch logs from the API
-      const fetchLogs = async () => {
-        setLoading(true); // Set loading to true when fetching data
-        try {
-          // Get the token from Auth0
-          const token = await getAccessTokenSilently();
-          if (!token) {
-            setError("No token available");
-            return;
-          }
-
-
-          // Send the token with the request
-          const response = await axios.get("http://localhost:5000/logs", {
-            headers: {
-            'Authorization': `Bearer ${token}`, // Attach token here
-            },
-          });
-
+      // Send the token with the request
+      const response = await axios.get("http://localhost:5000/logs", {
+        headers: {
+        'Authorization': `Bearer ${token}`, // Attach token here
+        },
+        params: { limit: PAGE_SIZE, ...(cursor ? { cursor } : {}) },
+      });
 
-          // Handle the API response
-          const extractedLogs = response.data?.logs?.logs || [];
-          if (Array.isArray(extractedLogs)) {
-            setLogs(extractedLogs);
-            if (extractedLogs.length > 0) {
-              const firstLog = extractedLogs[0];
-              setColumns(Object.keys(firstLog)); // Dynamically set columns
-              setFilters(Object.fromEntries(Object.keys(firstLog).map(key => [key, ""])));
-            }
-          }
-        } catch (error) {
-          setError("Error fetching logs: " + error.message);
-          console.error("Error fetching logs:", error);
-        } finally {
-          setLoading(false); // Set loading to false after the data is fetched
+      // Handle the API response
+      const extractedLogs = response.data?.logs?.logs || [];
+      if (Array.isArray(extractedLogs)) {
+        setLogs(prevLogs => (cursor ? [...prevLogs, ...extractedLogs] : extractedLogs));
+        if (!cursor && extractedLogs.length > 0) {
+          const firstLog = extractedLogs[0];
+          setColumns(Object.keys(firstLog)); // Dynamically set columns
+          setFilters(Object.fromEntries(Object.keys(firstLog).map(key => [key, ""])));
         }
-      };
+      }
+      setNextCursor(response.data?.logs?.next_cursor || null);
+    } catch (error) {
+      setError("Error fetching logs: " + error.message);
+      console.error("Error fetching logs:", error);
+    } finally {
+      setLoading(false); // Set loading to false after the data is fetched
+    }
+  };
 
+  useEffect(() => {
+    if (isAuthenticated) {
       fetchLogs();
     }
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [getAccessTokenSilently, isAuthenticated]);
 
   const checkIfValueMatchesFilter = (value, filterValue) => {
@@ -204,6 +208,15 @@ function Logs() {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <button
+              onClick={() => fetchLogs(nextCursor)}
+              disabled={loading}
+              className="mt-4 px-4 py-2 bg-blue-500 text-white rounded"
+            >
+              Load more
+            </button>
+          )}
         </div>
       )}
     </div>
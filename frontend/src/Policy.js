@@ -2,6 +2,8 @@ import React, { useState, useEffect } from "react";
 import axios from "axios";
 import { useAuth0 } from "@auth0/auth0-react";
 
+const PAGE_SIZE = 100; // Number of policy entries requested per page
+
 const Policy = () => {
   const { getAccessTokenSilently, isAuthenticated } = useAuth0(); // Get Auth0 token
   const [table, setTable] = useState("blocked_urls");
@@ -12,6 +14,9 @@ const Policy = () => {
   const [columns, setColumns] = useState([]);
   const [showAddForm, setShowAddForm] = useState(false);
   const [newItem, setNewItem] = useState({});
+  const [search, setSearch] = useState(""); // Server-side search on the table's key column
+  const [submittedSearch, setSubmittedSearch] = useState(""); // Search the loaded pages were fetched with
+  const [nextCursor, setNextCursor] = useState(null); // Keyset cursor of the next page
 
   const tableOptions = [
     { label: "Blocked URLs", value: "blocked_urls" },
@@ -22,7 +27,8 @@ const Policy = () => {
     { label: "Category Policy", value: "category_policy" },
   ];
 
-  const fetchData = async () => {
+  // Later pages are fetched with the search of the first one, not with what is typed in the box since
+  const fetchData = async (cursor = null, query = submittedSearch) => {
     setLoading(true);
     setError(null);
     try {
@@ -32,10 +38,12 @@ const Policy = () => {
         return;
       }
 
-      const response = await axios.get(`http://localhost:5000/get_policy?table=${table}`, {
+      // The browser revalidates with the ETag, unchanged tables are answered with 304
+      const response = await axios.get("http://localhost:5000/get_policy", {
         headers: {
           'Authorization': `Bearer ${token}`, // Attach token here
         },
+        params: { table, limit: PAGE_SIZE, ...(query ? { search: query } : {}), ...(cursor ? { cursor } : {}) },
       });
 
       const fetchedData = response.data.data;
@@ -64,13 +72,19 @@ const Policy = () => {
         return formattedRow;
       });
 
-      setData(formattedData);
+      setData(prevData => (cursor ? [...prevData, ...formattedData] : formattedData));
+      setNextCursor(response.data.next_cursor || null);
 
-      if (formattedData.length > 0) {
+      if (!cursor && formattedData.length > 0) {
         setColumns(Object.keys(formattedData[0]));
         setFilters(Object.fromEntries(Object.keys(formattedData[0]).map(key => [key, ""])));
       }
     } catch (err) {
+      if (err.response?.status === 404) {
+        setData([]); // Empty table
+        setNextCursor(null);
+        return;
+      }
       setError("Error fetching data from the server");
     } finally {
       setLoading(false);
@@ -81,8 +95,15 @@ const Policy = () => {
     if (isAuthenticated) {
       fetchData();
     }
+    // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [isAuthenticated, table]);
 
+  const handleSearch = (e) => {
+    e.preventDefault();
+    setSubmittedSearch(search);
+    fetchData(null, search);
+  };
+
   const getUniqueValues = (key) => {
     let values = [];
     data.forEach(item => {
@@ -224,6 +245,20 @@ const Policy = () => {
         ))}
       </select>
 
+      {/* Server-side search */}
+      <form onSubmit={handleSearch} className="mb-4 flex space-x-2">
+        <input
+          type="text"
+          value={search}
+          onChange={(e) => setSearch(e.target.value)}
+          placeholder="Search entries"
+          className="p-2 border border-gray-300 rounded-lg"
+        />
+        <button type="submit" className="px-4 py-2 bg-blue-500 text-white rounded-lg hover:bg-blue-600">
+          Search
+        </button>
+      </form>
+
       {/* Show Add Item Form */}
       <div className="mb-4">
         <button
@@ -334,6 +369,15 @@ const Policy = () => {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <button
+              onClick={() => fetchData(nextCursor)}
+              disabled={loading}
+              className="mt-4 px-4 py-2 bg-blue-500 text-white rounded"
+            >
+              Load more
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -1,4 +1,5 @@
 import sqlite3
+from filter_checks.db_utils import bump_policy_generation
 
 conn = sqlite3.connect("url_filter.db")
 cursor = conn.cursor()
@@ -24,5 +25,7 @@ cursor.execute("INSERT INTO blocked_mimetypes (value) VALUES ('application/x-msd
 # Insert TLS exclusions
 cursor.execute("INSERT INTO tls_excluded_hosts (hostname) VALUES ('www.google.com')")
 
+# Compiled policy snapshots pick up the new entries
+bump_policy_generation(conn)
 conn.commit()
 conn.close()
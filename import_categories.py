@@ -0,0 +1,24 @@
+import argparse
+import logging
+from filter_checks.category_store import CATEGORY_DB_PATH, DomainCategoryStore
+from filter_checks.db_utils import load_category_policy
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import category list files (lines of 'domain,category', or bare domains with --category) "
+                    "into the local domain category database.")
+    parser.add_argument('paths', nargs='+', help="Category list files to import")
+    parser.add_argument('--category', help="Category ID or name of files listing bare domains")
+    parser.add_argument('--db', default=CATEGORY_DB_PATH, help="Category database path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    category_map = load_category_policy()
+    store = DomainCategoryStore(args.db)
+    added = sum(store.import_file(path, category_map, args.category) for path in args.paths)
+    print(f"Imported {added} domain categories. Store now holds {store.stats()}.")
+
+
+if __name__ == "__main__":
+    main()
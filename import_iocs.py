@@ -0,0 +1,22 @@
+import argparse
+import logging
+from api_interfaces.ioc_store import IOC_DB_PATH, LocalIOCStore
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Import exported threat feeds (OTX pulse JSON, STIX bundles, plain domain/hash lists) "
+                    "into the local IOC store.")
+    parser.add_argument('paths', nargs='+', help="Feed files to import")
+    parser.add_argument('--db', default=IOC_DB_PATH, help="IOC database path")
+    parser.add_argument('--force', action='store_true', help="Re-read files that were imported before")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = LocalIOCStore(args.db)
+    added = sum(store.import_file(path, force=args.force) for path in args.paths)
+    print(f"Imported {added} new IOCs. Store now holds {store.stats()}.")
+
+
+if __name__ == "__main__":
+    main()
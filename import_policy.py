@@ -0,0 +1,36 @@
+import argparse
+import gzip
+import logging
+import sys
+from filter_checks import db_utils
+from filter_checks.policy_import import IMPORT_TABLES, PARSERS, format_defaults, guess_format, import_policy
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk-import blocklists (NDJSON, CSV with a header row, or hosts files) into a policy table.")
+    parser.add_argument('paths', nargs='+', help="Files to import, optionally gzip-compressed")
+    parser.add_argument('--table', required=True, choices=sorted(IMPORT_TABLES))
+    parser.add_argument('--format', choices=sorted(PARSERS), help="Input format (default: guessed from the extension)")
+    parser.add_argument('--type', help="Entry type for rows without one: domain, hostname or url_prefix (hosts files: hostname)")
+    parser.add_argument('--proxy', help="Redirect proxy for rows without one (redirect_urls)")
+    parser.add_argument('--db', default=db_utils.DB_PATH, help="Policy database path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    defaults = {'type': args.type, 'proxy': args.proxy, 'value': '' if args.table == 'blocked_files' else None}
+    for path in args.paths:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8', errors='replace', newline='') as f:
+            input_format = args.format or guess_format(path)
+            stats = import_policy(PARSERS[input_format](f), args.table, format_defaults(input_format, defaults),
+                                  db_path=args.db,
+                                  progress=lambda read, rejected: print(
+                                      f"\r{path}: {read} rows read, {rejected} rejected", end='', file=sys.stderr))
+        print(file=sys.stderr)
+        print(f"{path}: {stats['inserted']} added, {stats['duplicates']} duplicates, "
+              f"{stats['rejected']} rejected in {stats['seconds']}s (policy generation {stats['generation']})")
+
+
+if __name__ == "__main__":
+    main()
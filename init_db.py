@@ -1,4 +1,5 @@
 import sqlite3
+from filter_checks.db_utils import bump_policy_generation
 
 DB_PATH = "url_filter.db"  # Ensure this matches your main script
 
@@ -53,6 +54,8 @@ def init_db():
 
     ''')
 
+    # Compiled policy snapshots of the old tables are stale now
+    bump_policy_generation(conn)
     conn.commit()
     conn.close()
     print("Database initialized successfully!")
@@ -1,96 +1,512 @@
+import atexit
 import sqlite3
 import logging
+import os
+import threading
 import time
 import json
+import random
+
+# Columns returned for each log entry, in SELECT order
+LOG_COLUMNS = ('id', 'level', 'user', 'request', 'response', 'client_ip', 'user_agent', 'method',
+               'status_code', 'response_time', 'category', 'timestamp', 'hit_count', 'last_seen')
+
+# Indexes created on every partition, backing the keyset pagination and the filters of get_logs()
+LOG_INDEXES = {
+    'timestamp': '(timestamp, id)',
+    'user': '(user, id)',
+    'category': '(category, id)',
+    'status_code': '(status_code, id)',
+    'level': '(level, id)',
+}
+
+LOG_RETENTION_DAYS = 30  # Days of logs kept before a partition is dropped
+LOG_MAINTENANCE_INTERVAL = 3600  # Seconds between retention/compaction runs
+
+# Rollup granularities and the strftime format of their bucket keys
+ROLLUP_GRANULARITIES = {
+    'minute': '%Y-%m-%d %H:%M',
+    'hour': '%Y-%m-%d %H:00',
+}
+ROLLUP_DIMENSIONS = ('category', 'status_code', 'user', 'verdict')
+ROLLUP_FLUSH_INTERVAL = 1.0  # Seconds rollup deltas are accumulated in memory before being written
+MINUTE_ROLLUP_RETENTION_DAYS = 7  # Minute buckets are only kept for recent dashboards
+
+# Columns added to partitions after their introduction, with their definitions
+PARTITION_MIGRATIONS = {
+    'hit_count': 'INTEGER NOT NULL DEFAULT 1',
+    'last_seen': 'TEXT',
+}
+DEDUPE_VERDICTS = ('allowed',)  # Only these verdicts are folded or sampled, blocks and errors are always kept
+DEDUPE_MAX_KEYS = 100000  # Bound on the number of recent rows remembered for folding
 
 class LogDB:
-    def __init__(self, db_path='log_database.db'):
+    """Log storage partitioned by day.
+
+    Every day gets its own ``logs_YYYYMMDD`` table, registered in ``log_partitions``.
+    Expired days are removed with a single DROP TABLE, and queries over a time range
+    only touch the partitions of the days involved. A background thread applies the
+    retention period and compacts partitions once they have gone cold.
+
+    Per-minute and per-hour rollups (count and response time aggregates by category,
+    status code, user and verdict) are accumulated in memory as entries are logged and
+    upserted into ``log_rollups`` in batches, so dashboards never scan raw rows.
+
+    Optionally, repeated "allowed" entries with the same user, path, method and request
+    within ``dedupe_window`` seconds are folded into the first row (``hit_count`` and
+    ``last_seen`` are updated instead of inserting), and new "allowed" rows are only
+    written with probability ``allow_sample_rate``. Other verdicts are always logged in
+    full, and the rollups always count every entry.
+    """
+
+    def __init__(self, db_path='log_database.db', retention_days=LOG_RETENTION_DAYS,
+                 maintenance_interval=LOG_MAINTENANCE_INTERVAL, dedupe_window=0, allow_sample_rate=1.0):
         self.db_path = db_path
+        self.retention_days = retention_days
+        self.maintenance_interval = maintenance_interval
+        self.dedupe_window = dedupe_window
+        self.allow_sample_rate = allow_sample_rate
+        self._recent_rows = {}
+        self._known_partitions = set()
+        self._maintenance_pid = None
+        self._lock = threading.Lock()
+        self._pending_rollups = {}
+        self._rollups_flushed_at = time.time()
         self._create_table()
+        atexit.register(self._flush_rollups)
 
     def _create_table(self):
-        """Create the log table if it doesn't exist."""
+        """Create the partition registry if it doesn't exist."""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute('''CREATE TABLE IF NOT EXISTS logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT,
-                    level TEXT,
-                    user TEXT,
-                    request TEXT,
-                    response TEXT,
-                    client_ip TEXT,
-                    user_agent TEXT,
-                    method TEXT,
-                    status_code INTEGER,
-                    response_time REAL,
-                    category TEXT,
-                    error_message TEXT
+                # Only effective on a new database: lets dropped partitions be returned to the OS
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute('''CREATE TABLE IF NOT EXISTS log_partitions (
+                    day TEXT PRIMARY KEY,
+                    table_name TEXT NOT NULL,
+                    compacted INTEGER NOT NULL DEFAULT 0
                 )''')
+                cursor.execute('''CREATE TABLE IF NOT EXISTS log_rollups (
+                    granularity TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    status_code INTEGER NOT NULL,
+                    user TEXT NOT NULL,
+                    verdict TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    total_response_time REAL NOT NULL,
+                    min_response_time REAL,
+                    max_response_time REAL,
+                    PRIMARY KEY (granularity, bucket, category, status_code, user, verdict)
+                ) WITHOUT ROWID''')
+                # Bring partitions created by older versions up to the current schema
+                for (table,) in cursor.execute("SELECT table_name FROM log_partitions").fetchall():
+                    existing = {info[1] for info in cursor.execute(f"PRAGMA table_info({table})")}
+                    for column, definition in PARTITION_MIGRATIONS.items():
+                        if column not in existing:
+                            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                self._migrate_legacy_table(conn)
         except sqlite3.Error as e:
             logging.error(f"Error creating log table: {e}")
 
-    def get_all_logs(self):
-        """Retrieve all log entries from the database."""
+    def _migrate_legacy_table(self, conn):
+        """Move the rows of the unpartitioned ``logs`` table of older versions into the day partitions.
+
+        Runs in the transaction of _create_table, so the legacy table is only dropped once every
+        row has been copied. Rows without a usable timestamp are kept in a ``logs_legacy`` table.
+        """
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'logs'").fetchone():
+            return
+        moved = 0
+        for (date,) in conn.execute("SELECT DISTINCT substr(timestamp, 1, 10) FROM logs").fetchall():
+            day = self._day_key(date or '')
+            if len(day) != 8 or not day.isdigit():
+                continue
+            table = self._ensure_partition(conn, day)
+            moved += conn.execute(f'''INSERT INTO {table} (timestamp, level, user, request, response, client_ip,
+                                                       user_agent, method, status_code, response_time,
+                                                       category, error_message, last_seen)
+                                      SELECT timestamp, level, user, request, response, client_ip,
+                                             user_agent, method, status_code, response_time,
+                                             category, error_message, timestamp
+                                      FROM logs WHERE substr(timestamp, 1, 10) = ? ORDER BY id''',
+                                  (date,)).rowcount
+            conn.execute("DELETE FROM logs WHERE substr(timestamp, 1, 10) = ?", (date,))
+        if conn.execute("SELECT 1 FROM logs LIMIT 1").fetchone():
+            conn.execute("ALTER TABLE logs RENAME TO logs_legacy")
+            logging.warning("Legacy log entries without a valid timestamp were kept in logs_legacy")
+        else:
+            conn.execute("DROP TABLE logs")
+        logging.info(f"Migrated {moved} log entries from the legacy logs table into day partitions")
+
+    @staticmethod
+    def _day_key(timestamp):
+        """Return the partition key ('YYYYMMDD') of a 'YYYY-MM-DD ...' timestamp."""
+        return timestamp[:10].replace('-', '')
+
+    def _ensure_partition(self, conn, day):
+        """Create the partition table of a day, with its indexes, if needed."""
+        table = f"logs_{day}"
+        if day in self._known_partitions:
+            return table
+        cursor = conn.cursor()
+        cursor.execute(f'''CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            level TEXT,
+            user TEXT,
+            request TEXT,
+            response TEXT,
+            client_ip TEXT,
+            user_agent TEXT,
+            method TEXT,
+            status_code INTEGER,
+            response_time REAL,
+            category TEXT,
+            error_message TEXT,
+            hit_count INTEGER NOT NULL DEFAULT 1,
+            last_seen TEXT
+        )''')
+        for name, columns in LOG_INDEXES.items():
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{name} ON {table} {columns}")
+        cursor.execute("INSERT OR IGNORE INTO log_partitions (day, table_name) VALUES (?, ?)", (day, table))
+        self._known_partitions.add(day)
+        return table
+
+    def _partitions(self, conn, since=None, until=None):
+        """Return (day, table) pairs overlapping the time range, newest first."""
+        query = "SELECT day, table_name FROM log_partitions WHERE day >= ? AND day <= ? ORDER BY day DESC"
+        low = self._day_key(since) if since else '00000000'
+        high = self._day_key(until) if until else '99999999'
+        return conn.execute(query, (low, high)).fetchall()
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """Split a 'YYYYMMDD:id' cursor into its parts. Raises ValueError if malformed."""
+        day, _, last_id = cursor.partition(':')
+        if len(day) != 8 or not day.isdigit():
+            raise ValueError(f"Invalid log cursor: {cursor}")
+        return day, int(last_id)
+
+    @staticmethod
+    def _filter_conditions(user=None, category=None, status_code=None, level=None, since=None, until=None):
+        """Build the WHERE conditions and parameters shared by all log queries."""
+        conditions = []
+        params = []
+        for column, value in (('user', user), ('category', category),
+                              ('status_code', status_code), ('level', level)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            conditions.append("timestamp <= ?")
+            params.append(until)
+        return conditions, params
+
+    def get_logs(self, limit=100, cursor=None, user=None, category=None, status_code=None,
+                 level=None, since=None, until=None):
+        """Retrieve one page of log entries, newest first.
+
+        Pagination is keyset based: pass the ``next_cursor`` of the previous page
+        as ``cursor`` to continue. Filters map onto the indexes of each partition.
+        """
+        conditions, params = self._filter_conditions(user, category, status_code, level, since, until)
+        cursor_day, cursor_id = self.parse_cursor(cursor) if cursor else (None, None)
         try:
+            rows = []
             with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, level, user, request, response, client_ip, user_agent, method, status_code, response_time, category, timestamp FROM logs ORDER BY timestamp DESC")
-                logs = cursor.fetchall()
-                logging.info(f"Retrieved {len(logs)} logs from the database")
-
-                # Convert the logs into a more readable format (a list of dictionaries)
-                log_entries = []
-                for log in logs:
-                    log_entry = {
-                        'id': log[0],
-                        'level': log[1],
-                        'user' : log[2],
-                        'request': log[3],
-                        'response': log[4],
-                        'client_ip': log[5],
-                        'user_agent': log[6],
-                        'method': log[7],
-                        'status_code': log[8],
-                        'response_time': log[9],
-                        'category': log[10],
-                        'timestamp': log[11]
-                    }
-
-                    # Deserialize 'request', 'response', and 'client_ip' if in JSON format
-                    for field in ['request', 'response']:
-                        if log_entry[field]:
-                            try:
-                                log_entry[field] = json.loads(log_entry[field])
-                            except json.JSONDecodeError as e:
-                        #        logging.warning(f"Failed to decode '{field}' field as JSON: {e}")
-                                pass
-
-                    log_entries.append(log_entry)
-
-                return {'logs': log_entries, 'status': 'success'}
+                for day, table in self._partitions(conn, since, until):
+                    if cursor_day and day > cursor_day:
+                        continue
+                    part_conditions, part_params = list(conditions), list(params)
+                    if day == cursor_day:
+                        part_conditions.append("id < ?")
+                        part_params.append(cursor_id)
+                    where = f"WHERE {' AND '.join(part_conditions)}" if part_conditions else ""
+                    # Fetch one extra row to know whether another page exists
+                    remaining = limit + 1 - len(rows)
+                    query = f"SELECT {', '.join(LOG_COLUMNS)} FROM {table} {where} ORDER BY id DESC LIMIT ?"
+                    rows.extend((day, row) for row in conn.execute(query, part_params + [remaining]))
+                    if len(rows) > limit:
+                        break
+            has_more = len(rows) > limit
+            # Only the rows of the returned page are decoded
+            log_entries = [self._row_to_entry(row) for _, row in rows[:limit]]
+            next_cursor = f"{rows[limit - 1][0]}:{log_entries[-1]['id']}" if has_more else None
+            return {'logs': log_entries, 'next_cursor': next_cursor, 'status': 'success'}
         except sqlite3.Error as e:
             logging.error(f"SQLite error retrieving logs: {e}")
-            return {'logs': [], 'status': 'error'}
-        except Exception as e:
-            logging.error(f"Unexpected error: {e}")
-            return {'logs': [], 'status': 'error'}
+            return {'logs': [], 'next_cursor': None, 'status': 'error'}
 
+    def iter_logs(self, user=None, category=None, status_code=None, level=None, since=None, until=None,
+                  batch_size=1000, decode=True):
+        """Yield matching log entries, oldest first, without loading them all into memory.
+
+        Rows are read through a server-side cursor in batches of ``batch_size``, one
+        partition at a time. With ``decode=False`` the raw row tuples are yielded.
+        """
+        conditions, params = self._filter_conditions(user, category, status_code, level, since, until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for _, table in reversed(self._partitions(conn, since, until)):
+                cursor = conn.execute(f"SELECT {', '.join(LOG_COLUMNS)} FROM {table} {where} ORDER BY id", params)
+                while rows := cursor.fetchmany(batch_size):
+                    for row in rows:
+                        yield self._row_to_entry(row) if decode else row
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_entry(row):
+        """Convert a result row into a log dictionary, decoding JSON fields."""
+        log_entry = dict(zip(LOG_COLUMNS, row))
+        # Deserialize 'request' and 'response' if in JSON format
+        for field in ['request', 'response']:
+            if log_entry[field]:
+                try:
+                    log_entry[field] = json.loads(log_entry[field])
+                except json.JSONDecodeError:
+                    pass
+        return log_entry
 
     def log(self, level, user, request, response, client_ip=None, user_agent=None, method=None,
-            status_code=None, response_time=None, category=None, error_message=None):
-        """Insert a log entry into the database."""
-        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+            status_code=None, response_time=None, category=None, error_message=None, verdict=None):
+        """Insert a log entry into the partition of the current day and account it in the rollups."""
+        self._start_maintenance()
+        now = time.localtime()
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', now)
+        self._add_to_rollups(now, category, status_code, user, verdict, response_time)
+        reducible = verdict in DEDUPE_VERDICTS
+        dedupe_key = (user, category, method, status_code, request) if reducible and self.dedupe_window else None
         try:
             with sqlite3.connect(self.db_path) as conn:
+                if time.time() - self._rollups_flushed_at >= ROLLUP_FLUSH_INTERVAL:
+                    self._flush_rollups(conn)
+                table = self._ensure_partition(conn, self._day_key(timestamp))
                 cursor = conn.cursor()
-                cursor.execute('''INSERT INTO logs (timestamp, level, user, request, response, client_ip,
+                if dedupe_key and self._fold_repeat(cursor, table, dedupe_key, timestamp):
+                    conn.commit()
+                    return
+                if reducible and self.allow_sample_rate < 1.0 and random.random() >= self.allow_sample_rate:
+                    conn.commit()
+                    return
+                cursor.execute(f'''INSERT INTO {table} (timestamp, level, user, request, response, client_ip,
                                                    user_agent, method, status_code, response_time,
-                                                   category, error_message)
-                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                                   category, error_message, last_seen)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                                (timestamp, level, user, request, response, client_ip, user_agent, method,
-                                status_code, response_time, category, error_message))
+                                status_code, response_time, category, error_message, timestamp))
+                if dedupe_key:
+                    self._remember_row(dedupe_key, table, cursor.lastrowid)
                 conn.commit()
         except sqlite3.Error as e:
             logging.error(f"Error inserting log entry: {e}")
+
+    def _fold_repeat(self, cursor, table, key, timestamp):
+        """Count a repeat into the row logged for the same key within the window, if any."""
+        with self._lock:
+            recent = self._recent_rows.get(key)
+        if not recent:
+            return False
+        recent_table, row_id, first_seen = recent
+        if recent_table != table or time.time() - first_seen > self.dedupe_window:
+            return False
+        cursor.execute(f"UPDATE {table} SET hit_count = hit_count + 1, last_seen = ? WHERE id = ?",
+                       (timestamp, row_id))
+        return cursor.rowcount == 1
+
+    def _remember_row(self, key, table, row_id):
+        """Remember a newly inserted row as the target for folding repeats of its key."""
+        now = time.time()
+        with self._lock:
+            if len(self._recent_rows) >= DEDUPE_MAX_KEYS:
+                self._recent_rows = {k: v for k, v in self._recent_rows.items()
+                                     if now - v[2] <= self.dedupe_window}
+                if len(self._recent_rows) >= DEDUPE_MAX_KEYS:
+                    self._recent_rows.clear()
+            self._recent_rows[key] = (table, row_id, now)
+
+    def _add_to_rollups(self, now, category, status_code, user, verdict, response_time):
+        """Accumulate one entry into the pending rollup deltas."""
+        response_time = response_time or 0.0
+        dimensions = (category or '', status_code or 0, user or '', verdict or '')
+        with self._lock:
+            for granularity, bucket_format in ROLLUP_GRANULARITIES.items():
+                key = (granularity, time.strftime(bucket_format, now)) + dimensions
+                delta = self._pending_rollups.get(key)
+                if delta is None:
+                    self._pending_rollups[key] = [1, response_time, response_time, response_time]
+                else:
+                    delta[0] += 1
+                    delta[1] += response_time
+                    delta[2] = min(delta[2], response_time)
+                    delta[3] = max(delta[3], response_time)
+
+    def _flush_rollups(self, conn=None):
+        """Upsert the pending rollup deltas in one batch and commit it.
+
+        If the write fails, the batch is merged back into the pending deltas for the next flush.
+        Also runs at interpreter exit, so deltas of the last interval are not lost on shutdown.
+        """
+        with self._lock:
+            pending, self._pending_rollups = self._pending_rollups, {}
+            self._rollups_flushed_at = time.time()
+        if not pending:
+            return
+        if conn is None:
+            try:
+                with sqlite3.connect(self.db_path) as own_conn:
+                    return self._flush_rollups_batch(own_conn, pending)
+            except sqlite3.Error as e:
+                logging.error(f"Error opening the log database to flush rollups: {e}")
+                return self._restore_rollups(pending)
+        self._flush_rollups_batch(conn, pending)
+
+    def _flush_rollups_batch(self, conn, pending):
+        try:
+            conn.executemany('''INSERT INTO log_rollups (granularity, bucket, category, status_code, user, verdict,
+                                                     count, total_response_time, min_response_time, max_response_time)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                              ON CONFLICT (granularity, bucket, category, status_code, user, verdict) DO UPDATE SET
+                                  count = count + excluded.count,
+                                  total_response_time = total_response_time + excluded.total_response_time,
+                                  min_response_time = MIN(min_response_time, excluded.min_response_time),
+                                  max_response_time = MAX(max_response_time, excluded.max_response_time)''',
+                             [key + tuple(delta) for key, delta in pending.items()])
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            logging.error(f"Error flushing {len(pending)} rollup deltas, keeping them for the next flush: {e}")
+            self._restore_rollups(pending)
+
+    def _restore_rollups(self, pending):
+        """Merge deltas that could not be written back into the pending ones."""
+        with self._lock:
+            for key, (count, total, minimum, maximum) in pending.items():
+                delta = self._pending_rollups.get(key)
+                if delta is None:
+                    self._pending_rollups[key] = [count, total, minimum, maximum]
+                else:
+                    delta[0] += count
+                    delta[1] += total
+                    delta[2] = min(delta[2], minimum)
+                    delta[3] = max(delta[3], maximum)
+
+    def get_stats(self, granularity='hour', since=None, until=None, group_by=ROLLUP_DIMENSIONS):
+        """Return traffic aggregates per time bucket, read from the rollups only.
+
+        ``since`` and ``until`` are 'YYYY-MM-DD HH:MM' prefixes compared against bucket keys,
+        ``group_by`` is any subset of ROLLUP_DIMENSIONS.
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Invalid granularity: {granularity}")
+        if any(dimension not in ROLLUP_DIMENSIONS for dimension in group_by):
+            raise ValueError(f"Invalid group_by: {group_by}")
+        conditions = ["granularity = ?"]
+        params = [granularity]
+        if since:
+            conditions.append("bucket >= ?")
+            params.append(since[:16])
+        if until:
+            conditions.append("bucket <= ?")
+            params.append(until[:16])
+        columns = ['bucket'] + list(group_by)
+        query = f'''SELECT {', '.join(columns)}, SUM(count), SUM(total_response_time),
+                          MIN(min_response_time), MAX(max_response_time)
+                   FROM log_rollups WHERE {' AND '.join(conditions)}
+                   GROUP BY {', '.join(columns)} ORDER BY bucket'''
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                self._flush_rollups(conn)
+                rows = conn.execute(query, params).fetchall()
+        except sqlite3.Error as e:
+            logging.error(f"SQLite error retrieving stats: {e}")
+            return {'stats': [], 'status': 'error'}
+        stats = []
+        for row in rows:
+            count, total, minimum, maximum = row[len(columns):]
+            entry = dict(zip(columns, row))
+            entry.update({
+                'count': count,
+                'avg_response_time': total / count if count else None,
+                'min_response_time': minimum,
+                'max_response_time': maximum,
+            })
+            stats.append(entry)
+        return {'stats': stats, 'status': 'success'}
+
+    def drop_expired_rollups(self):
+        """Delete minute buckets past their retention and hour buckets past the log retention."""
+        retention = {'minute': MINUTE_ROLLUP_RETENTION_DAYS, 'hour': self.retention_days}
+        with sqlite3.connect(self.db_path) as conn:
+            for granularity, days in retention.items():
+                if not days:
+                    continue
+                cutoff = time.strftime(ROLLUP_GRANULARITIES[granularity], time.localtime(time.time() - days * 86400))
+                conn.execute("DELETE FROM log_rollups WHERE granularity = ? AND bucket < ?", (granularity, cutoff))
+            conn.commit()
+
+    def drop_expired_partitions(self):
+        """Drop every partition older than the retention period. Returns the dropped days."""
+        if not self.retention_days:
+            return []
+        cutoff = time.strftime('%Y%m%d', time.localtime(time.time() - self.retention_days * 86400))
+        dropped = []
+        with sqlite3.connect(self.db_path) as conn:
+            for day, table in conn.execute("SELECT day, table_name FROM log_partitions WHERE day < ?",
+                                           (cutoff,)).fetchall():
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute("DELETE FROM log_partitions WHERE day = ?", (day,))
+                self._known_partitions.discard(day)
+                dropped.append(day)
+            conn.commit()
+        if dropped:
+            logging.info(f"Dropped expired log partitions: {', '.join(dropped)}")
+        return dropped
+
+    def compact_cold_partitions(self):
+        """Rebuild the indexes of partitions that no longer receive writes and free unused pages."""
+        today = time.strftime('%Y%m%d')
+        with sqlite3.connect(self.db_path) as conn:
+            cold = conn.execute("SELECT day, table_name FROM log_partitions WHERE day < ? AND compacted = 0",
+                                (today,)).fetchall()
+            for day, table in cold:
+                # REINDEX packs the index b-trees that fragmented during random-order inserts
+                conn.execute(f"REINDEX {table}")
+                conn.execute(f"ANALYZE {table}")
+                conn.execute("UPDATE log_partitions SET compacted = 1 WHERE day = ?", (day,))
+                conn.commit()
+            conn.execute("PRAGMA incremental_vacuum")
+        return [day for day, _ in cold]
+
+    def run_maintenance(self):
+        """Apply the retention period and compact cold partitions."""
+        try:
+            self.drop_expired_partitions()
+            self.drop_expired_rollups()
+            self.compact_cold_partitions()
+        except sqlite3.Error as e:
+            logging.error(f"Error during log maintenance: {e}")
+
+    def _start_maintenance(self):
+        """Start the background maintenance thread once per process (also after a fork)."""
+        if not self.maintenance_interval or self._maintenance_pid == os.getpid():
+            return
+        with self._lock:
+            if self._maintenance_pid == os.getpid():
+                return
+            self._maintenance_pid = os.getpid()
+            # Deltas inherited from a parent process are counted there, not here
+            self._pending_rollups = {}
+
+            def loop():
+                while True:
+                    self.run_maintenance()
+                    time.sleep(self.maintenance_interval)
+
+            threading.Thread(target=loop, name="log-maintenance", daemon=True).start()
@@ -1,4 +1,5 @@
 import sqlite3
+from filter_checks.db_utils import bump_policy_generation
 
 DB_PATH = "url_filter.db"
 
@@ -75,6 +76,7 @@ def populate():
             (cat_id, data["name"], data["action"])
         )
 
+    bump_policy_generation(conn)
     conn.commit()
     conn.close()
     print("Category policy table populated successfully.")
@@ -0,0 +1,34 @@
+import argparse
+import logging
+import os
+import time
+import requests
+from filter_checks.policy_snapshot import POLICY_SNAPSHOT_PATH, pull_snapshot
+
+POLICY_SOURCE_URL = os.getenv("POLICY_SOURCE_URL", "http://127.0.0.1:5000/policy/snapshot")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep a local copy of the policy snapshot in sync with a policy server (for proxy nodes).")
+    parser.add_argument('--url', default=POLICY_SOURCE_URL, help="Snapshot export URL of the policy server")
+    parser.add_argument('--out', default=POLICY_SNAPSHOT_PATH, help="Local snapshot path")
+    parser.add_argument('--interval', type=float, default=0, help="Seconds between checks (0: pull once)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    token = os.getenv("POLICY_SOURCE_TOKEN", "")  # Access token with the user role, kept out of the process list
+    while True:
+        try:
+            generation, changed = pull_snapshot(args.url, token, args.out)
+            if changed:
+                logging.info(f"Policy snapshot updated to generation {generation}")
+        except (requests.RequestException, OSError, ValueError) as e:
+            logging.error(f"Pulling the policy snapshot failed: {e}")
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Production entry point: gunicorn preloads the app once, then forks worker processes.
+
+The master initializes everything (including the compiled policy snapshot, which is
+memory-mapped read-only) before forking, so workers start ready and share those pages
+instead of loading their own copies. No background thread runs in the master; each
+worker starts its own after the fork. gunicorn restarts workers that die.
+
+    python serve.py --host 0.0.0.0 --port 5000 --workers 8
+"""
+import argparse
+import os
+import threading
+from gunicorn.app.base import BaseApplication
+
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1)))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "4"))  # Request threads per worker (gthread worker class)
+
+
+def post_fork(server, worker):
+    """Start the background threads (JWKS refresh, cache warmer, ...) in the new worker.
+
+    If a component failed to initialize in the master, the worker keeps retrying it and
+    only reports ready once it succeeded.
+    """
+    from utils import startup
+    startup.start_background()
+    if not startup.is_ready():
+        threading.Thread(target=startup.warm_up_until_ready, name="startup", daemon=True).start()
+
+
+class PreforkServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Runs once in the master (preload_app): warm up synchronously before any fork
+        os.environ['STARTUP_WARM_UP'] = 'off'
+        from app import app
+        from utils import startup
+        startup.warm_up()
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked gunicorn workers.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS)
+    parser.add_argument('--threads', type=int, default=WEB_THREADS)
+    args = parser.parse_args()
+
+    PreforkServer({
+        'bind': f"{args.host}:{args.port}",
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'post_fork': post_fork,
+        'timeout': 60,  # Long-polls of /policy/changes wait up to 30s
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,40 @@
+import gzip
+import json
 import pytest
+import sqlite3
 import subprocess
 import sys
+import threading
 import os
 from unittest.mock import patch
 # Add the root directory to sys.path to make 'app' accessible
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import app  # Import your Flask app
+from app import ROLES_CLAIM, require_auth, require_token, validator as token_validator
+import io
+import validator as validator_module
+from authlib.jose import JsonWebKey, jwt as jose_jwt
+from authlib.oauth2.rfc7523 import JWTBearerTokenValidator
+from flask import g
+from validator import Auth0JWTBearerTokenValidator, JWKSProvider
+from log_db import LogDB
+import cache_warmer
+from cache_warmer import top_hostnames, warm_hostnames
+from filter_checks import category_check
+from utils import startup
+from utils.url_utils import compile_suffix_trie, get_domain, public_suffix_length, registrable_domain
+from filter_checks.category_store import DomainCategoryStore
+from filter_checks.policy_snapshot import refresh_policy
+import cache
+import time
+from api_interfaces import otx_api
+from api_interfaces.aggregator import ThreatIntelAggregator
+from api_interfaces.ioc_store import LocalIOCStore
+from api_interfaces import circuit_breaker
+from api_interfaces.circuit_breaker import CircuitBreaker, breaker_stats
+from api_interfaces.otx_api import OTXAPI
+from api_interfaces.verdict_record import pack_verdict, unpack_verdict
 from undecorated import undecorated
 
 
@@ -37,6 +65,9 @@ def run_pre_tests():
     if generatedb_result.returncode != 0:
         raise RuntimeError("generatedb.py failed")
 
+    # The policy changed outside this process: pick it up now rather than after POLICY_CHECK_INTERVAL
+    refresh_policy()
+
 
 @pytest.fixture
 def client():
@@ -243,3 +274,940 @@ def test_allowed_mime_type(client):
     assert response.status_code == 200
     assert response.json["status"] == "allowed"
     assert response.json["message"] == "MIME type allowed"
+
+
+def test_logs_pagination(client):
+    """Test that /logs returns newest-first pages linked by next_cursor."""
+    for _ in range(3):
+        client.post("/checkMimeType", json={"mime_type": "text/plain", "url": "https://example.com"})
+    response = client.get("/logs?limit=2")
+    assert response.status_code == 200
+    page = response.json["logs"]
+    assert len(page["logs"]) == 2
+    assert page["next_cursor"] is not None
+    assert page["logs"][0]["id"] > page["logs"][1]["id"]
+    response = client.get(f"/logs?limit=2&cursor={page['next_cursor']}")
+    assert response.status_code == 200
+    assert response.json["logs"]["logs"][0]["id"] < page["logs"][1]["id"]
+
+
+def test_logs_filter(client):
+    """Test server-side filtering of /logs by category and status code."""
+    client.post("/checkMimeType", json={"mime_type": "text/plain", "url": "https://example.com"})
+    response = client.get("/logs?category=/checkMimeType&status_code=200")
+    assert response.status_code == 200
+    entries = response.json["logs"]["logs"]
+    assert entries
+    assert all(e["category"] == "/checkMimeType" and e["status_code"] == 200 for e in entries)
+    assert isinstance(entries[0]["request"], dict)
+
+
+def test_logs_invalid_params(client):
+    """Test that malformed pagination parameters are rejected."""
+    response = client.get("/logs?limit=abc")
+    assert response.status_code == 400
+    assert response.json["status"] == "error"
+
+
+def test_logs_time_range(client):
+    """Test that a time range outside of all partitions returns an empty page."""
+    response = client.get("/logs?since=2000-01-01&until=2000-01-02")
+    assert response.status_code == 200
+    assert response.json["logs"]["logs"] == []
+    assert response.json["logs"]["next_cursor"] is None
+    response = client.get("/logs?since=yesterday")
+    assert response.status_code == 400
+
+
+def test_logs_and_stats_of_a_single_day(client):
+    """Test that a date-only until includes the whole day, for logs, exports and stats."""
+    client.post("/checkMimeType", json={"mime_type": "text/plain", "url": "https://example.com"})
+    today = time.strftime('%Y-%m-%d')
+    entries = client.get(f"/logs?since={today}&until={today}&category=/checkMimeType").json["logs"]["logs"]
+    assert entries and all(e["timestamp"].startswith(today) for e in entries)
+    export = client.get(f"/logs/export?since={today}&until={today}&category=/checkMimeType")
+    assert len(export.get_data(as_text=True).splitlines()) == len(entries)
+    stats = client.get(f"/stats?since={today}&until={today}&group_by=category").json["stats"]
+    assert any(s["category"] == "/checkMimeType" for s in stats)
+
+
+def _log_on(db, timestamp, user='alice'):
+    """Insert a log entry with a given timestamp into the partition of its day."""
+    with sqlite3.connect(db.db_path) as conn:
+        table = db._ensure_partition(conn, db._day_key(timestamp))
+        conn.execute(f"INSERT INTO {table} (timestamp, level, user, request, response) VALUES (?, 'INFO', ?, '{{}}', '{{}}')",
+                     (timestamp, user))
+
+
+def _partition_days(db):
+    with sqlite3.connect(db.db_path) as conn:
+        return [day for (day,) in conn.execute("SELECT day FROM log_partitions ORDER BY day")]
+
+
+def _log_tables(db):
+    with sqlite3.connect(db.db_path) as conn:
+        return sorted(name for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'logs%'"))
+
+
+def test_log_retention_drops_expired_partitions(tmp_path):
+    """Test that expired days are dropped as whole tables and removed from the partition registry."""
+    db = LogDB(str(tmp_path / "logs.db"), retention_days=30, maintenance_interval=0)
+    old = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() - 40 * 86400))
+    _log_on(db, old)
+    db.log('INFO', 'alice', '{}', '{}', category='/checkUrl', status_code=200)
+    today = time.strftime('%Y%m%d')
+    assert _partition_days(db) == [db._day_key(old), today]
+
+    assert db.drop_expired_partitions() == [db._day_key(old)]
+    assert _partition_days(db) == [today]
+    assert _log_tables(db) == [f"logs_{today}"]
+    assert [entry["user"] for entry in db.get_logs()["logs"]] == ['alice']
+
+
+def test_log_range_query_only_touches_its_partitions(tmp_path):
+    """Test that a time range query never reads the partitions of other days."""
+    db = LogDB(str(tmp_path / "logs.db"), retention_days=0, maintenance_interval=0)
+    for day in ('2024-01-01', '2024-01-02', '2024-01-03'):
+        _log_on(db, f"{day} 12:00:00", user=day)
+    # A query reading the missing partition would fail
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("DROP TABLE logs_20240101")
+
+    page = db.get_logs(since='2024-01-02', until='2024-01-03 23:59:59')
+    assert page["status"] == "success"
+    assert [entry["user"] for entry in page["logs"]] == ['2024-01-03', '2024-01-02']
+    assert [entry["user"] for entry in db.iter_logs(since='2024-01-02')] == ['2024-01-02', '2024-01-03']
+    assert db.get_logs(since='2024-01-01', until='2024-01-01 23:59:59')["status"] == "error"
+
+
+def test_log_maintenance_compacts_cold_partitions(tmp_path):
+    """Test that past days are compacted once while the partition of today is left alone."""
+    db = LogDB(str(tmp_path / "logs.db"), retention_days=0, maintenance_interval=0)
+    _log_on(db, '2024-01-01 12:00:00')
+    db.log('INFO', 'alice', '{}', '{}', category='/checkUrl', status_code=200)
+
+    db.run_maintenance()
+    with sqlite3.connect(db.db_path) as conn:
+        compacted = dict(conn.execute("SELECT day, compacted FROM log_partitions"))
+    assert compacted == {'20240101': 1, time.strftime('%Y%m%d'): 0}
+    assert db.compact_cold_partitions() == []
+    assert len(db.get_logs()["logs"]) == 2
+
+
+def test_legacy_log_table_is_migrated(tmp_path):
+    """Test that entries of the unpartitioned logs table of older versions move into day partitions."""
+    path = str(tmp_path / "logs.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute('''CREATE TABLE logs (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, level TEXT,
+                        user TEXT, request TEXT, response TEXT, client_ip TEXT, user_agent TEXT, method TEXT,
+                        status_code INTEGER, response_time REAL, category TEXT, error_message TEXT)''')
+        conn.executemany("INSERT INTO logs (timestamp, level, user, request, response) VALUES (?, 'INFO', ?, '{}', '{}')",
+                         [('2024-01-01 10:00:00', 'a'), ('2024-01-01 11:00:00', 'b'), ('2024-01-02 09:00:00', 'c')])
+
+    db = LogDB(path, retention_days=0, maintenance_interval=0)
+    assert _partition_days(db) == ['20240101', '20240102']
+    assert _log_tables(db) == ['logs_20240101', 'logs_20240102']
+    assert [entry["user"] for entry in db.get_logs()["logs"]] == ['c', 'b', 'a']
+    assert [entry["hit_count"] for entry in db.iter_logs()] == [1, 1, 1]
+    # Starting again does not migrate twice
+    assert len(LogDB(path, retention_days=0, maintenance_interval=0).get_logs()["logs"]) == 3
+
+
+def test_logs_export_ndjson(client):
+    """Test the streamed NDJSON export of logs."""
+    client.post("/checkMimeType", json={"mime_type": "text/plain", "url": "https://example.com"})
+    response = client.get("/logs/export?category=/checkMimeType")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines
+    assert all(json.loads(line)["category"] == "/checkMimeType" for line in lines)
+
+
+def test_logs_export_csv_gzip(client):
+    """Test the gzip compressed CSV export of logs."""
+    client.post("/checkMimeType", json={"mime_type": "text/plain", "url": "https://example.com"})
+    response = client.get("/logs/export?format=csv&gzip=1")
+    assert response.status_code == 200
+    rows = gzip.decompress(response.data).decode().splitlines()
+    assert rows[0].startswith("id,level,user")
+    assert len(rows) > 1
+
+
+def test_logs_export_invalid_format(client):
+    """Test that unknown export formats are rejected."""
+    response = client.get("/logs/export?format=xml")
+    assert response.status_code == 400
+
+
+def test_stats_rollups(client):
+    """Test that /stats aggregates logged requests by category and verdict."""
+    before = client.get("/stats?granularity=minute&group_by=category,verdict").json["stats"]
+    before_count = sum(s["count"] for s in before
+                       if s["category"] == "/checkMimeType" and s["verdict"] == "blocked")
+    client.post("/checkMimeType", json={"mime_type": "application/x-dosexec", "url": "https://example.com"})
+    response = client.get("/stats?granularity=minute&group_by=category,verdict")
+    assert response.status_code == 200
+    stats = response.json["stats"]
+    after_count = sum(s["count"] for s in stats
+                      if s["category"] == "/checkMimeType" and s["verdict"] == "blocked")
+    assert after_count == before_count + 1
+    assert all("avg_response_time" in s for s in stats)
+
+
+def test_stats_invalid_params(client):
+    """Test that unknown granularities and dimensions are rejected."""
+    assert client.get("/stats?granularity=day").status_code == 400
+    assert client.get("/stats?group_by=client_ip").status_code == 400
+
+
+def test_log_dedupe_and_sampling(tmp_path):
+    """Test that repeated allow verdicts are folded while blocks are always logged."""
+    db = LogDB(str(tmp_path / "logs.db"), maintenance_interval=0, dedupe_window=60)
+    for _ in range(3):
+        db.log('INFO', 'alice', '{"url": "https://a.com"}', '{}', category='/checkUrl',
+               status_code=200, response_time=0.01, verdict='allowed')
+    for _ in range(2):
+        db.log('INFO', 'alice', '{"url": "https://b.com"}', '{}', category='/checkUrl',
+               status_code=200, response_time=0.01, verdict='blocked')
+    logs = db.get_logs()["logs"]
+    assert [entry["hit_count"] for entry in logs] == [1, 1, 3]
+
+    sampled = LogDB(str(tmp_path / "sampled.db"), maintenance_interval=0, allow_sample_rate=0.0)
+    sampled.log('INFO', 'bob', '{}', '{}', category='/checkUrl', status_code=200, verdict='allowed')
+    sampled.log('INFO', 'bob', '{}', '{}', category='/checkUrl', status_code=200, verdict='blocked')
+    assert [entry["user"] for entry in sampled.get_logs()["logs"]] == ['bob']
+    assert sum(s["count"] for s in sampled.get_stats(group_by=())["stats"]) == 2
+
+
+def test_rollups_kept_when_flush_fails(tmp_path):
+    """Test that rollup deltas survive a failed flush and are merged with later ones."""
+    db = LogDB(str(tmp_path / "logs.db"), maintenance_interval=0)
+    db.log('INFO', 'alice', '{}', '{}', category='/checkUrl', status_code=200, response_time=0.5, verdict='allowed')
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute("DROP TABLE log_rollups")
+    db._flush_rollups()
+    assert db._pending_rollups
+
+    db._create_table()
+    db.log('INFO', 'alice', '{}', '{}', category='/checkUrl', status_code=200, response_time=0.1, verdict='allowed')
+    db._flush_rollups()
+    assert db._pending_rollups == {}
+    (stats,) = db.get_stats(group_by=('user',))["stats"]
+    assert (stats["count"], stats["min_response_time"], stats["max_response_time"]) == (2, 0.1, 0.5)
+
+
+@pytest.fixture
+def isolated_cache(tmp_path, monkeypatch):
+    """Give the test its own cache database and in-process tier, so entries never leak between tests or runs."""
+    monkeypatch.setattr(cache, "DB_PATH", str(tmp_path / "cache.db"))
+    monkeypatch.setattr(cache, "memory_cache", cache.MemoryCache())
+    cache.create_cache_db()
+
+
+def test_cache_memory_tier(client, isolated_cache):
+    """Test that cache reads are served from the in-process tier after a write."""
+    cache.set_cache("test:memory-tier", {"verdict": "clean"})
+    before = cache.get_cache_stats()["memory"]["hits"]
+    assert cache.get_cache("test:memory-tier") == {"verdict": "clean"}
+    assert cache.get_cache_stats()["memory"]["hits"] == before + 1
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert set(response.json["cache"]) >= {"memory", "sqlite"}
+
+
+def test_memory_cache_bounds():
+    """Test that the LRU tier evicts the least recently used entries beyond its bounds."""
+    lru = cache.MemoryCache(max_entries=2, max_bytes=100)
+    now = time.time()
+    lru.set("a", 1, now, 10)
+    lru.set("b", 2, now, 10)
+    lru.get("a")
+    lru.set("c", 3, now, 10)
+    assert lru.get("b") is None and lru.get("a") == 1
+    lru.set("big", 4, now, 95)
+    assert lru.stats()["bytes"] <= 100
+    assert lru.get("old", ttl=0) is None
+
+
+def test_cache_pagination_and_search(client):
+    """Test that /cache pages through entries by key and filters by search text."""
+    for i in range(3):
+        cache.set_cache(f"test:page:{i}", {"n": i})
+    response = client.get("/cache?search=test:page:&limit=2")
+    assert response.status_code == 200
+    page = response.json["cache"]
+    assert [e["key"] for e in page["cache"]] == ["test:page:0", "test:page:1"]
+    response = client.get(f"/cache?search=test:page:&limit=2&cursor={page['next_cursor']}")
+    assert [e["key"] for e in response.json["cache"]["cache"]] == ["test:page:2"]
+    assert response.json["cache"]["next_cursor"] is None
+
+
+def test_cache_sweep(monkeypatch, isolated_cache):
+    """Test that the sweeper removes expired entries and enforces the size cap."""
+    cache.set_cache("test:sweep:old", {"n": 0})
+    with sqlite3.connect(cache.DB_PATH) as conn:
+        conn.execute("UPDATE cache SET timestamp = 0 WHERE key = 'test:sweep:old'")
+    monkeypatch.setattr(cache, "CACHE_MAX_ENTRIES", 1)
+    cache.set_cache("test:sweep:new", {"n": 1})
+    cache.sweep_cache()
+    with sqlite3.connect(cache.DB_PATH) as conn:
+        keys = [row[0] for row in conn.execute("SELECT key FROM cache")]
+    assert keys == ["test:sweep:new"]
+
+
+def test_verdict_record_roundtrip():
+    """Test the binary verdict record used for cached threat-intel results."""
+    record = pack_verdict("Malicious", 3, False, ["pulse a", "pulse b"])
+    assert unpack_verdict(record) == {
+        "verdict": "Malicious", "pulse_count": 3, "whitelisted": False, "details": ["pulse a", "pulse b"],
+    }
+    assert unpack_verdict(b"not a record") is None
+    assert unpack_verdict({"pulse_info": {}}) is None
+    assert unpack_verdict(pack_verdict("Malicious", -1))["pulse_count"] == 0
+    assert unpack_verdict(pack_verdict("Malicious", 2 ** 40))["pulse_count"] == 0xFFFFFFFF
+    assert cache.binary_decoders[b"TV"] is unpack_verdict
+
+
+def test_otx_caches_distilled_verdict(monkeypatch, isolated_cache):
+    """Test that OTX lookups cache a compact verdict record instead of the raw payload."""
+    api = OTXAPI()
+    raw = {"pulse_info": {"count": 2, "pulses": [{"name": "bad", "indicators": ["x"] * 1000}]},
+           "validation": [], "facts": {"verdict": "Malicious"}}
+    calls = []
+    monkeypatch.setattr(api, "_fetch", lambda url: calls.append(url) or raw)
+    first = api.check_domain("distilled.example")
+    second = api.check_domain("distilled.example")
+    assert first == second == {"verdict": "Malicious", "pulse_count": 2, "pulses": ["bad"]}
+    assert len(calls) == 1
+    stored = cache.get_cache(api.url_domain.format("distilled.example"))
+    assert isinstance(stored, bytes) and len(stored) < 64
+
+
+def test_cache_stale_while_revalidate(isolated_cache):
+    """Test that stale entries are served immediately and refreshed in the background."""
+    cache.set_cache("test:swr", "old")
+    with sqlite3.connect(cache.DB_PATH) as conn:
+        conn.execute("UPDATE cache SET timestamp = ? WHERE key = 'test:swr'", (time.time() - cache.CACHE_TTL - 1,))
+    cache.memory_cache.set("test:swr", "old", time.time() - cache.CACHE_TTL - 1, 5)
+    refreshed = threading.Event()
+
+    def loader():
+        refreshed.set()
+        return "new"
+
+    assert cache.get_or_load("test:swr", loader) == "old"
+    assert refreshed.wait(5)
+    for _ in range(50):
+        if cache.get_cache("test:swr") == "new":
+            break
+        time.sleep(0.05)
+    assert cache.get_cache("test:swr") == "new"
+    assert cache.get_or_load("test:swr:missing", lambda: None) is None
+
+
+def test_cache_single_flight(isolated_cache):
+    """Test that concurrent misses for one key trigger a single upstream load."""
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return "shared"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("test:flight", loader)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["shared"] * 5
+    assert len(calls) == 1
+
+
+def test_circuit_breaker_backoff(monkeypatch):
+    """Test that a breaker opens after repeated failures and backs off exponentially."""
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow_request()
+    now = breaker.open_until + 1
+    monkeypatch.setattr(time, "time", lambda: now)
+    assert breaker.allow_request() and breaker.state == "half_open"
+    breaker.record_failure()
+    assert breaker.open_until == now + 20
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow_request()
+
+
+@pytest.fixture
+def reset_threat_intel(monkeypatch):
+    """Start with closed circuit breakers and an empty negative cache, whatever earlier tests did."""
+    for breaker in circuit_breaker.breakers.values():
+        breaker.record_success()
+    monkeypatch.setattr(cache, "negative_cache", cache.MemoryCache(max_entries=cache.MEMORY_CACHE_MAX_ENTRIES))
+
+
+def test_otx_failure_is_negatively_cached(monkeypatch, reset_threat_intel):
+    """Test that a failed OTX lookup is not retried within the negative cache TTL."""
+    api = OTXAPI()
+    calls = []
+
+    class Failed:
+        status_code = 503
+
+    monkeypatch.setattr(otx_api.requests, "get", lambda *a, **k: calls.append(k) or Failed())
+    assert api.check_domain("down.example") is None
+    assert api.check_domain("down.example") is None
+    assert len(calls) == 1
+    assert calls[0]["timeout"] > 0
+    assert "otx" in breaker_stats()
+
+
+def test_category_check_skipped_while_opendns_circuit_is_open(monkeypatch, reset_threat_intel):
+    """Test that an open OpenDNS breaker skips the category check instead of returning an error verdict."""
+    class EmptyStore:
+        def lookup(self, hostname):
+            return None
+
+    monkeypatch.setattr(category_check.category_store, "get", EmptyStore)
+    monkeypatch.setattr(category_check.breaker, "allow_request", lambda: False)
+    assert category_check.check_category_action("uncategorized.example") is None
+
+
+class FakeProvider:
+    def __init__(self, result, delay=0.0):
+        self.result = result
+        self.delay = delay
+
+    def check_domain(self, domain):
+        time.sleep(self.delay)
+        return self.result
+
+
+def test_aggregator_any_returns_without_waiting_for_slow_provider():
+    """Test that one blocking provider decides the verdict without waiting for the others."""
+    aggregator = ThreatIntelAggregator({
+        "fast": FakeProvider({"verdict": "Malicious", "pulse_count": 3}),
+        "slow": FakeProvider(None, delay=2),
+    })
+    start = time.monotonic()
+    result = aggregator.check_domain("evil.example")
+    assert time.monotonic() - start < 1
+    assert result["verdict"] == "Malicious" and result["sources"] == ["fast"]
+
+
+def test_aggregator_quorum_weighted_and_deadline():
+    """Test the quorum and weighted strategies and that late providers are ignored."""
+    block = {"verdict": "Malicious", "pulse_count": 1}
+    providers = {"a": FakeProvider(block), "b": FakeProvider(None), "c": FakeProvider(block)}
+    assert ThreatIntelAggregator(providers, strategy="quorum", quorum=2).check_domain("x")["sources"] == ["a", "c"]
+    assert ThreatIntelAggregator(providers, strategy="quorum", quorum=3).check_domain("x") is None
+    weighted = ThreatIntelAggregator(providers, strategy="weighted", weights={"a": 0.4, "c": 0.4}, threshold=1.0)
+    assert weighted.check_domain("x") is None
+    weighted.register("b", FakeProvider(block), weight=0.5)
+    assert weighted.check_domain("x")["sources"] == ["a", "b", "c"]
+    late = ThreatIntelAggregator({"ok": FakeProvider(None), "late": FakeProvider(block, delay=2)}, deadline=0.2)
+    start = time.monotonic()
+    assert late.check_domain("x") is None
+    assert time.monotonic() - start < 1
+
+
+def test_ioc_store_imports_feeds_incrementally(tmp_path):
+    """Test importing OTX, STIX and plain feeds into the local IOC store and looking them up offline."""
+    sha256 = "a" * 64
+    otx_feed = tmp_path / "otx.json"
+    otx_feed.write_text(json.dumps({"results": [{"name": "Botnet", "indicators": [
+        {"type": "domain", "indicator": "Evil.example"},
+        {"type": "FileHash-SHA256", "indicator": sha256},
+        {"type": "IPv4", "indicator": "192.0.2.1"},
+    ]}]}))
+    stix_feed = tmp_path / "bundle.json"
+    stix_feed.write_text(json.dumps({"type": "bundle", "objects": [
+        {"type": "indicator", "name": "Phishing", "pattern": "[domain-name:value = 'evil.example']"},
+    ]}))
+    plain_feed = tmp_path / "list.txt"
+    plain_feed.write_text("# exported list\nbad.example\nevil.example\n")
+
+    store = LocalIOCStore(str(tmp_path / "ioc.db"))
+    assert store.import_file(str(otx_feed)) == 2
+    assert store.import_file(str(otx_feed)) == 0
+    assert store.import_file(str(stix_feed)) == 1
+    assert store.import_file(str(plain_feed)) == 2
+    assert store.stats() == {"domains": 2, "hashes": 1, "imports": 3}
+
+    result = store.check_domain("cdn.evil.example")
+    assert result["pulse_count"] == 3 and "Botnet" in result["pulses"]
+    assert store.check_hash(sha256.upper())["pulses"] == ["Botnet"]
+    assert store.check_domain("example") is None
+    assert store.check_domain("good.example") is None
+
+    provider = FakeProvider({"verdict": "Malicious", "pulse_count": 1}, delay=2)
+    aggregator = ThreatIntelAggregator({"slow": provider}, local=store)
+    start = time.monotonic()
+    assert aggregator.check_domain("bad.example")["sources"] == ["local"]
+    assert time.monotonic() - start < 1
+
+
+def test_ioc_lookup_ignores_port_and_credentials(client, tmp_path, monkeypatch):
+    """Test that URLs with a port or user info still match the domain IOCs of the local store."""
+    from filter_checks import block_check
+    store = LocalIOCStore(str(tmp_path / "ioc.db"))
+    plain_feed = tmp_path / "list.txt"
+    plain_feed.write_text("evil.example\n")
+    store.import_file(str(plain_feed))
+    looked_up = []
+    aggregator = ThreatIntelAggregator({}, local=store)
+    check_domain = aggregator.check_domain
+    monkeypatch.setattr(aggregator, "check_domain", lambda hostname: looked_up.append(hostname) or check_domain(hostname))
+    monkeypatch.setattr(block_check, "default_aggregator", lambda: aggregator)
+
+    for url in ("https://evil.example:8443/x", "https://user@CDN.Evil.example/"):
+        assert client.post("/checkUrl", json={"url": url}).json["status"] == "blocked"
+    assert looked_up == ["evil.example", "cdn.evil.example"]
+
+
+def test_cache_warmer_prefetches_hot_hostnames(tmp_path, isolated_cache):
+    """Test that the warmer picks the most frequent hostnames and only loads entries close to expiry."""
+    db = LogDB(str(tmp_path / "logs.db"), maintenance_interval=0)
+    for body in ['{"url": "https://hot.example/a"}', '{"host": "hot.example"}', '{"url": "https://cold.example/"}']:
+        db.log('INFO', 'alice', body, '{}', category='/checkUrl', status_code=200, response_time=0.01)
+    assert top_hostnames(db) == ["hot.example", "cold.example"]
+
+    loads = []
+
+    def warmer(hostname, ahead):
+        return cache.warm(f"warm:{hostname}", lambda: loads.append(hostname) or "verdict", ahead)
+
+    assert warm_hostnames(["hot.example", "cold.example"], warmers=[warmer], rate=0) == 2
+    assert cache.get_cache("warm:hot.example") == "verdict"
+    assert warm_hostnames(["hot.example"], warmers=[warmer], rate=0) == 0
+    assert warm_hostnames(["hot.example"], warmers=[warmer], rate=0, ahead=cache.CACHE_TTL) == 1
+    assert sorted(loads) == ["cold.example", "hot.example", "hot.example"]
+
+
+def test_cache_warmer_runs_at_startup_without_interval(monkeypatch):
+    """Test that the warmer makes one pass at startup when no schedule is configured, and none when disabled."""
+    runs = []
+    warmed = threading.Event()
+    monkeypatch.setattr(cache_warmer, "top_hostnames", lambda log_db: ["startup.example"])
+    monkeypatch.setattr(cache_warmer, "warm_hostnames", lambda hostnames: runs.append(hostnames) or warmed.set())
+    monkeypatch.setattr(cache_warmer, "_warmer_pid", None)
+    cache_warmer.start_warmer(None, interval=0, on_start=False)
+    assert cache_warmer._warmer_pid is None
+
+    cache_warmer.start_warmer(None, interval=0, on_start=True)
+    assert warmed.wait(5)
+    cache_warmer.start_warmer(None, interval=0, on_start=True)  # Once per process
+    time.sleep(0.1)
+    assert runs == [["startup.example"]]
+
+
+def test_local_category_store(tmp_path, monkeypatch):
+    """Test that categories come from the local store, without scraping OpenDNS."""
+    category_map = {"11": {"name": "Gambling", "action": "blocked"}, "12": {"name": "Games", "action": "allowed"}}
+    listing = tmp_path / "categories.csv"
+    listing.write_text("casino.example,Gambling\ngames.example,12\nother.example,Unknown\n")
+    bare = tmp_path / "gambling.txt"
+    bare.write_text("# gambling sites\nbets.example\ncasino.example\n")
+
+    store = DomainCategoryStore(str(tmp_path / "categories.db"))
+    assert store.import_file(str(listing), category_map) == 2
+    assert store.import_file(str(bare), category_map, category="gambling") == 1
+    assert store.lookup("www.casino.example") == {"11"}
+    assert store.lookup("unknown.example") is None
+
+    monkeypatch.setattr(category_check.category_store, "get", lambda: store)
+    monkeypatch.setattr(category_check.category_policy, "get", lambda: category_check.CategoryPolicy(category_map))
+    monkeypatch.setattr(category_check, "SCRAPE_FALLBACK", False)
+    monkeypatch.setattr(category_check.requests, "get", lambda *a, **k: pytest.fail("OpenDNS was scraped"))
+    assert category_check.check_category_action("bets.example")["message"].endswith("Gambling")
+    assert category_check.check_category_action("games.example") is None
+    assert category_check.check_category_action("unknown.example") is None
+
+
+def test_verified_token_claims_are_cached(tmp_path, monkeypatch):
+    """Test that a token is verified once and its cached claims drive the scope and role checks."""
+    key = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "test"})
+    jwks_file = tmp_path / "jwks.json"
+    jwks_file.write_text(json.dumps({"keys": [key.as_dict(is_private=False)]}))
+    monkeypatch.setattr(validator_module, "urlopen", lambda *a, **k: pytest.fail("JWKS was fetched"))
+    token_validator = Auth0JWTBearerTokenValidator("tenant.example", "api",
+                                                   jwks_provider=JWKSProvider("unused", local_file=str(jwks_file)))
+    monkeypatch.setitem(require_auth._token_validators, "bearer", token_validator)
+    claims = {"iss": "https://tenant.example/", "aud": "api", "sub": "alice", "scope": "user",
+              "exp": int(time.time()) + 60, ROLES_CLAIM: ["user"]}
+    token = jose_jwt.encode({"alg": "RS256", "kid": "test"}, claims, key).decode()
+
+    verified = []
+    authenticate = JWTBearerTokenValidator.authenticate_token
+    monkeypatch.setattr(JWTBearerTokenValidator, "authenticate_token",
+                        lambda self, value: verified.append(value) or authenticate(self, value))
+
+    @require_token(["user"], ["user"])
+    def user_view():
+        return g.sub
+
+    @require_token(["user"], ["admin"])
+    def admin_view():
+        return g.sub
+
+    for _ in range(3):
+        with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+            assert user_view() == "alice"
+    with app.test_request_context(headers={"Authorization": f"Bearer {token}"}):
+        assert admin_view()[1] == 403
+    assert len(verified) == 1
+
+
+def test_jwks_disk_cache_and_unknown_kid_refetch(tmp_path, monkeypatch):
+    """Test that keys come from the disk cache and an unknown kid triggers one rate limited re-fetch."""
+    old_key = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "old"})
+    new_key = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "new"})
+    cache_path = tmp_path / "jwks_cache.json"
+    cache_path.write_text(json.dumps({"keys": [old_key.as_dict(is_private=False)]}))
+    rotated = json.dumps({"keys": [old_key.as_dict(is_private=False), new_key.as_dict(is_private=False)]})
+    fetches = []
+    monkeypatch.setattr(validator_module, "urlopen", lambda url, **k: fetches.append(url) or io.BytesIO(rotated.encode()))
+
+    provider = JWKSProvider("https://tenant.example/.well-known/jwks.json", cache_path=str(cache_path),
+                            local_file=None, refresh_interval=0)
+    token_validator = Auth0JWTBearerTokenValidator("tenant.example", "api", jwks_provider=provider)
+    claims = {"iss": "https://tenant.example/", "aud": "api", "sub": "alice", "exp": int(time.time()) + 60}
+
+    def sign(key, sub):
+        return jose_jwt.encode({"alg": "RS256", "kid": key.kid}, dict(claims, sub=sub), key).decode()
+
+    assert token_validator.authenticate_token(sign(old_key, "a"))["sub"] == "a"
+    assert fetches == []
+    assert token_validator.authenticate_token(sign(new_key, "b"))["sub"] == "b"
+    assert len(fetches) == 1
+    assert "new" in {key["kid"] for key in json.loads(cache_path.read_text())["keys"]}
+    unknown = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "unknown"})
+    assert token_validator.authenticate_token(sign(unknown, "c")) is None
+    assert len(fetches) == 1
+
+
+def test_ready_reports_startup_timings(client, tmp_path, monkeypatch):
+    """Test that /ready turns 200 after the warm-up and reports per-component timings."""
+    # The JWKS comes from a local key set, so the warm-up never reaches the issuer
+    key = JsonWebKey.generate_key("RSA", 2048, is_private=True, options={"kid": "local"})
+    jwks_file = tmp_path / "jwks.json"
+    jwks_file.write_text(json.dumps({"keys": [key.as_dict(is_private=False)]}))
+    monkeypatch.setattr(token_validator, "jwks_provider", JWKSProvider(
+        "https://tenant.example/.well-known/jwks.json", cache_path=str(tmp_path / "jwks_cache.json"),
+        local_file=str(jwks_file), refresh_interval=0))
+    assert startup.warm_up() is True
+    response = client.get("/ready")
+    assert response.status_code == 200
+    timings = response.get_json()["startup"]
+    assert {"app_import", "cache_db", "public_suffix_list", "threat_intel"} <= set(timings)
+    assert get_domain("https://www.example.co.uk/path") == "example.co.uk"
+
+
+def test_warm_up_only_ready_when_every_component_succeeded(client, monkeypatch):
+    """Test that a failed component (such as JWKS without keys) keeps /ready at 503 until a retry succeeds."""
+    monkeypatch.setattr(validator_module.JWKSProvider, "load", lambda self, start=True: None)
+    monkeypatch.setattr(startup, "components", {"jwks": startup.components["jwks"]})
+    monkeypatch.setattr(startup, "failures", {})
+    monkeypatch.setattr(startup, "_initialized", set())
+    monkeypatch.setattr(startup, "_ready", threading.Event())
+
+    assert startup.warm_up() is False
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert "No JWKS keys available" in response.get_json()["failed"]["jwks"]
+
+    monkeypatch.setattr(validator_module.JWKSProvider, "load", lambda self, start=True: {"keys": []})
+    assert startup.warm_up() is True
+    assert client.get("/ready").status_code == 200
+
+
+def test_public_suffix_trie():
+    """Test wildcard and exception rules of the suffix trie and registrable domains of parsed hostnames."""
+    trie = compile_suffix_trie("// comment\nuk\nco.uk\n*.ck\n!www.ck\n// ===BEGIN PRIVATE DOMAINS===\ngithub.io\n")
+    assert public_suffix_length(["uk", "co", "example", "www"], trie) == 2
+    assert public_suffix_length(["ck", "foo", "bar"], trie) == 2
+    assert public_suffix_length(["ck", "www"], trie) == 1
+    assert public_suffix_length(["io", "github", "x"], trie) == 0
+    assert registrable_domain("WWW.Example.co.uk.") == "example.co.uk"
+    assert registrable_domain("192.0.2.1") == "192.0.2.1"
+    assert get_domain("https://user@www.example.com:8080/path") == "example.com"
+
+
+def test_policy_snapshot_lookups(tmp_path):
+    """Test that a compiled snapshot answers exact, prefix and redirect lookups and tracks the generation."""
+    from filter_checks.db_utils import bump_policy_generation
+    from filter_checks.policy_snapshot import PolicySnapshot, compile_snapshot
+    db_path, path = str(tmp_path / "policy.db"), str(tmp_path / "policy.snapshot")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE blocked_urls (type TEXT, value TEXT)")
+        conn.execute("CREATE TABLE redirect_urls (type TEXT, value TEXT, proxy TEXT)")
+        conn.executemany("INSERT INTO blocked_urls VALUES (?, ?)", [
+            ("url_prefix", "https://a.com/x"), ("url_prefix", "https://a.com/xyz/deep"),
+            ("url_prefix", "https://B.com/"), ("hostname", "evil.com"),
+        ])
+        conn.execute("INSERT INTO redirect_urls VALUES ('domain', 'r.com', 'proxy:8080')")
+        bump_policy_generation(conn)
+    assert compile_snapshot(db_path, path) == 1
+    snapshot = PolicySnapshot(path)
+    assert snapshot.generation == 1
+    assert snapshot.contains("blocked_hostname", "evil.com")
+    assert not snapshot.contains("blocked_hostname", "evil.co")
+    assert snapshot.longest_prefix("blocked_url_prefix", "https://a.com/xyz/other") == ""
+    assert snapshot.longest_prefix("blocked_url_prefix", "https://b.com/path") == ""
+    assert snapshot.longest_prefix("blocked_url_prefix", "https://a.com/") is None
+    assert snapshot.get("redirect_domain", "r.com") == "proxy:8080"
+    assert not snapshot.contains("blocked_files", "abc")  # Missing tables compile empty
+
+
+def test_import_policy_bulk(client):
+    """Test a bulk hosts-file import: comments skipped, duplicates counted, entries enforced right away."""
+    body = "# blocklist\n0.0.0.0 bulk-one.test\nbulk-two.test  # inline comment\n0.0.0.0 bulk-one.test\n\n"
+    response = client.post("/import_policy?table=blocked_urls&format=hosts&type=hostname", data=body)
+    assert response.status_code == 200
+    assert (response.json["read"], response.json["inserted"], response.json["duplicates"]) == (3, 2, 1)
+    assert client.post("/checkUrl", json={"url": "https://bulk-two.test/"}).json["status"] == "blocked"
+
+    records = gzip.compress(b'{"mime_type": "application/x-bulk"}\n{"type": "oops"}\nnot json\n')
+    response = client.post("/import_policy?table=blocked_mimetypes", data=records,
+                           headers={"Content-Encoding": "gzip"})
+    assert (response.json["inserted"], response.json["rejected"]) == (1, 2)
+    assert client.post("/import_policy?table=category_policy").status_code == 400
+
+
+def test_import_hosts_file_lines(client):
+    """Test that every name of a hosts line is imported as a hostname, without the standard header entries."""
+    from filter_checks.policy_import import parse_hosts
+    body = ("127.0.0.1 localhost\n255.255.255.255 broadcasthost\n::1 localhost ip6-localhost\n"
+            "0.0.0.0 0.0.0.0\n0.0.0.0 multi-a.test Multi-B.test  # two names\n")
+    assert [record["value"] for record in parse_hosts(body.splitlines())] == ["multi-a.test", "multi-b.test"]
+    response = client.post("/import_policy?table=blocked_urls&format=hosts", data=body)
+    assert (response.json["read"], response.json["inserted"], response.json["rejected"]) == (2, 2, 0)
+    for url in ("https://multi-a.test/", "https://multi-b.test/"):
+        assert client.post("/checkUrl", json={"url": url}).json["status"] == "blocked"
+
+
+def test_policy_snapshot_export(client, tmp_path):
+    """Test that the exported snapshot loads with its checksum verified and is not resent while unchanged."""
+    from filter_checks.policy_snapshot import PolicySnapshot, read_generation
+    response = client.get("/policy/snapshot")
+    assert response.status_code == 200
+    generation = response.headers["X-Policy-Generation"]
+    path = tmp_path / "node.snapshot"
+    path.write_bytes(response.data)
+    snapshot = PolicySnapshot(str(path), verify=True)
+    assert str(snapshot.generation) == generation == str(read_generation(str(path)))
+    assert snapshot.contains("blocked_hostname", "www.example.com")
+
+    assert client.get(f"/policy/snapshot?since={generation}").status_code == 304
+    assert client.get("/policy/snapshot", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+    corrupted = bytearray(response.data)
+    corrupted[-1] ^= 0xFF
+    path.write_bytes(bytes(corrupted))
+    with pytest.raises(ValueError):
+        PolicySnapshot(str(path), verify=True)
+
+
+def test_policy_change_feed(client):
+    """Test that writes show up in the change feed and are applied without recompiling the snapshot."""
+    from filter_checks import db_utils
+    from filter_checks.policy_snapshot import current_policy
+    generation = db_utils.get_policy_generation()
+    response = client.post("/set_policy", json={"table": "blocked_urls",
+                                                "data": {"url": "https://feed.test/ads/", "type": "url_prefix"}})
+    assert response.status_code == 201
+    feed = client.get(f"/policy/changes?since={generation}").json
+    assert (feed["resync"], feed["next"], len(feed["changes"])) == (False, generation + 1, 1)
+    assert feed["changes"][0]["op"] == "insert" and feed["changes"][0]["data"]["value"] == "https://feed.test/ads/"
+    view = current_policy()
+    assert view.snapshot.generation == generation and view.generation == generation + 1
+    assert client.post("/checkUrl", json={"url": "https://FEED.test/ads/1"}).json["status"] == "blocked"
+
+    assert client.delete("/delete_policy", json={"table": "blocked_urls",
+                                                 "condition": "https://feed.test/ads/"}).status_code == 200
+    assert client.get(f"/policy/changes?since={generation + 1}").json["changes"][0]["op"] == "delete"
+    assert current_policy().longest_prefix("blocked_url_prefix", "https://feed.test/ads/1") is None
+
+    def write_elsewhere():
+        with sqlite3.connect(db_utils.DB_PATH) as conn:
+            conn.execute("INSERT INTO tls_excluded_hosts (hostname) VALUES ('feed.test')")
+            db_utils.bump_policy_generation(conn, [("tls_excluded_hosts", "insert", {"hostname": "feed.test"})])
+    timer = threading.Timer(0.2, write_elsewhere)
+    timer.start()
+    started = time.monotonic()
+    feed = client.get(f"/policy/changes?since={generation + 2}&wait=5").json
+    timer.join()
+    assert time.monotonic() - started < 4
+    assert feed["changes"][0]["data"] == {"hostname": "feed.test"}
+    assert client.get("/policy/changes?since=0").json["resync"] is True
+
+
+def test_get_policy_pagination_and_etag(client):
+    """Test keyset pages, prefix and substring search, sorting and the generation ETag of /get_policy."""
+    client.post("/import_policy?table=blocked_mimetypes&format=hosts",
+                data="\n".join(f"application/x-page-{i}" for i in range(5)))
+    pages, cursor = [], None
+    while True:
+        query = "/get_policy?table=blocked_mimetypes&search=application/x-page-&match=prefix&limit=2"
+        response = client.get(query + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        pages.append([row[0] for row in response.json["data"]])
+        cursor = response.json["next_cursor"]
+        if not cursor:
+            break
+    assert pages == [["application/x-page-0", "application/x-page-1"],
+                     ["application/x-page-2", "application/x-page-3"], ["application/x-page-4"]]
+
+    response = client.get("/get_policy?table=blocked_mimetypes&search=X-PAGE-&sort=value&order=desc&limit=2")
+    assert [row[0] for row in response.json["data"]] == ["application/x-page-4", "application/x-page-3"]
+    assert client.get("/get_policy?table=blocked_mimetypes&sort=nope").status_code == 400
+
+    etag = response.headers["ETag"]
+    assert client.get("/get_policy?table=blocked_mimetypes", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/set_policy", json={"table": "blocked_mimetypes", "data": {"mime_type": "application/x-etag"}})
+    assert client.get("/get_policy?table=blocked_mimetypes", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_streamed_json_compression(client):
+    """Test that list endpoints stream the same JSON and honour Accept-Encoding."""
+    plain = client.get("/get_policy?table=blocked_urls&limit=5")
+    assert plain.headers.get("Content-Encoding") is None
+    compressed = client.get("/get_policy?table=blocked_urls&limit=5", headers={"Accept-Encoding": "gzip, deflate"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["Vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(compressed.data)) == plain.json
+    refused = client.get("/get_policy?table=blocked_urls&limit=5", headers={"Accept-Encoding": "gzip;q=0"})
+    assert refused.headers.get("Content-Encoding") is None
+
+    from utils.stream_utils import iter_json
+    value = {"a": [1, {"b": None}], "rows": (row for row in [("x", 2)]), "n": 1.5}
+    assert json.loads("".join(iter_json(value))) == {"a": [1, {"b": None}], "rows": [["x", 2]], "n": 1.5}
+
+
+class FakePolicyServer:
+    """Answers the follower's requests.get calls from a policy database, like /policy/snapshot and /policy/changes."""
+
+    def __init__(self, db_path, snapshot_path):
+        self.db_path = db_path
+        self.snapshot_path = snapshot_path
+        self.snapshot_requests = 0
+        self.waits = []
+        self.idle = False  # Answer change requests as if the long-poll timed out
+
+    def write(self, value, log=True):
+        from filter_checks import db_utils
+        row = {"type": "hostname", "value": value}
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("INSERT INTO blocked_urls VALUES ('hostname', ?)", (value,))
+            db_utils.bump_policy_generation(conn, [("blocked_urls", "insert", row)] if log else None)
+
+    def get(self, url, params=None, headers=None, timeout=None, stream=False):
+        from filter_checks import policy_changes, policy_snapshot
+        if url.endswith("/policy/snapshot"):
+            self.snapshot_requests += 1
+            generation = policy_snapshot.compile_snapshot(self.db_path, self.snapshot_path)
+            if str(params.get("since")) == str(generation):
+                return FakeResponse(304)
+            with open(self.snapshot_path, "rb") as f:
+                return FakeResponse(200, content=f.read())
+        self.waits.append(params["wait"])
+        if self.idle:
+            return FakeResponse(200, {"resync": False, "next": params["since"], "changes": []})
+        with sqlite3.connect(self.db_path) as conn:
+            generation, reached, changes = policy_changes.changes_since(params["since"], conn=conn)
+        if changes is None:
+            return FakeResponse(200, {"resync": True, "generation": generation})
+        return FakeResponse(200, {"resync": False, "generation": generation, "next": reached, "changes": changes})
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None, content=b""):
+        self.status_code = status_code
+        self.data = data
+        self.content = content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, size):
+        yield self.content
+
+
+@pytest.fixture
+def policy_server(monkeypatch, tmp_path):
+    """Run this process as a follower node of a faked policy server."""
+    import requests
+    from filter_checks import db_utils, policy_snapshot
+    server_db = str(tmp_path / "server.db")
+    with sqlite3.connect(server_db) as conn:
+        conn.execute("CREATE TABLE blocked_urls (type TEXT, value TEXT)")
+        conn.execute("INSERT INTO blocked_urls VALUES ('hostname', 'pulled.test')")
+        for _ in range(db_utils.get_policy_generation() + 5):
+            db_utils.bump_policy_generation(conn)
+    server = FakePolicyServer(server_db, str(tmp_path / "server.snapshot"))
+    monkeypatch.setattr(requests, "get", server.get)
+    monkeypatch.setattr(policy_snapshot, "POLICY_SOURCE_URL", "http://policy-server/policy/snapshot")
+    monkeypatch.setattr(policy_snapshot, "POLICY_SNAPSHOT_PATH", str(tmp_path / "pulled.snapshot"))
+    monkeypatch.setattr(policy_snapshot, "_current", None)
+    monkeypatch.setattr(policy_snapshot, "_follower", None)
+    return server
+
+
+def test_policy_follower_applies_changes_incrementally(policy_server):
+    """Test that a follower node applies the change feed in memory and never compiles its local database."""
+    from filter_checks import db_utils, policy_snapshot
+    view = policy_snapshot.refresh_policy()
+    assert view.contains("blocked_hostname", "pulled.test")
+    assert view.generation != db_utils.get_policy_generation()
+    path = policy_snapshot.POLICY_SNAPSHOT_PATH
+    mtime = os.stat(path).st_mtime_ns
+
+    policy_server.write("pushed.test")
+    follower = policy_snapshot.policy_follower()
+    follower.sync()
+    view = policy_snapshot.refresh_policy()
+    assert view is follower.view and view.contains("blocked_hostname", "pushed.test")
+    assert (view.pending, policy_server.snapshot_requests) == (1, 1)
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_policy_follower_resyncs_on_generation_gap(policy_server):
+    """Test that a follower reloads the snapshot when the server no longer has the changes it needs."""
+    from filter_checks import policy_snapshot
+    first = policy_snapshot.refresh_policy()
+    policy_server.write("bulk.test", log=False)  # Logged as a reset, like bulk imports
+    policy_snapshot.policy_follower().sync()
+    view = policy_snapshot.refresh_policy()
+    assert view is not first and view.pending == 0
+    assert view.contains("blocked_hostname", "bulk.test")
+    assert policy_server.snapshot_requests == 2
+
+
+def test_policy_follower_long_poll_timeout(policy_server):
+    """Test that a long-poll answered without changes leaves the view as it is."""
+    from filter_checks import policy_snapshot
+    view = policy_snapshot.refresh_policy()
+    generation = view.generation
+    policy_server.idle = True
+    follower = policy_snapshot.policy_follower()
+    follower.sync()
+    assert follower.view is view and (view.generation, view.pending) == (generation, 0)
+    assert policy_server.waits == [follower.wait]
+    assert policy_server.snapshot_requests == 1
@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+import time
+
+# 'background' warms up and starts background threads on import of the app; 'off' leaves both
+# to the caller (serve.py warms up in the master and starts the threads in each worker)
+WARM_UP_MODE = os.getenv('STARTUP_WARM_UP', 'background')
+WARM_UP_RETRY_INTERVAL = float(os.getenv('STARTUP_RETRY_INTERVAL', '10'))  # Seconds between retries of failed components
+
+# Components initialized by warm_up(), in registration order: name -> init function
+components = {}
+# Functions starting background threads, run by start_background() in every serving process
+background = []
+# Seconds each component took to initialize
+timings = {}
+# Components whose last initialization attempt raised: name -> error message
+failures = {}
+_initialized = set()
+_ready = threading.Event()
+_warm_up_lock = threading.Lock()
+_warm_up_started = False
+
+
+def register(name, init):
+    """Register a function initializing a component, run by warm_up()."""
+    components[name] = init
+
+
+def register_background(start):
+    """Register a function starting a background thread, see start_background()."""
+    background.append(start)
+
+
+def start_background():
+    """Start the registered background threads in this process.
+
+    A pre-forking server calls this in each worker after the fork, so the master never
+    runs threads while forking.
+    """
+    for start in background:
+        start()
+
+
+def record(name, seconds):
+    timings[name] = round(seconds, 4)
+
+
+class Lazy:
+    """A resource created by ``factory`` on first use and pre-created by warm_up().
+
+    Creation is thread-safe and happens once; its duration shows up in the startup report.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._created = False
+        self._lock = threading.Lock()
+        register(name, self.get)
+
+    def get(self):
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    start = time.perf_counter()
+                    self._value = self.factory()
+                    self._created = True
+                    record(self.name, time.perf_counter() - start)
+        return self._value
+
+    def reset(self):
+        """Drop the resource, it is created again on next use."""
+        with self._lock:
+            self._value = None
+            self._created = False
+
+
+def warm_up():
+    """Initialize the registered components not initialized yet, logging how long each one took.
+
+    The app only reports ready once every component succeeded. Returns whether it is.
+    """
+    for name, init in list(components.items()):
+        if name in _initialized:
+            continue
+        start = time.perf_counter()
+        try:
+            init()
+        except Exception as e:
+            logging.exception(f"Initializing {name} failed")
+            failures[name] = str(e)
+            continue
+        failures.pop(name, None)
+        _initialized.add(name)
+        timings.setdefault(name, round(time.perf_counter() - start, 4))
+    if failures:
+        logging.warning(f"Startup incomplete, failed components: {', '.join(failures)}")
+        return False
+    _ready.set()
+    logging.info(f"Startup complete: {', '.join(f'{name} {seconds:.3f}s' for name, seconds in timings.items())}")
+    return True
+
+
+def warm_up_until_ready():
+    """Run warm_up() again every WARM_UP_RETRY_INTERVAL seconds until every component succeeded."""
+    while not warm_up():
+        time.sleep(WARM_UP_RETRY_INTERVAL)
+
+
+def start_warm_up():
+    """Run warm_up() in a background thread, so importing the app does not wait for it,
+    and start the background threads."""
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started or WARM_UP_MODE == 'off':
+            return
+        _warm_up_started = True
+    threading.Thread(target=warm_up_until_ready, name="startup", daemon=True).start()
+    start_background()
+
+
+def is_ready():
+    return _ready.is_set()
+
+
+def report():
+    """Return the readiness, the initialization time of each component so far and the failed ones."""
+    return {'ready': is_ready(), 'timings': dict(timings), 'failed': dict(failures)}
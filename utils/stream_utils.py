@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import zlib
+
+try:
+    import brotli  # Optional: enables 'br' response compression
+except ImportError:
+    brotli = None
+
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes buffered before a chunk is sent to the client
+
+
+def buffered(pieces, chunk_size=STREAM_CHUNK_SIZE):
+    """Join small text pieces into chunks of roughly chunk_size bytes."""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        data = piece.encode('utf-8') if isinstance(piece, str) else piece
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def ndjson_lines(entries):
+    """Encode each entry as one JSON line."""
+    for entry in entries:
+        yield json.dumps(entry, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows, header):
+    """Encode a header and rows as CSV lines."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        yield out.getvalue()
+        out.seek(0)
+        out.truncate(0)
+    if out.tell():
+        yield out.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of byte chunks into one gzip stream."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+def br_chunks(chunks):
+    """Compress a stream of byte chunks into one brotli stream (requires the brotli package)."""
+    compressor = brotli.Compressor(quality=5)
+    for chunk in chunks:
+        if data := compressor.process(chunk):
+            yield data
+    yield compressor.finish()
+
+
+# Supported response encodings, in order of preference
+ENCODERS = {'br': br_chunks, 'gzip': gzip_chunks} if brotli else {'gzip': gzip_chunks}
+
+
+def negotiate_encoding(accept_encodings):
+    """Return the preferred supported encoding of a parsed Accept-Encoding header, or None."""
+    best = None
+    for encoding in ENCODERS:
+        quality = accept_encodings[encoding]
+        if quality > 0 and (best is None or quality > best[1]):
+            best = encoding, quality
+    return best[0] if best else None
+
+
+def iter_json(value):
+    """Encode a value as JSON text pieces.
+
+    Objects and arrays (lists, tuples and iterators such as generators) are encoded
+    incrementally, so large arrays are never held as one string; each array element is
+    encoded in one piece.
+    """
+    if isinstance(value, dict):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            yield f"{',' if i else ''}{json.dumps(str(key))}:"
+            yield from iter_json(item)
+        yield '}'
+    elif isinstance(value, (list, tuple)) or hasattr(value, '__next__'):
+        yield '['
+        for i, item in enumerate(value):
+            yield f"{',' if i else ''}{json.dumps(item)}"
+        yield ']'
+    else:
+        yield json.dumps(value)
@@ -1,5 +1,96 @@
+import os
+from functools import lru_cache
+from urllib.parse import urlparse
 import tldextract
+from utils.startup import Lazy
+
+# Prebuilt public suffix list used instead of the snapshot bundled with tldextract
+PUBLIC_SUFFIX_LIST_FILE = os.getenv("PUBLIC_SUFFIX_LIST_FILE")
+BUNDLED_SUFFIX_LIST = os.path.join(os.path.dirname(tldextract.__file__), ".tld_set_snapshot")
+DOMAIN_CACHE_SIZE = int(os.getenv("DOMAIN_CACHE_SIZE", "65536"))  # Hostnames kept in the registrable-domain LRU
+
+# Trie node markers: a rule ends here / any label matches here / this label is an exception
+END, WILDCARD, EXCEPTION = "$", "*", "!"
+
+
+def _rules(text):
+    """Yield the ICANN rules of a public suffix list (private domains are ignored, like tldextract does)."""
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("// ===BEGIN PRIVATE DOMAINS==="):
+            break
+        if not line or line.startswith("//"):
+            continue
+        rule = line.split()[0].lower()
+        yield rule
+        if not rule.isascii():
+            try:
+                yield rule.encode("idna").decode("ascii")  # Hostnames usually arrive punycode encoded
+            except UnicodeError:
+                pass
+
+
+def compile_suffix_trie(text):
+    """Compile public suffix rules into a trie of reversed labels."""
+    root = {}
+    for rule in _rules(text):
+        exception = rule.startswith(EXCEPTION)
+        labels = rule.lstrip(EXCEPTION).split(".")[::-1]
+        node = root
+        for label in labels[:-1]:
+            node = node.setdefault(label, {})
+        last = labels[-1]
+        if exception:
+            node[last] = {EXCEPTION: True}
+        elif last == WILDCARD:
+            node[WILDCARD] = True
+        else:
+            node.setdefault(last, {})[END] = True
+    return root
+
+
+def _load_suffix_trie():
+    with open(PUBLIC_SUFFIX_LIST_FILE or BUNDLED_SUFFIX_LIST, encoding="utf-8") as f:
+        return compile_suffix_trie(f.read())
+
+
+_suffix_trie = Lazy('public_suffix_list', _load_suffix_trie)
+
+
+def public_suffix_length(labels, trie):
+    """Return how many trailing labels (given reversed) form the public suffix, 0 if none is known."""
+    node = trie
+    length = 0
+    for i, label in enumerate(labels):
+        child = node.get(label)
+        if child is not None and EXCEPTION in child:
+            return i
+        if WILDCARD in node:
+            length = i + 1
+        if child is None:
+            break
+        node = child
+        if END in node:
+            length = i + 1
+    return length
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def registrable_domain(hostname):
+    """Return the registrable domain of an already parsed hostname (public suffix plus one label).
+
+    Hostnames without one (IP addresses, bare suffixes, unknown TLDs) are returned unchanged.
+    """
+    hostname = (hostname or "").lower().rstrip(".")
+    labels = hostname.split(".")
+    if hostname.replace(".", "").isdigit():
+        return hostname  # IPv4 address
+    length = public_suffix_length(labels[::-1], _suffix_trie.get())
+    if not length or length >= len(labels):
+        return hostname
+    return ".".join(labels[-length - 1:])
+
 
 def get_domain(url):
-    extracted = tldextract.extract(url)
-    return f"{extracted.domain}.{extracted.suffix}"
+    """Return the registrable domain of a URL."""
+    return registrable_domain(urlparse(url if "//" in url else f"//{url}").hostname)
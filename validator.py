@@ -1,23 +1,184 @@
+import base64
+import hashlib
 import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 from urllib.request import urlopen
 from authlib.oauth2.rfc7523 import JWTBearerTokenValidator
-from authlib.jose.rfc7517.jwk import JsonWebKey
 
-class Auth0JWTBearerTokenValidator(JWTBearerTokenValidator):
-    def __init__(self, domain, audience):
-        issuer = f"https://{domain}/"
+TOKEN_CACHE_MAX_ENTRIES = 10000  # Verified tokens kept, least recently used ones are evicted
+JWKS_CACHE_PATH = os.getenv("JWKS_CACHE_PATH", "jwks_cache.json")  # Last fetched JWKS, read at startup
+JWKS_FILE = os.getenv("JWKS_FILE")  # Local JWKS used instead of fetching the issuer's (e.g. in tests)
+JWKS_REFRESH_INTERVAL = int(os.getenv("JWKS_REFRESH_INTERVAL", "3600"))  # Seconds between background refreshes
+JWKS_MIN_FETCH_INTERVAL = 30  # Seconds between fetches triggered by tokens with an unknown kid
+JWKS_FETCH_TIMEOUT = 5
+
+
+class JWKSProvider:
+    """Signing keys of an issuer, read from disk at startup and refreshed in the background.
+
+    Keys come from ``local_file`` if given, otherwise from the on-disk cache of the last
+    fetch; the issuer is only contacted synchronously when neither exists. Tokens signed
+    with an unknown ``kid`` trigger a re-fetch, at most once per ``min_fetch_interval``.
+    """
+
+    def __init__(self, url, cache_path=JWKS_CACHE_PATH, local_file=JWKS_FILE,
+                 refresh_interval=JWKS_REFRESH_INTERVAL, min_fetch_interval=JWKS_MIN_FETCH_INTERVAL):
+        self.url = url
+        self.cache_path = cache_path
+        self.local_file = local_file
+        self.refresh_interval = refresh_interval
+        self.min_fetch_interval = min_fetch_interval
+        self.jwks = None
+        self.version = 0  # Incremented whenever the keys change
+        self._last_fetch = 0.0
+        self._lock = threading.Lock()
+        self._refresher_pid = None
+        jwks = self._read(local_file or cache_path)
+        if jwks:
+            self._set(jwks)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                jwks = json.load(f)
+            return jwks if isinstance(jwks, dict) and jwks.get("keys") else None
+        except (OSError, ValueError):
+            return None
+
+    def _set(self, jwks):
+        with self._lock:
+            self.jwks = jwks
+            self.version += 1
+
+    def load(self, start=True):
+        """Return the current JWKS, fetching it only if nothing could be read from disk.
+
+        With ``start`` the background refresher is started too; a pre-forking master passes False
+        and starts it in each worker instead.
+        """
+        if self.jwks is None:
+            self.refresh()
+        if start:
+            self.start()
+        return self.jwks
+
+    def kids(self):
+        return {key.get("kid") for key in (self.jwks or {}).get("keys", [])}
+
+    def refresh(self, force=False):
+        """Fetch the issuer's JWKS and store it in the disk cache. Returns True if new keys were loaded.
+
+        Unless ``force`` is set, fetches are rate limited to one per ``min_fetch_interval``.
+        """
+        if self.local_file:
+            return False  # A local JWKS is authoritative
+        with self._lock:
+            if not force and time.time() - self._last_fetch < self.min_fetch_interval:
+                return False
+            self._last_fetch = time.time()
         try:
-            jsonurl = urlopen(f"{issuer}.well-known/jwks.json")
-            public_key = JsonWebKey.import_key_set(
-                json.loads(jsonurl.read())
-            )
-            super(Auth0JWTBearerTokenValidator, self).__init__(public_key)
-            self.claims_options = {
-                "exp": {"essential": True},
-                "aud": {"essential": True, "value": audience},
-                "iss": {"essential": True, "value": issuer},
-            }
+            with urlopen(self.url, timeout=JWKS_FETCH_TIMEOUT) as response:
+                jwks = json.loads(response.read())
         except Exception as e:
-            logging.error(f"Error in token validation: {str(e)}")
-            raise
+            logging.error(f"Error fetching JWKS from {self.url}: {e}")
+            return False
+        if not isinstance(jwks, dict) or not jwks.get("keys"):
+            logging.error(f"JWKS from {self.url} contains no keys")
+            return False
+        self._set(jwks)
+        try:
+            # Write and rename, so other workers never read a partial file
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(jwks, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logging.warning(f"Could not write JWKS cache {self.cache_path}: {e}")
+        return True
+
+    def start(self):
+        """Start the background refresh thread once per process (also after a fork)."""
+        if self.local_file or not self.refresh_interval or self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            self._refresher_pid = os.getpid()
+
+        def loop():
+            while True:
+                time.sleep(self.refresh_interval)
+                self.refresh(force=True)
+
+        threading.Thread(target=loop, name="jwks-refresh", daemon=True).start()
+
+
+def token_kid(token_string):
+    """Return the kid of a token's (unverified) header, or None."""
+    try:
+        header = token_string.split(".", 1)[0]
+        return json.loads(base64.urlsafe_b64decode(header + "=" * (-len(header) % 4))).get("kid")
+    except (ValueError, AttributeError):
+        return None
+
+
+class Auth0JWTBearerTokenValidator(JWTBearerTokenValidator):
+    def __init__(self, domain, audience, cache_max_entries=TOKEN_CACHE_MAX_ENTRIES, jwks_provider=None):
+        issuer = f"https://{domain}/"
+        # Keys are loaded lazily from the provider, nothing is fetched here
+        self.jwks_provider = jwks_provider or JWKSProvider(f"{issuer}.well-known/jwks.json")
+        self._imported_key = (None, None)  # (provider version, key in the form authlib expects)
+        super(Auth0JWTBearerTokenValidator, self).__init__(None)
+        self.claims_options = {
+            "exp": {"essential": True},
+            "aud": {"essential": True, "value": audience},
+            "iss": {"essential": True, "value": issuer},
+        }
+        self.cache_max_entries = cache_max_entries
+        self._token_cache = OrderedDict()  # sha256(token) -> (verified token, exp)
+        self._cache_lock = threading.Lock()
+
+    @property
+    def public_key(self):
+        jwks = self.jwks_provider.load()
+        version, key = self._imported_key
+        if version != self.jwks_provider.version:
+            # Let the base validator import the JWKS, the accepted key types differ between authlib versions
+            version, key = self.jwks_provider.version, JWTBearerTokenValidator(jwks).public_key
+            self._imported_key = (version, key)
+        return key
+
+    @public_key.setter
+    def public_key(self, value):
+        pass  # Keys come from the JWKS provider
+
+    def authenticate_token(self, token_string):
+        """Verify a token, reusing the verified claims of tokens seen before until their ``exp``."""
+        key = hashlib.sha256(token_string.encode('utf-8')).digest()
+        with self._cache_lock:
+            entry = self._token_cache.get(key)
+            if entry is not None:
+                if entry[1] > time.time():
+                    self._token_cache.move_to_end(key)
+                    return entry[0]
+                del self._token_cache[key]
+
+        if self.jwks_provider.load() is None:
+            logging.error("No JWKS available, cannot verify tokens")
+            return None
+        kid = token_kid(token_string)
+        if kid and kid not in self.jwks_provider.kids():
+            # Possibly a rotated key
+            self.jwks_provider.refresh()
+        token = super(Auth0JWTBearerTokenValidator, self).authenticate_token(token_string)
+        if token is not None and isinstance(token.get("exp"), (int, float)):
+            with self._cache_lock:
+                self._token_cache[key] = (token, token["exp"])
+                while len(self._token_cache) > self.cache_max_entries:
+                    self._token_cache.popitem(last=False)
+        return token